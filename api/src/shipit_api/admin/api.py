@@ -258,7 +258,7 @@ def update_release_status(name, body):
     logger.info("Status of %s changed to %s", release.name, status)
     if status == "shipped" and release.product_details_enabled:
         logger.info("Regenerating product details after marking %s as shipped", release.name)
-        _rebuild_product_details({})
+        _rebuild_product_details({"release": release.name, "product": release.product, "version": release.version})
 
     notify_via_matrix(release.product, f"Release {release.name} status changed to `{status}`.")
 
@@ -398,7 +398,7 @@ def update_product_channel_version(product, channel, body):
         version.current_version = body["version"]
         current_app.db.session.commit()
         logger.info(f"Regenerating product details after updating {version.product_name} {version.product_channel} version to {version.current_version}")
-        _rebuild_product_details({})
+        _rebuild_product_details({"product": product, "product_channel": channel, "version": version.current_version})
         notify_via_matrix(product, f"Updated {version.product_name} {version.product_channel} version to `{version.current_version}`.")
         return {
             "message": f"The version for {product} {channel} was updated successfully.",
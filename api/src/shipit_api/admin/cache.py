@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import logging
+import pathlib
+import sqlite3
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+
+class CacheStore:
+    """A store of JSON documents kept in a single SQLite database.
+
+    Entries are either permanent (the content behind an immutable key never
+    changes) or expire ``ttl`` seconds after they have been stored. When the
+    total size of the stored documents goes over ``max_size`` bytes, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path: pathlib.Path, max_size: int, ttl: float):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit, the store is only a cache and every write stands on its own
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        (self.size,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def __enter__(self) -> "CacheStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, key: str) -> typing.Optional[typing.Any]:
+        now = time.time()
+        row = self.connection.execute("SELECT value, size, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        value, size, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.size -= size
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self.connection.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: typing.Any, mutable: bool = False) -> None:
+        now = time.time()
+        content = json.dumps(value)
+        size = len(content.encode("utf-8"))
+        expires_at = now + self.ttl if mutable else None
+
+        row = self.connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.size -= row[0]
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, content, size, expires_at, now),
+        )
+        self.size += size
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the store fits in ``max_size``."""
+        evicted = []
+        for key, size in self.connection.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if self.size <= self.max_size:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.evicted += len(evicted)
+
+    def log_stats(self, name: str) -> None:
+        logger.info(
+            f"{name} cache: {self.hits} hits, {self.misses} misses ({self.expired} expired), "
+            f"{self.evicted} evicted, {self.size} bytes stored in {self.path}"
+        )
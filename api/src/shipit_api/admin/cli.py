@@ -4,10 +4,12 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import asyncio
+import cProfile
 import functools
 import io
 import json
 import os
+import pathlib
 import typing
 from datetime import datetime
 
@@ -20,9 +22,11 @@ import sqlalchemy
 import sqlalchemy.orm
 
 from backend_common.log import configure_logging
+from shipit_api.admin.compare import compare_product_details, parse_variant
 from shipit_api.admin.flask import flask_app
-from shipit_api.admin.product_details import rebuild
-from shipit_api.common.config import BREAKPOINT_VERSION
+from shipit_api.admin.product_details import backfill_release_l10n_changesets, rebuild, recompute_nightly_first_releases
+from shipit_api.admin.tooling import override_config
+from shipit_api.common.config import BREAKPOINT_VERSION, PRODUCT_DETAILS_JOBS
 from shipit_api.common.models import NightlyRelease, Release, Version
 
 
@@ -92,9 +96,29 @@ async def download_product_details(url: str, download_dir: str):
 )
 @click.option("--breakpoint-version", default=BREAKPOINT_VERSION, type=int)
 @click.option("--clean-working-copy", is_flag=True)
+@click.option(
+    "--report", type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path), help="Write the timings and counts of the rebuild to this JSON file"
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path),
+    help=(
+        "Profile the rebuild with cProfile and dump the stats to this file. With more than one job,"
+        " each process generating files dumps its own stats to this file suffixed with its pid"
+    ),
+)
+@click.option("--jobs", default=PRODUCT_DETAILS_JOBS, type=click.IntRange(min=1), help="Number of processes generating the files")
 @coroutine
 async def rebuild_product_details(
-    database_url: str, git_repo_url: str, folder_in_repo: str, channel: str, breakpoint_version: typing.Optional[int] = None, clean_working_copy: bool = False
+    database_url: str,
+    git_repo_url: str,
+    folder_in_repo: str,
+    channel: str,
+    breakpoint_version: typing.Optional[int] = None,
+    clean_working_copy: bool = False,
+    report: typing.Optional[pathlib.Path] = None,
+    profile: typing.Optional[pathlib.Path] = None,
+    jobs: int = PRODUCT_DETAILS_JOBS,
 ):
     configure_logging()
     if channel == "local":
@@ -102,10 +126,118 @@ async def rebuild_product_details(
     engine = sqlalchemy.create_engine(database_url)
     session = sqlalchemy.orm.sessionmaker(bind=engine)()
     click.echo("Product details are building ...")
-    await rebuild(session, channel, git_repo_url, folder_in_repo, breakpoint_version, clean_working_copy)
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        with override_config(PRODUCT_DETAILS_PROFILE=profile):
+            stats = await rebuild(session, channel, git_repo_url, folder_in_repo, breakpoint_version, clean_working_copy, jobs=jobs)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            click.echo(f"Profile written to {profile}")
+    if report:
+        stats.write_report(report)
+        click.echo(f"Report written to {report}")
     click.echo("Product details have been rebuilt")
 
 
+@click.command(name="compare-product-details")
+@click.option("--database-url", type=str, required=True, default="postgresql://127.0.0.1:9000/services")
+@click.option("--git-repo-url", type=str, required=True, default="https://github.com/mozilla-releng/product-details")
+@click.option("--folder-in-repo", type=str, required=True, default="public/")
+@click.option(
+    "--channel",
+    type=click.Choice(["main", "testing", "dev", "production"]),
+    required=True,
+    default=os.environ.get("DEPLOYMENT_BRANCH", "main"),
+)
+@click.option(
+    "-a",
+    "options_a",
+    multiple=True,
+    metavar="NAME=VALUE",
+    help="Breakpoint version, setting or setup function of the first variant, eg: breakpoint_version=120 or setup=module:function",
+)
+@click.option("-b", "options_b", multiple=True, metavar="NAME=VALUE", help="Breakpoint version, setting or setup function of the second variant")
+@click.option("--repeat", type=click.IntRange(min=1), default=2, show_default=True, help="Number of generations of each variant, in alternating order")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path), help="Write the comparison to this JSON file")
+@coroutine
+async def compare_product_details_variants(
+    database_url: str,
+    git_repo_url: str,
+    folder_in_repo: str,
+    channel: str,
+    options_a: typing.Tuple[str, ...],
+    options_b: typing.Tuple[str, ...],
+    repeat: int,
+    output: typing.Optional[pathlib.Path],
+):
+    """Generate product details with two variants, in alternating order, without
+    pushing them or writing to the database, and compare the results. Exits with
+    1 when the generated files differ."""
+    configure_logging()
+    try:
+        a, b = parse_variant(options_a), parse_variant(options_b)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    comparison = await compare_product_details(database_url, channel, git_repo_url, folder_in_repo, a, b, repeat)
+    if output:
+        output.write_text(json.dumps(comparison, indent=4))
+
+    for name, variant in comparison["variants"].items():
+        stats = variant["stats"]
+        click.echo(f"{name} {variant['options']}: {stats['wall']:.3f}s ({stats['cpu']:.3f}s CPU), peak RSS {stats['peak_rss']} bytes")
+    deltas = comparison["deltas"]
+    peak_rss = "unknown" if deltas["peak_rss"] is None else f"{deltas['peak_rss']:+} bytes"
+    click.echo(f"b - a: {deltas['wall']:+.3f}s ({deltas['cpu']:+.3f}s CPU), peak RSS {peak_rss}")
+    for stage, stage_deltas in deltas["stages"].items():
+        click.echo(f"  {stage}: {stage_deltas['wall']:+.3f}s ({stage_deltas['cpu']:+.3f}s CPU)")
+
+    files = comparison["files"]
+    click.echo(f"{files['identical']} identical files, {len(files['changed'])} changed, {len(files['added'])} added, {len(files['removed'])} removed")
+    for change in files["changed"]:
+        click.echo(
+            f"  changed {change['file']}: {change['size_a']} -> {change['size_b']} bytes, first difference at byte {change['first_difference']} "
+            f"(git diff {change['a']} {change['b']})"
+        )
+    for file_ in files["added"]:
+        click.echo(f"  added {file_}")
+    for file_ in files["removed"]:
+        click.echo(f"  removed {file_}")
+    if files["changed"] or files["added"] or files["removed"]:
+        raise click.exceptions.Exit(1)
+
+
+@click.command(name="backfill-release-l10n")
+@click.option("--database-url", type=str, required=True, default="postgresql://127.0.0.1:9000/services")
+@click.option("--breakpoint-version", default=BREAKPOINT_VERSION, type=int)
+@coroutine
+async def backfill_release_l10n(database_url: str, breakpoint_version: int):
+    """Store the l10n changesets of the shipped releases which don't have them stored yet."""
+    configure_logging()
+    engine = sqlalchemy.create_engine(database_url)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    stored = await backfill_release_l10n_changesets(session, breakpoint_version)
+    click.echo(f"Stored the l10n changesets of {stored} releases")
+
+
+@click.command(name="recompute-nightly-locales")
+@click.option("--database-url", type=str, required=True, default="postgresql://127.0.0.1:9000/services")
+@click.option("--product", default="firefox")
+@click.option("--channel", default="nightly")
+def recompute_nightly_locales(database_url: str, product: str, channel: str):
+    """Compute the first nightly build of each locale from all the nightly
+    builds, and store them to be updated by the rebuilds as nightly builds are
+    added."""
+    configure_logging()
+    engine = sqlalchemy.create_engine(database_url)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    locales = recompute_nightly_first_releases(session, product, channel)
+    click.echo(f"Stored the first {product} {channel} builds of {locales} locales")
+
+
 def get_taskcluster_headers(request_url, method, content, taskcluster_client_id, taskcluster_access_token):
     hawk = mohawk.Sender(
         {"id": taskcluster_client_id, "key": taskcluster_access_token, "algorithm": "sha256"}, request_url, method, content, content_type="application/json"
@@ -207,6 +339,10 @@ def shipit_import(api_from, limit_releases):
                     if len(nightlies) < 500:
                         break
 
+                # the nightly builds are imported newest first, the first release of
+                # their locales can only be computed once they all are
+                recompute_nightly_first_releases(session, product, channel)
+
         # Import Versions
         # only import the two entries we need to rebuild product details for now
         click.echo("Importing Version information...")
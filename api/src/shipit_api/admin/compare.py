@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compare the product details generated by two variants of a rebuild.
+
+A variant is a breakpoint version, settings of shipit_api.common.config which
+differ from the current ones, and/or a setup function which changes the code
+path the variant goes through (eg: replaces a generator with a new version).
+Each generation runs in its own process, from the same commit of the product
+details and the same state of the caches, in a database transaction which is
+rolled back, and nothing is pushed. The variants are generated in turns, in
+alternating order, so that the caches warmed up by the first one don't favor
+the second one. The generated blobs are written to the local mirror, so that
+the differences can be looked at with git.
+"""
+
+import ast
+import asyncio
+import concurrent.futures
+import importlib
+import logging
+import multiprocessing
+import pathlib
+import shutil
+import statistics
+import tempfile
+import typing
+import urllib.parse
+
+import sqlalchemy
+import sqlalchemy.orm
+
+import shipit_api.common.config
+from shipit_api.admin.product_details import File, RawFile, generate_product_details, git_blob_oid, read_git_blobs, setup_mirror, write_git_blobs
+from shipit_api.admin.stats import RebuildStats
+from shipit_api.admin.tooling import override_config
+
+logger = logging.getLogger(__name__)
+
+Variant = typing.Dict[str, typing.Any]
+
+# settings which may have been changed at runtime, the variants are generated
+# with the values of the process which compares them
+PROPAGATED_SETTINGS = ("PRODUCT_DETAILS_GIT_DIR", "PRODUCT_DETAILS_CACHE_DIR", "HG_PREFIX", "WHATTRAINISITNOW_PREFIX")
+
+
+def parse_variant(options: typing.Sequence[str]) -> Variant:
+    """Parse NAME=VALUE options, where NAME is either ``breakpoint_version``,
+    ``setup`` or a setting of shipit_api.common.config. VALUE is read as a Python
+    literal, or as a string if it isn't one. The value of ``setup`` is a
+    MODULE:FUNCTION called without arguments before generating the variant."""
+    variant = dict()
+    for option in options:
+        name, separator, value = option.partition("=")
+        if not separator:
+            raise ValueError(f"Expected NAME=VALUE, got {option}")
+        if name == "setup":
+            module_name, separator, function_name = value.partition(":")
+            if not (module_name and separator and function_name):
+                raise ValueError(f"Expected setup=MODULE:FUNCTION, got {option}")
+            variant[name] = value
+            continue
+        if name != "breakpoint_version" and not (name.isupper() and hasattr(shipit_api.common.config, name)):
+            raise ValueError(f"Unknown setting {name}")
+        try:
+            variant[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            variant[name] = value
+    return variant
+
+
+def generate_variant(
+    database_url: str, head: str, folder_in_repo: str, variant: Variant, settings: typing.Dict[str, typing.Any], raise_on_failure: bool
+) -> typing.Tuple[typing.Dict[File, str], typing.Dict[str, typing.Any]]:
+    """Generate the product details of a variant, write their blobs to the local
+    mirror and return their ids with the stats of the generation.
+
+    Whatever the generation writes to the database is rolled back, so that the
+    generations of the other variant start from the same data.
+    """
+    overrides = {name: value for name, value in variant.items() if name not in ("breakpoint_version", "setup")}
+    with override_config(**settings, **overrides):
+        if "setup" in variant:
+            module_name, _, function_name = variant["setup"].partition(":")
+            getattr(importlib.import_module(module_name), function_name)()
+        engine = sqlalchemy.create_engine(database_url)
+        connection = engine.connect()
+        transaction = connection.begin()
+        # commits only release a savepoint of the transaction
+        session = sqlalchemy.orm.Session(bind=connection, join_transaction_mode="create_savepoint")
+        git_dir = shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR
+        stats = RebuildStats()
+        try:
+            files, _ = asyncio.run(
+                generate_product_details(session, git_dir, head, folder_in_repo, variant.get("breakpoint_version"), None, raise_on_failure, stats)
+            )
+        finally:
+            session.close()
+            transaction.rollback()
+            connection.close()
+            engine.dispose()
+        summary = stats.summary()
+
+        write_git_blobs(git_dir, [content for content in files.values() if not isinstance(content, RawFile)])
+        oids = {file_: content.oid if isinstance(content, RawFile) else git_blob_oid(content) for file_, content in files.items()}
+    return oids, summary
+
+
+def diff_trees(git_dir: pathlib.Path, a: typing.Dict[File, str], b: typing.Dict[File, str]) -> typing.Dict[str, typing.Any]:
+    """Compare two generated trees file by file. Changed files come with the size
+    of both versions and the offset of the first byte which differs."""
+    changed_files = sorted(file_ for file_ in a.keys() & b.keys() if a[file_] != b[file_])
+    blobs = read_git_blobs(git_dir, [oid for file_ in changed_files for oid in (a[file_], b[file_])])
+    changed = []
+    for file_, content_a, content_b in zip(changed_files, blobs[::2], blobs[1::2]):
+        first_difference = next(
+            (offset for offset, (byte_a, byte_b) in enumerate(zip(content_a, content_b)) if byte_a != byte_b), min(len(content_a), len(content_b))
+        )
+        changed.append({"file": file_, "a": a[file_], "b": b[file_], "size_a": len(content_a), "size_b": len(content_b), "first_difference": first_difference})
+    return {
+        "identical": len(a.keys() & b.keys()) - len(changed),
+        "changed": changed,
+        "added": sorted(b.keys() - a.keys()),
+        "removed": sorted(a.keys() - b.keys()),
+    }
+
+
+def get_median_stats(runs: typing.List[typing.Dict[str, typing.Any]]) -> typing.Dict[str, typing.Any]:
+    """The median timings of several generations of a variant, with the counts
+    and gauges of the first one. Only the stages all of them went through are
+    kept."""
+    peak_rss = [run["peak_rss"] for run in runs if run["peak_rss"] is not None]
+    return {
+        "wall": round(statistics.median(run["wall"] for run in runs), 6),
+        "cpu": round(statistics.median(run["cpu"] for run in runs), 6),
+        "peak_rss": statistics.median_high(peak_rss) if len(peak_rss) == len(runs) else None,
+        "stages": {
+            stage: {key: round(statistics.median(run["stages"][stage][key] for run in runs), 6) for key in ("wall", "cpu")}
+            for stage in runs[0]["stages"]
+            if all(stage in run["stages"] for run in runs)
+        },
+        "counts": runs[0]["counts"],
+        "gauges": runs[0]["gauges"],
+    }
+
+
+def get_deltas(a: typing.Dict[str, typing.Any], b: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    """The differences between the stats of two generations, b minus a."""
+    deltas = {key: round(b[key] - a[key], 6) for key in ("wall", "cpu")}
+    deltas["peak_rss"] = b["peak_rss"] - a["peak_rss"] if a["peak_rss"] is not None and b["peak_rss"] is not None else None
+    deltas["stages"] = {
+        stage: {key: round(b["stages"][stage][key] - a["stages"][stage][key], 6) for key in ("wall", "cpu")} for stage in a["stages"] if stage in b["stages"]
+    }
+    return deltas
+
+
+async def compare_product_details(
+    database_url: str, git_branch: str, git_repo_url: str, folder_in_repo: str, a: Variant, b: Variant, repeat: int = 2
+) -> typing.Dict[str, typing.Any]:
+    """Generate the product details of `git_branch` with the variants `a` and `b`
+    `repeat` times each, and compare them. The stats of the variants are the
+    medians of their generations."""
+    secrets = [urllib.parse.urlparse(git_repo_url).password]
+    git_dir = shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR
+    cache_dir = shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR
+    head = setup_mirror(git_branch, git_repo_url, secrets)
+    raise_on_failure = git_branch in ["production", "staging"]
+
+    oids: typing.Dict[str, typing.Dict[File, str]] = dict()
+    runs: typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]] = {"a": [], "b": []}
+    loop = asyncio.get_running_loop()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for turn in range(repeat):
+            # a, b, then b, a: each variant runs first as often as the other one
+            for name, variant in (("a", a), ("b", b)) if turn % 2 == 0 else (("b", b), ("a", a)):
+                logger.info(f"Generating product details at {head} with variant {name} ({turn + 1}/{repeat}): {variant}")
+                # all the generations start from the same caches, and get a
+                # process of their own so that their peak memory usage can be
+                # told apart
+                settings = {setting: getattr(shipit_api.common.config, setting) for setting in PROPAGATED_SETTINGS}
+                settings["PRODUCT_DETAILS_CACHE_DIR"] = pathlib.Path(tmp_dir, f"{name}{turn}")
+                if cache_dir.exists():
+                    shutil.copytree(cache_dir, settings["PRODUCT_DETAILS_CACHE_DIR"])
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    variant_oids, summary = await loop.run_in_executor(
+                        executor, generate_variant, database_url, head, folder_in_repo, variant, settings, raise_on_failure
+                    )
+                if oids.setdefault(name, variant_oids) != variant_oids:
+                    logger.warning(f"Variant {name} generated different product details at turn {turn + 1}")
+                runs[name].append(summary)
+
+    stats_a, stats_b = get_median_stats(runs["a"]), get_median_stats(runs["b"])
+    return {
+        "head": head,
+        "variants": {"a": {"options": a, "stats": stats_a, "runs": runs["a"]}, "b": {"options": b, "stats": stats_b, "runs": runs["b"]}},
+        "deltas": get_deltas(stats_a, stats_b),
+        "files": diff_trees(git_dir, oids["a"], oids["b"]),
+    }
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import asyncio
+import collections
+import contextlib
+import logging
+import statistics
+import time
+import typing
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+def is_congestion(exception: BaseException) -> bool:
+    """Whether a failed request means that the server is overloaded."""
+    if isinstance(exception, asyncio.TimeoutError):
+        return True
+    if isinstance(exception, aiohttp.ClientResponseError):
+        return exception.status == 429 or exception.status >= 500
+    return isinstance(exception, aiohttp.ServerConnectionError)
+
+
+class FetchScheduler:
+    """Limit the number of concurrent requests to a server.
+
+    The number of requests allowed in flight (the window) grows by one for
+    every window worth of successful requests, and is halved when the server
+    looks overloaded (429 and 5xx responses, timeouts). Congestion signals
+    received within ``cooldown`` seconds of the last decrease are ignored, so
+    that the requests which were in flight at the same time only count once.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, cooldown: float = 1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.window = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.latencies: typing.List[float] = []
+        self.congestions = 0
+        self._last_decrease = -cooldown
+        # requests waiting for a slot, in the order they arrived. A slot is
+        # handed over by resolving the future, so that releasing a slot wakes a
+        # single waiter, whatever the number of queued requests
+        self._waiters: typing.Deque[asyncio.Future] = collections.deque()
+
+    @contextlib.asynccontextmanager
+    async def request(self) -> typing.AsyncIterator[None]:
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            if is_congestion(e):
+                self.decrease()
+            raise
+        else:
+            self.increase()
+        finally:
+            self.latencies.append(time.monotonic() - start)
+            self.release()
+
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < int(self.window):
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over right before the cancellation
+                self.release()
+            elif waiter in self._waiters:
+                # release() drops the waiters cancelled before they resumed
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.window):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def increase(self) -> None:
+        self.window = min(self.window + 1 / self.window, float(self.maximum))
+
+    def decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.congestions += 1
+        self.window = max(self.window / 2, float(self.minimum))
+
+    def log_stats(self, name: str) -> None:
+        if len(self.latencies) < 2:
+            logger.info(f"{name}: {len(self.latencies)} requests")
+            return
+        percentiles = statistics.quantiles(self.latencies, n=100, method="inclusive")
+        logger.info(
+            f"{name}: {len(self.latencies)} requests, latency p50={percentiles[49]:.3f}s p90={percentiles[89]:.3f}s "
+            f"p99={percentiles[98]:.3f}s max={max(self.latencies):.3f}s, "
+            f"window shrunk {self.congestions} times, final window {int(self.window)}"
+        )
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import re
+import typing
+
+import orjson
+
+# orjson and the stdlib disagree on the floats which the stdlib writes with an
+# exponent (below 1e-4 and from 1e16 on), orjson writes them either with an
+# exponent too or with at least 4 zeros after the decimal point
+ORJSON_EXPONENT = re.compile(rb"e[-+]?[0-9]+(?:,?\n|\Z)")
+NOT_ASCII = re.compile(rb"[\x7f-\xff]+")
+FINITE_ENCODER = json.JSONEncoder(check_circular=False, allow_nan=False)
+
+
+class JSONWriter(typing.Protocol):
+    def dumps(self, content: typing.Any, sort_keys: bool) -> bytes:
+        """Encode `content` as UTF-8, byte for byte the same as
+        ``json.dumps(content, sort_keys=sort_keys, indent=4, allow_nan=False)``.
+
+        NaN and infinite floats are not valid JSON, they raise a ValueError.
+        """
+
+
+class StdlibJSONWriter:
+    def dumps(self, content: typing.Any, sort_keys: bool) -> bytes:
+        return json.dumps(content, sort_keys=sort_keys, indent=4, allow_nan=False).encode("utf-8")
+
+
+class OrjsonJSONWriter:
+    """Encode with orjson, then rewrite what it does differently from the
+    stdlib: 2 spaces indentation and non ASCII characters which are not
+    escaped. The content orjson can't encode the same way (non string keys,
+    integers over 64 bits, some floats) is handed to the stdlib writer."""
+
+    def __init__(self) -> None:
+        self.fallback = StdlibJSONWriter()
+
+    def dumps(self, content: typing.Any, sort_keys: bool) -> bytes:
+        try:
+            data = orjson.dumps(content, option=orjson.OPT_INDENT_2 | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+        except orjson.JSONEncodeError:
+            return self.fallback.dumps(content, sort_keys)
+        if b"0.0000" in data or ORJSON_EXPONENT.search(data):
+            return self.fallback.dumps(content, sort_keys)
+        # orjson writes NaN and infinite floats as null instead of failing
+        if b"null" in data:
+            check_finite(content)
+
+        data = double_indent(data)
+        if not data.isascii() or b"\x7f" in data:
+            data = NOT_ASCII.sub(lambda match: json.dumps(match.group(0).decode("utf-8"))[1:-1].encode("ascii"), data)
+        return data
+
+
+def check_finite(content: typing.Any) -> None:
+    """Raise the ValueError of the stdlib writer if `content` contains a NaN
+    or an infinite float.
+
+    Without indentation the stdlib encoder is implemented in C, which makes it
+    a lot faster than walking `content` in Python.
+    """
+    FINITE_ENCODER.encode(content)
+
+
+def double_indent(data: bytes) -> bytes:
+    """Turn 2 spaces indentation into 4 spaces indentation.
+
+    Strings can't contain raw newlines or control characters, so all the
+    spaces after a newline are indentation, and \\x01 can stand for one level
+    of indentation which has been rewritten already. Replacing the deepest
+    levels first keeps this to a few passes over the data.
+    """
+    depth = 0
+    while b"\n" + b"  " * (depth + 1) in data:
+        depth += 1
+    for level in range(depth, 0, -1):
+        data = data.replace(b"\n" + b"  " * level, b"\n" + b"\x01" * level)
+    return data.replace(b"\x01", b"    ")
+
+
+JSON_WRITERS: typing.Dict[str, typing.Callable[[], JSONWriter]] = {"stdlib": StdlibJSONWriter, "orjson": OrjsonJSONWriter}
+
+
+def get_json_writer(name: typing.Optional[str] = None) -> JSONWriter:
+    """Return the writer called `name`, or the fastest one."""
+    if name is None:
+        name = "orjson"
+    if name not in JSON_WRITERS:
+        raise ValueError(f"Unknown JSON writer {name}, available writers: {', '.join(sorted(JSON_WRITERS))}")
+    return JSON_WRITERS[name]()
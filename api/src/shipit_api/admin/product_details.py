@@ -5,16 +5,29 @@
 
 import asyncio
 import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import dataclasses
 import functools
 import hashlib
+import inspect
 import io
 import itertools
 import json
 import logging
+import math
+import multiprocessing
+import multiprocessing.util
+import operator
 import os
 import pathlib
+import pickle
 import re
 import shutil
+import subprocess
+import tempfile
+import time
 import typing
 import urllib.parse
 from datetime import datetime, timedelta, timezone
@@ -27,20 +40,25 @@ import click
 import sqlalchemy
 import sqlalchemy.orm
 from deepmerge import merge_or_raise
-from mozilla_version.gecko import FirefoxVersion
-from mozilla_version.mobile import MobileVersion
+from mozilla_version.gecko import FirefoxVersion, GeckoVersion
 
 import cli_common.command
 import cli_common.utils
 import shipit_api.common.config
 import shipit_api.common.models
+from shipit_api.admin.cache import CacheStore
+from shipit_api.admin.fetch import FetchScheduler
+from shipit_api.admin.json_writer import JSONWriter, get_json_writer
 from shipit_api.admin.release import parse_version
+from shipit_api.admin.stats import RebuildStats
 from shipit_api.common.product import Product, ProductCategory
 
 logger = logging.getLogger(__name__)
 
 AURORA_FIRST_VERSION = "54.0b11"
 NIGHTLY_RELEASES_BATCH_SIZE = 1000
+# Bump when the structure of the parsed product details changes
+OLD_PRODUCT_DETAILS_SNAPSHOT_VERSION = 3
 
 File = str
 ReleaseDetails = TypedDict(
@@ -113,6 +131,7 @@ ThunderbirdVersions = TypedDict(
     },
 )
 FirstRelease = TypedDict("FirstRelease", {"version": typing.Required[str], "buildid": str, "build_number": int}, total=False)
+FirstReleases = typing.Dict[str, FirstRelease]
 LocaleFirstReleases = TypedDict("LocaleFirstReleases", {"first_release": typing.Dict[str, FirstRelease]})
 FirefoxLocales = typing.Dict[str, LocaleFirstReleases]
 IndexListing = str
@@ -134,6 +153,51 @@ ProductDetails = typing.Dict[
     ],
 ]
 Products = typing.List[Product]
+RebuildTrigger = TypedDict("RebuildTrigger", {"release": str, "product": str, "version": str, "product_channel": str}, total=False)
+
+# Inputs each generated file depends on. An input is either a product (any
+# release of that product), a product category of a product ("firefox:major")
+# or the nightly version of a product ("nightly:firefox"). Files without any
+# inputs only change with the configuration or with the data already present
+# in product details. Files missing from this mapping (l10n/*.json, regions/*.json
+# and index.html files) are always generated.
+PRODUCT_DETAILS_DEPENDENCIES: typing.Dict[File, typing.Set[str]] = {
+    "all.json": {"devedition", "firefox", "fenix", "fennec", "thunderbird"},
+    "devedition.json": {"devedition"},
+    "firefox.json": {"firefox"},
+    "firefox_history_development_releases.json": {"firefox:dev"},
+    "firefox_history_major_releases.json": {"firefox:major"},
+    "firefox_history_stability_releases.json": {"firefox:stability"},
+    "firefox_primary_builds.json": {"firefox", "devedition", "nightly:firefox"},
+    "firefox_versions.json": {"firefox", "devedition", "nightly:firefox"},
+    "firefox_history_locales.json": {"firefox", "nightly:firefox"},
+    "languages.json": set(),
+    "mobile_android.json": {"fennec", "fenix", "firefox-android"},
+    "mobile_details.json": {"firefox-android", "nightly:firefox"},
+    "mobile_history_development_releases.json": {"fennec:dev"},
+    "mobile_history_major_releases.json": {"fennec:major"},
+    "mobile_history_stability_releases.json": {"fennec:stability"},
+    "mobile_versions.json": {"firefox-android", "nightly:firefox"},
+    "thunderbird.json": {"thunderbird"},
+    "thunderbird_beta_builds.json": set(),
+    "thunderbird_history_development_releases.json": {"thunderbird:dev"},
+    "thunderbird_history_major_releases.json": {"thunderbird:major"},
+    "thunderbird_history_stability_releases.json": {"thunderbird:stability"},
+    "thunderbird_primary_builds.json": {"thunderbird", "nightly:thunderbird"},
+    "thunderbird_versions.json": {"thunderbird", "nightly:thunderbird"},
+}
+
+# Files which also depend on data no trigger reports, they are generated again
+# by every rebuild:
+# - the nightly builds, added without triggering a rebuild, and their l10n
+#   changesets, fetched at the head of the nightly branches;
+# - the release schedules of whattrainisitnow.com, which change with time.
+PRODUCT_DETAILS_ALWAYS_GENERATED: typing.Set[File] = {
+    "firefox_history_locales.json",
+    "firefox_primary_builds.json",
+    "firefox_versions.json",
+    "thunderbird_primary_builds.json",
+}
 
 A = typing.TypeVar("A")
 B = typing.TypeVar("B")
@@ -222,29 +286,75 @@ def create_index_listing_html(folder: pathlib.Path, items: typing.Set[pathlib.Pa
         return html.getvalue()
 
 
-def create_index_listing(product_details: ProductDetails) -> ProductDetails:
-    new_product_details: ProductDetails = dict()
-    folders: typing.Dict[pathlib.Path, typing.List[pathlib.Path]] = dict()
+def get_folder_tree(files: typing.Iterable[File]) -> typing.Dict[str, typing.Set[str]]:
+    """Return the names of the items (files and subfolders) in every folder
+    of `files`, the root folder being ""."""
+    tree: typing.Dict[str, typing.Set[str]] = dict()
+    for file_ in files:
+        folder, _, name = file_.rpartition("/")
+        while True:
+            children = tree.setdefault(folder, set())
+            if name in children:
+                # a subfolder which is already known, so are all its parents
+                break
+            children.add(name)
+            if not folder:
+                break
+            folder, _, name = folder.rpartition("/")
+    return tree
+
+
+def create_index_listing(product_details: ProductDetails, old_files: typing.Optional[typing.Dict[File, str]] = None) -> ProductDetails:
+    """Add an index.html page to every folder.
+
+    `old_files` are the blob ids of the files in the previous product details.
+    The pages of the folders whose items didn't change since then are passed
+    through instead of being rendered again.
+    """
+    new_product_details: ProductDetails = dict(product_details)
+    old_tree = get_folder_tree(file_ for file_ in (old_files or {}) if file_.rpartition("/")[2] != "index.html")
+
+    rendered = 0
+    for folder, items in get_folder_tree(product_details).items():
+        index = f"{folder}/index.html" if folder else "index.html"
+        if old_files is not None and index in old_files and old_tree.get(folder) == items:
+            new_product_details[index] = RawFile(old_files[index])
+            continue
+        folder_path = pathlib.Path(folder)
+        new_product_details[index] = create_index_listing_html(folder_path, {folder_path / item for item in items})
+        rendered += 1
+    logger.info(f"Rendered {rendered} index pages")
 
-    for file_, content in product_details.items():
-        new_product_details[file_] = content
+    return new_product_details
 
-        path = pathlib.Path(file_)
-        for folder in list(path.parents):
-            folders.setdefault(folder, [])
-            folders[folder].append(path)
-            path = folder
 
-    for folder, items in folders.items():
-        new_product_details[str(folder / "index.html")] = create_index_listing_html(folder, set(items))
+def is_immutable_revision(revision: str) -> bool:
+    """Whether `revision` is a (short or full) changeset hash, as opposed to a
+    branch, bookmark or tag name."""
+    return re.fullmatch(r"[0-9a-f]{12,40}", revision) is not None
 
-    return new_product_details
 
+def open_l10n_cache() -> CacheStore:
+    # the l10n changesets used to be cached in one file per URL
+    shutil.rmtree(shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR / "fetch_l10n_data", ignore_errors=True)
+    return CacheStore(
+        shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR / "fetch_l10n_data.sqlite",
+        max_size=shipit_api.common.config.PRODUCT_DETAILS_L10N_CACHE_MAX_SIZE,
+        ttl=shipit_api.common.config.PRODUCT_DETAILS_L10N_CACHE_TTL,
+    )
 
-@backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError), max_time=60)
-async def fetch_l10n_data(
-    session: aiohttp.ClientSession, release: shipit_api.common.models.Release, raise_on_failure: bool, use_cache: bool = True
-) -> typing.Tuple[shipit_api.common.models.Release, typing.Optional[ReleaseL10ns]]:
+
+def open_release_schedule_cache() -> CacheStore:
+    return CacheStore(
+        shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR / "release_schedule.sqlite",
+        max_size=shipit_api.common.config.PRODUCT_DETAILS_SCHEDULE_CACHE_MAX_SIZE,
+        ttl=shipit_api.common.config.PRODUCT_DETAILS_SCHEDULE_CACHE_TTL,
+    )
+
+
+def get_l10n_changesets_path(release: shipit_api.common.models.Release) -> typing.Optional[str]:
+    """Path of the file listing the l10n changesets of a release in its repository,
+    None if the release doesn't have one."""
     # Fenix and some thunderbird on the betas don't have l10n in the repository
     if (
         Product(release.product) is Product.THUNDERBIRD
@@ -259,72 +369,285 @@ async def fetch_l10n_data(
         Product.FIREFOX_IOS,
         Product.FOCUS_IOS,
     ):
-        return (release, None)
+        return None
 
-    url_file = {
+    return {
         Product.FIREFOX: "browser/locales/l10n-changesets.json",
         Product.DEVEDITION: "browser/locales/l10n-changesets.json",
         Product.THUNDERBIRD: "mail/locales/l10n-changesets.json",
     }[Product(release.product)]
-    url = f"{shipit_api.common.config.HG_PREFIX}/{release.branch}/raw-file/{release.revision}/{url_file}"
 
-    cache_dir = shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR / "fetch_l10n_data"
-    cache = cache_dir / hashlib.sha256(url.encode("utf-8")).hexdigest()
-    if use_cache:
-        os.makedirs(cache_dir, exist_ok=True)
-        if cache.exists():
+
+async def fetch_json(session: aiohttp.ClientSession, url: str, scheduler: typing.Optional[FetchScheduler] = None) -> typing.Any:
+    # the scheduler slot is released before backing off, retries wait for a new one
+    async with scheduler.request() if scheduler is not None else contextlib.nullcontext():
+        async with session.get(url) as response:
+            response.raise_for_status()
+            logger.debug(f"Fetched {url}")
+            return await response.json()
+
+
+@backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError), max_time=60)
+async def fetch_l10n_data(
+    session: aiohttp.ClientSession,
+    release: shipit_api.common.models.Release,
+    raise_on_failure: bool,
+    cache: typing.Optional[CacheStore] = None,
+    scheduler: typing.Optional[FetchScheduler] = None,
+    revision: typing.Optional[str] = None,
+) -> typing.Tuple[shipit_api.common.models.Release, typing.Optional[ReleaseL10ns]]:
+    """Fetch the l10n changesets of a release. The file is fetched at `revision`
+    instead of the release revision if given, see `fetch_releases_l10n`."""
+    url_file = get_l10n_changesets_path(release)
+    if url_file is None:
+        return (release, None)
+
+    revision = revision or release.revision
+    url = f"{shipit_api.common.config.HG_PREFIX}/{release.branch}/raw-file/{revision}/{url_file}"
+
+    if cache is not None:
+        changesets = cache.get(url)
+        if changesets is not None:
             logger.debug(f"Cache hit for {url}")
-            with cache.open() as f:
-                changesets = json.load(f)
             return (release, changesets)
 
     logger.debug(f"Fetching {url}")
     changesets = dict()
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            logger.debug(f"Fetched {url}")
-            changesets = await response.json()
-            if use_cache:
-                with cache.open("w+") as f:
-                    f.write(json.dumps(changesets))
+        changesets = await fetch_json(session, url, scheduler)
+        if cache is not None:
+            # the content behind a branch name (eg: "default") changes over time
+            cache.set(url, changesets, mutable=not is_immutable_revision(revision))
     except Exception:
-        logger.info("Failed to fetch %s, %s", url, release.json)
+        logger.info("Failed to fetch %s for %s", url, release.name)
         if raise_on_failure:
             raise
 
     return (release, changesets)
 
 
-def get_old_product_details(directory: str) -> ProductDetails:
-    if not os.path.isdir(directory):
-        return dict()
+async def fetch_file_revisions(
+    session: aiohttp.ClientSession,
+    branch: str,
+    path: str,
+    revisions: typing.Iterable[str],
+    scheduler: typing.Optional[FetchScheduler] = None,
+) -> typing.Dict[str, str]:
+    """Map revisions of a branch to the changeset which introduced the version of
+    `path` they contain. Revisions at which `path` has the same content map to
+    the same changeset.
+
+    The last PRODUCT_DETAILS_L10N_DEDUPE_REVCOUNT changesets of the branch are
+    walked from the oldest one, each changeset either modifies `path` (it is
+    part of the filelog) or inherits the file from its parents. Revisions which
+    can't be mapped (too old, or merges of parents with different versions of
+    the file) are left out.
+    """
+    prefix = f"{shipit_api.common.config.HG_PREFIX}/{branch}"
+    revcount = shipit_api.common.config.PRODUCT_DETAILS_L10N_DEDUPE_REVCOUNT
+    filelog = await fetch_json(session, f"{prefix}/json-filelog/tip/{path}?revcount={revcount}", scheduler)
+    changelog = await fetch_json(session, f"{prefix}/json-log/tip?revcount={revcount}", scheduler)
+
+    modified = {entry["node"] for entry in filelog["entries"]}
+    file_revisions: typing.Dict[str, typing.Optional[str]] = {}
+    for changeset in reversed(changelog["changesets"]):
+        node = changeset["node"]
+        if node in modified:
+            file_revisions[node] = node
+            continue
+        parents = {file_revisions.get(parent) for parent in changeset["parents"]}
+        file_revisions[node] = parents.pop() if len(parents) == 1 else None
+
+    # release revisions are usually short hashes
+    by_short_node = {node[:12]: file_revision for node, file_revision in file_revisions.items() if file_revision is not None}
+    result = {}
+    for revision in revisions:
+        file_revision = by_short_node.get(revision[:12])
+        if file_revision is not None:
+            result[revision] = file_revision
+    return result
 
-    data = dict()
-    for root_, _, files in os.walk(directory):
-        root = pathlib.Path(root_)
-        for file__ in files:
-            if not file__.endswith(".json"):
-                continue
-            file_ = root / file__
-            with file_.open() as f:
-                data[str(file_.relative_to(directory))] = json.load(f)
 
-    return data
+async def fetch_releases_l10n(
+    session: aiohttp.ClientSession,
+    releases: typing.List[shipit_api.common.models.Release],
+    raise_on_failure: bool,
+    cache: typing.Optional[CacheStore] = None,
+    scheduler: typing.Optional[FetchScheduler] = None,
+    dedupe: bool = False,
+) -> typing.List[typing.Tuple[shipit_api.common.models.Release, typing.Optional[ReleaseL10ns]]]:
+    """Fetch the l10n changesets of releases.
+
+    Many releases of a branch share the same l10n changesets file. When
+    `dedupe` is set, the file is fetched once per changeset which modified it
+    (see `fetch_file_revisions`) and shared between the releases. The releases
+    which can't be mapped that way are fetched at their own revision.
+    """
+    if not dedupe:
+        return await asyncio.gather(*[fetch_l10n_data(session, release, raise_on_failure, cache, scheduler) for release in releases])
+
+    branches: typing.Dict[typing.Tuple[str, str], typing.Set[str]] = {}
+    for release in releases:
+        path = get_l10n_changesets_path(release)
+        if path is not None and is_immutable_revision(release.revision):
+            branches.setdefault((release.branch, path), set()).add(release.revision)
+
+    async def fetch_branch(branch: str, path: str, revisions: typing.Set[str]) -> typing.Dict[str, str]:
+        try:
+            return await fetch_file_revisions(session, branch, path, revisions, scheduler)
+        except Exception:
+            logger.info(f"Failed to map the {path} revisions of {branch}, fetching them one by one", exc_info=True)
+            return {}
+
+    file_revisions = dict(
+        zip(branches.keys(), await asyncio.gather(*[fetch_branch(branch, path, revisions) for (branch, path), revisions in branches.items()]))
+    )
+
+    fetches: typing.Dict[typing.Tuple[str, str], asyncio.Future] = {}
+
+    async def fetch(release: shipit_api.common.models.Release) -> typing.Tuple[shipit_api.common.models.Release, typing.Optional[ReleaseL10ns]]:
+        path = get_l10n_changesets_path(release)
+        file_revision = file_revisions.get((release.branch, path), {}).get(release.revision) if path is not None else None
+        if file_revision is None:
+            return await fetch_l10n_data(session, release, raise_on_failure, cache, scheduler)
+
+        key = (release.branch, file_revision)
+        if key not in fetches:
+            fetches[key] = asyncio.ensure_future(fetch_l10n_data(session, release, raise_on_failure, cache, scheduler, revision=file_revision))
+        _, changesets = await fetches[key]
+        return (release, changesets)
+
+    results = await asyncio.gather(*[fetch(release) for release in releases])
+    logger.info(f"Fetched the l10n changesets of {len(releases)} releases, {len(fetches)} distinct file revisions")
+    return results
+
+
+def create_hg_session() -> aiohttp.ClientSession:
+    # use limit_per_host=50 since hg.mozilla.org doesn't like too many connections
+    headers = {"User-Agent": "ship-it"}
+    return aiohttp.ClientSession(headers=headers, connector=aiohttp.TCPConnector(limit_per_host=50), timeout=aiohttp.ClientTimeout(total=30))
+
+
+def create_fetch_scheduler() -> FetchScheduler:
+    return FetchScheduler(
+        initial=shipit_api.common.config.PRODUCT_DETAILS_FETCH_CONCURRENCY_INITIAL,
+        maximum=shipit_api.common.config.PRODUCT_DETAILS_FETCH_CONCURRENCY_MAX,
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class RawFile:
+    """A file of the previous product details which is published again as it
+    is, without being parsed or rewritten. The file is referenced by the id of
+    its git blob. The l10n files keep their list of locales, which is all the
+    generators need from them."""
+
+    oid: str
+    locales: typing.Optional[typing.Tuple[str, ...]] = None
+
+
+def make_old_product_details_entry(oid: str, file_: File, load: typing.Callable[[], typing.Any]) -> typing.Any:
+    """Parse a file of the previous product details, unless it can be passed through."""
+    if file_.startswith("1.0/regions/"):
+        return RawFile(oid)
+    content = load()
+    if file_.startswith("1.0/l10n/"):
+        return RawFile(oid, tuple(content["locales"]))
+    return content
+
+
+def get_old_l10n_locales(old_product_details: ProductDetails, file_: File) -> typing.Optional[typing.Sequence[str]]:
+    """Return the locales listed in an l10n file of the previous product details."""
+    content = old_product_details.get(file_)
+    if content is None:
+        return None
+    if isinstance(content, RawFile):
+        return content.locales
+    return list(content["locales"])
+
+
+def get_old_product_details(git_dir: pathlib.Path, commit: str, folder_in_repo: str) -> ProductDetails:
+    files = {file_: oid for file_, oid in list_git_files(git_dir, commit, folder_in_repo).items() if file_.endswith(".json")}
+    # only the blobs of the files which are parsed are read
+    to_read = [(file_, oid) for file_, oid in files.items() if not file_.startswith("1.0/regions/")]
+    blobs = dict(zip((oid for _, oid in to_read), read_git_blobs(git_dir, [oid for _, oid in to_read])))
+    return {file_: make_old_product_details_entry(oid, file_, lambda: json.loads(blobs[oid])) for file_, oid in files.items()}
+
+
+def get_old_product_details_snapshot_path() -> pathlib.Path:
+    return shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR / "old_product_details.pickle"
+
+
+def load_old_product_details_snapshot(commit: str, folder_in_repo: str) -> typing.Optional[ProductDetails]:
+    """Load the product details snapshot taken at `commit`, if there is one."""
+    path = get_old_product_details_snapshot_path()
+    try:
+        with path.open("rb") as f:
+            # the header is unpickled on its own, to not load a stale snapshot
+            if pickle.load(f) != (OLD_PRODUCT_DETAILS_SNAPSHOT_VERSION, commit, folder_in_repo):
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning(f"Ignoring unreadable product details snapshot {path}", exc_info=True)
+        return None
+
+
+def save_old_product_details_snapshot(commit: str, folder_in_repo: str, product_details: ProductDetails) -> None:
+    path = get_old_product_details_snapshot_path()
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("wb") as f:
+        pickle.dump((OLD_PRODUCT_DETAILS_SNAPSHOT_VERSION, commit, folder_in_repo), f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(product_details, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_old_product_details(git_dir: pathlib.Path, commit: str, folder_in_repo: str) -> ProductDetails:
+    """Same as `get_old_product_details`, but use the snapshot of the parsed
+    files when it was taken at the same commit of the product details repository."""
+    old_product_details = load_old_product_details_snapshot(commit, folder_in_repo)
+    if old_product_details is not None:
+        logger.info(f"Loaded product details at {commit} from the snapshot")
+        return old_product_details
+
+    old_product_details = get_old_product_details(git_dir, commit, folder_in_repo)
+    save_old_product_details_snapshot(commit, folder_in_repo, old_product_details)
+    return old_product_details
+
+
+class ReleaseRecord:
+    """The columns of a release product details are built from. Loading them
+    instead of Release objects skips the ORM bookkeeping and the phases."""
+
+    __slots__ = ("id", "name", "product", "version", "branch", "revision", "build_number", "status", "created", "completed")
+
+    def __init__(self, id, name, product, version, branch, revision, build_number, status, created, completed):
+        self.id = id
+        self.name = name
+        self.product = product
+        self.version = version
+        self.branch = branch
+        self.revision = revision
+        self.build_number = build_number
+        self.status = status
+        self.created = created
+        self.completed = completed
 
 
 def get_releases_from_db(db_session: sqlalchemy.orm.Session, breakpoint_version: int) -> typing.List[shipit_api.common.models.Release]:
     """
-    SELECT *
+    SELECT id, name, product, version, ...
     FROM shipit_api_releases as r
-    WHERE cast(split_part(r.version, '.', 1) as int) > 20;
+    WHERE r.status = 'shipped' AND r.major_version >= 20;
     """
     Release = shipit_api.common.models.Release
-    query = db_session.query(Release)
-    # Using cast and split_part is postgresql specific
+    query = db_session.query(*[getattr(Release, column) for column in ReleaseRecord.__slots__])
     query = query.filter(Release.status == "shipped")
-    query = query.filter(sqlalchemy.cast(sqlalchemy.func.split_part(Release.version, ".", 1), sqlalchemy.Integer) >= breakpoint_version)
-    return query.all()
+    query = query.filter(Release.major_version >= breakpoint_version)
+    # the records stand in for the releases they were read from
+    return typing.cast(typing.List[shipit_api.common.models.Release], [ReleaseRecord(*row) for row in query])
 
 
 def get_nightly_releases_from_db(db_session: sqlalchemy.orm.Session, product: str, channel: str) -> typing.Iterator[shipit_api.common.models.NightlyRelease]:
@@ -346,7 +669,153 @@ def get_product_channel_version(db_session: sqlalchemy.orm.Session, product: str
     return version.current_version
 
 
-def get_product_categories(product: Product, version: str) -> typing.List[ProductCategory]:
+def get_releases_l10n_from_db(
+    db_session: sqlalchemy.orm.Session, releases: typing.List[shipit_api.common.models.Release]
+) -> typing.Dict[shipit_api.common.models.Release, ReleaseL10ns]:
+    """Return the l10n changesets stored for the given releases, in a single query."""
+    ReleaseL10nChangesets = shipit_api.common.models.ReleaseL10nChangesets
+    releases_by_id = {release.id: release for release in releases if release.id is not None}
+    if not releases_by_id:
+        return {}
+    query = db_session.query(ReleaseL10nChangesets.release_id, ReleaseL10nChangesets.changesets)
+    query = query.filter(ReleaseL10nChangesets.release_id.in_(releases_by_id.keys()))
+    return {releases_by_id[release_id]: changesets for release_id, changesets in query}
+
+
+def store_releases_l10n_changesets(
+    db_session: sqlalchemy.orm.Session, releases_l10n: typing.Iterable[typing.Tuple[shipit_api.common.models.Release, typing.Optional[ReleaseL10ns]]]
+) -> int:
+    """Store the l10n changesets fetched for shipped releases, which never
+    change afterwards, so that the next rebuilds don't fetch them again. Return
+    the number of releases stored.
+
+    This is best effort: on failure the changesets are fetched again by the next
+    rebuild, or stored by `backfill_release_l10n_changesets`.
+    """
+    ReleaseL10nChangesets = shipit_api.common.models.ReleaseL10nChangesets
+    # failed fetches return empty changesets
+    rows = [
+        ReleaseL10nChangesets(release_id=release.id, changesets=changesets) for release, changesets in releases_l10n if release.id is not None and changesets
+    ]
+    if not rows:
+        return 0
+    try:
+        db_session.add_all(rows)
+        db_session.commit()
+    except Exception:
+        logger.exception(f"Failed to store the l10n changesets of {len(rows)} releases")
+        db_session.rollback()
+        return 0
+    return len(rows)
+
+
+async def backfill_release_l10n_changesets(db_session: sqlalchemy.orm.Session, breakpoint_version: int) -> int:
+    """Fetch and store the l10n changesets of the shipped releases which don't
+    have them stored yet. Return the number of releases updated."""
+    releases = get_releases_from_db(db_session, breakpoint_version)
+    stored_l10n = get_releases_l10n_from_db(db_session, releases)
+    missing_releases = [release for release in releases if release not in stored_l10n and get_l10n_changesets_path(release) is not None]
+    logger.info(f"Fetching the l10n changesets of {len(missing_releases)} releases")
+
+    scheduler = create_fetch_scheduler()
+    with open_l10n_cache() as l10n_cache:
+        async with create_hg_session() as session:
+            releases_l10n = await fetch_releases_l10n(
+                session, missing_releases, False, l10n_cache, scheduler, dedupe=shipit_api.common.config.PRODUCT_DETAILS_L10N_DEDUPE
+            )
+
+    scheduler.log_stats("hg.mozilla.org fetches")
+    return store_releases_l10n_changesets(db_session, releases_l10n)
+
+
+@dataclasses.dataclass
+class NightlyFirstReleasesState:
+    """The first releases of the locales of the latest nightly build of a product
+    and channel (see `get_nightly_first_releases`), computed from its `builds`
+    nightly builds up to `buildid`."""
+
+    product: str
+    channel: str
+    buildid: str
+    builds: int
+    first_releases: FirstReleases
+
+
+def compute_nightly_first_releases(db_session: sqlalchemy.orm.Session, product: str, channel: str) -> NightlyFirstReleasesState:
+    """Compute the first releases of a product and channel from all its nightly builds."""
+    NightlyRelease = shipit_api.common.models.NightlyRelease
+    query = db_session.query(sqlalchemy.func.max(NightlyRelease.buildid), sqlalchemy.func.count(NightlyRelease.id))
+    # counted first: a build added meanwhile is either applied again by the next
+    # rebuild, or makes it compute them again when it's older
+    buildid, builds = query.filter(NightlyRelease.product == product, NightlyRelease.channel == channel).one()
+    first_releases = get_nightly_first_releases(get_nightly_releases_from_db(db_session, product, channel))
+    # an empty buildid sorts before all the builds which will be added
+    return NightlyFirstReleasesState(product, channel, buildid or "", builds, first_releases)
+
+
+def get_nightly_first_releases_from_db(db_session: sqlalchemy.orm.Session, product: str, channel: str) -> NightlyFirstReleasesState:
+    """The first releases of the locales of the latest nightly build, see
+    `get_nightly_first_releases`.
+
+    They are read from the ones stored for the product and channel, updated with
+    the nightly builds added since. They are computed from all the nightly
+    builds when none are stored, or when builds older than the stored ones were
+    added. Nothing is written, `store_nightly_first_releases` stores them.
+    """
+    NightlyRelease = shipit_api.common.models.NightlyRelease
+    NightlyFirstReleases = shipit_api.common.models.NightlyFirstReleases
+    stored = db_session.query(NightlyFirstReleases).filter(NightlyFirstReleases.product == product, NightlyFirstReleases.channel == channel).first()
+    if stored is None:
+        logger.info(f"No first releases stored for {product} {channel}, computing them from all the nightly builds")
+        return compute_nightly_first_releases(db_session, product, channel)
+
+    query = db_session.query(NightlyRelease).filter(NightlyRelease.product == product, NightlyRelease.channel == channel)
+    older_builds = query.filter(NightlyRelease.buildid <= stored.buildid).count()
+    if older_builds != stored.builds:
+        logger.info(f"Nightly builds older than {stored.buildid} were added to {product} {channel}, computing the first releases from all the nightly builds")
+        return compute_nightly_first_releases(db_session, product, channel)
+
+    state = NightlyFirstReleasesState(product, channel, stored.buildid, stored.builds, stored.first_releases)
+    for nightly_release in query.filter(NightlyRelease.buildid > stored.buildid).order_by(NightlyRelease.buildid.asc()):
+        state.first_releases = add_nightly_first_releases(state.first_releases, nightly_release)
+        state.buildid = nightly_release.buildid
+        state.builds += 1
+    return state
+
+
+def store_nightly_first_releases(db_session: sqlalchemy.orm.Session, state: NightlyFirstReleasesState, force: bool = False) -> bool:
+    """Store the first releases of a product and channel, unless the ones stored
+    are computed from the same builds or from newer ones and `force` is False.
+    Return whether they were stored."""
+    NightlyFirstReleases = shipit_api.common.models.NightlyFirstReleases
+    query = db_session.query(NightlyFirstReleases).filter(NightlyFirstReleases.product == state.product, NightlyFirstReleases.channel == state.channel)
+    # concurrent rebuilds store them one after the other
+    stored = query.with_for_update().first()
+    if stored is None:
+        db_session.add(
+            NightlyFirstReleases(product=state.product, channel=state.channel, buildid=state.buildid, builds=state.builds, first_releases=state.first_releases)
+        )
+    elif force or (stored.buildid, stored.builds) < (state.buildid, state.builds):
+        stored.buildid = state.buildid
+        stored.builds = state.builds
+        stored.first_releases = state.first_releases
+    else:
+        db_session.rollback()
+        return False
+    db_session.commit()
+    return True
+
+
+def recompute_nightly_first_releases(db_session: sqlalchemy.orm.Session, product: str, channel: str) -> int:
+    """Compute the first releases of a product and channel from all its nightly
+    builds and store them. Return the number of locales."""
+    state = compute_nightly_first_releases(db_session, product, channel)
+    store_nightly_first_releases(db_session, state, force=True)
+    return len(state.first_releases)
+
+
+@functools.cache
+def _get_product_categories_patterns(product: Product, esr: str) -> typing.List[typing.Tuple[ProductCategory, re.Pattern]]:
     # typically, these are dot releases that are considered major
     SPECIAL_FIREFOX_MAJORS = ["14.0.1", "125.0.1"]
     SPECIAL_THUNDERBIRD_MAJORS = ["14.0.1", "38.0.1"]
@@ -356,7 +825,6 @@ def get_product_categories(product: Product, version: str) -> typing.List[Produc
             return ""
         return "|" + "|".join([v.replace(r".", r"\.") for v in versions])
 
-    categories = []
     categories_mapping: typing.List[typing.Tuple[ProductCategory, str]] = []
 
     if product is Product.THUNDERBIRD:
@@ -372,21 +840,179 @@ def get_product_categories(product: Product, version: str) -> typing.List[Produc
     categories_mapping.append((ProductCategory.DEVELOPMENT, r"([0-9]+\.[0-9]|[0-9]+\.[0-9]+\.[0-9])(b|rc|build|plugin)[0-9]+$"))
 
     # Ugly hack to manage the next ESR (when we have two overlapping esr)
-    if shipit_api.common.config.ESR_NEXT:
-        categories_mapping.append((ProductCategory.ESR, shipit_api.common.config.ESR_NEXT + r"(\.[0-9]+){1,2}esr$"))
-    else:
-        categories_mapping.append((ProductCategory.ESR, shipit_api.common.config.CURRENT_ESR + r"(\.[0-9]+){1,2}esr$"))
+    categories_mapping.append((ProductCategory.ESR, esr + r"(\.[0-9]+){1,2}esr$"))
+
+    return [(product_category, re.compile(version_pattern)) for product_category, version_pattern in categories_mapping]
+
+
+def get_product_categories(product: Product, version: str) -> typing.List[ProductCategory]:
+    esr = shipit_api.common.config.ESR_NEXT or shipit_api.common.config.CURRENT_ESR
+    return [product_category for product_category, version_pattern in _get_product_categories_patterns(product, esr) if version_pattern.match(version)]
 
-    for product_category, version_pattern in categories_mapping:
-        if re.match(version_pattern, version):
-            categories.append(product_category)
 
+def get_history_categories(version) -> typing.Set[ProductCategory]:
+    """Return the release history files (by product category) a parsed version
+    belongs to. See `get_release_history`.
+    """
+    if not isinstance(version, GeckoVersion):
+        return set()
+
+    categories = set()
+    if version.patch_number is None and version.beta_number is None and not version.is_esr:
+        categories.add(ProductCategory.MAJOR)
+    # short term hack: 125.0.1 is a major release. we should replace this with
+    # something that uses MozillaVersion to determine categories
+    if version.major_number == 125 and version.patch_number == 1 and version.beta_number is None and not version.is_esr:
+        categories.add(ProductCategory.MAJOR)
+    if version.beta_number is not None and not version.is_esr:
+        categories.add(ProductCategory.DEVELOPMENT)
+    if version.beta_number is None and version.patch_number is not None:
+        categories.add(ProductCategory.STABILITY)
     return categories
 
 
-def get_releases(
-    breakpoint_version: int, products: Products, releases: typing.List[shipit_api.common.models.Release], old_product_details: ProductDetails
-) -> Releases:
+@dataclasses.dataclass(frozen=True)
+class IndexedRelease:
+    release: shipit_api.common.models.Release
+    product: Product
+    # None when the version can not be parsed
+    version: typing.Any
+    categories: typing.List[ProductCategory]
+    history_categories: typing.Set[ProductCategory]
+
+
+# Version predicates the latest versions are tracked for, on top of the latest
+# version of each product and branch (see `ReleaseIndex.latest_version`)
+LATEST_VERSION_PREDICATES = ("is_beta", "is_release")
+
+
+class ReleaseIndex:
+    """All the releases used for a rebuild, parsed and classified once, and
+    bucketed by product and by release history category. The latest version
+    per product, branch and predicate is tracked in the same pass.
+
+    The nightly builds are kept apart, since only some of the generators use them.
+    """
+
+    def __init__(
+        self,
+        releases: typing.Iterable[shipit_api.common.models.Release],
+        nightly_builds: typing.Iterable[shipit_api.common.models.Release] = (),
+    ):
+        self.releases = list(releases)
+        self.nightly_builds = list(nightly_builds)
+        self._by_product: typing.Dict[Product, typing.List[IndexedRelease]] = {}
+        self._by_history: typing.Dict[typing.Tuple[Product, ProductCategory], typing.List[IndexedRelease]] = {}
+        self._versions: typing.Dict[typing.Tuple[Product, str], typing.Any] = {}
+        self._latest: typing.Dict[typing.Tuple[Product, typing.Optional[str], typing.Optional[str]], IndexedRelease] = {}
+
+        for release in self.releases:
+            product = Product(release.product)
+            try:
+                version = self.parse_version(product, release.version)
+            except ValueError:
+                version = None
+            entry = IndexedRelease(
+                release=release,
+                product=product,
+                version=version,
+                categories=get_product_categories(product, release.version),
+                history_categories=get_history_categories(version),
+            )
+            self._by_product.setdefault(product, []).append(entry)
+            for category in entry.history_categories:
+                self._by_history.setdefault((product, category), []).append(entry)
+            if version is not None:
+                self._update_latest(entry)
+
+    def _update_latest(self, entry: IndexedRelease) -> None:
+        predicates = [None] + [predicate for predicate in LATEST_VERSION_PREDICATES if getattr(entry.version, predicate, False)]
+        for branch in (None, entry.release.branch):
+            for predicate in predicates:
+                key = (entry.product, branch, predicate)
+                # keep the first release seen for equal versions
+                if key not in self._latest or entry.version > self._latest[key].version:
+                    self._latest[key] = entry
+
+    def latest_version(self, product: Product, branch: typing.Optional[str] = None, predicate: typing.Optional[str] = None) -> str:
+        """Return the latest version of a product, optionally restricted to a
+        branch and to versions for which ``predicate`` (one of
+        LATEST_VERSION_PREDICATES) is true. Return an empty string if there is
+        no such version.
+        """
+        entry = self._latest.get((product, branch or None, predicate))
+        if entry is None:
+            # XXX: should we fallback to old_product_details?
+            return ""
+        return entry.release.version
+
+    def parse_version(self, product: Product, version: str):
+        """Same as `parse_version`, but every version is only parsed once."""
+        key = (product, version)
+        if key not in self._versions:
+            self._versions[key] = parse_version(product, version)
+        return self._versions[key]
+
+    def get(self, product: Product) -> typing.List[IndexedRelease]:
+        return self._by_product.get(product, [])
+
+    def get_history(self, product: Product, product_category: ProductCategory) -> typing.List[IndexedRelease]:
+        return self._by_history.get((product, product_category), [])
+
+
+def get_rebuild_inputs(trigger: typing.Optional[RebuildTrigger]) -> typing.Optional[typing.Set[str]]:
+    """Return the inputs (see PRODUCT_DETAILS_DEPENDENCIES) changed by a rebuild
+    trigger, or None when the trigger doesn't say what changed and everything
+    needs to be rebuilt.
+
+    A trigger either names a shipped release (``product`` and ``version``) or an
+    updated product channel version (``product``, ``product_channel`` and
+    ``version``).
+    """
+    if not trigger or "product" not in trigger or "version" not in trigger:
+        return None
+
+    try:
+        product = Product(trigger["product"])
+    except ValueError:
+        return None
+
+    if "product_channel" in trigger:
+        # only the nightly versions are used to generate product details
+        if trigger["product_channel"] == "nightly":
+            return {f"nightly:{product.value}"}
+        return set()
+
+    inputs = {product.value}
+    for category in get_product_categories(product, trigger["version"]):
+        inputs.add(f"{product.value}:{category.value}")
+    return inputs
+
+
+def merge_rebuild_inputs(triggers: typing.Optional[typing.Sequence[typing.Optional[RebuildTrigger]]]) -> typing.Optional[typing.Set[str]]:
+    """Return the inputs changed by all of `triggers`, or None when any of them
+    needs everything to be rebuilt."""
+    if triggers is None:
+        return None
+    inputs: typing.Set[str] = set()
+    for trigger in triggers:
+        trigger_inputs = get_rebuild_inputs(trigger)
+        if trigger_inputs is None:
+            return None
+        inputs |= trigger_inputs
+    return inputs
+
+
+def get_affected_files(inputs: typing.Optional[typing.Set[str]]) -> typing.Optional[typing.Set[File]]:
+    """Return the files that need to be generated again when ``inputs`` changed,
+    or None when all of them do.
+    """
+    if inputs is None:
+        return None
+    return {file_ for file_, dependencies in PRODUCT_DETAILS_DEPENDENCIES.items() if dependencies & inputs} | PRODUCT_DETAILS_ALWAYS_GENERATED
+
+
+def get_releases(breakpoint_version: int, products: Products, release_index: ReleaseIndex, old_product_details: ProductDetails) -> Releases:
     """This file holds historical information about all Firefox, Firefox for
     Mobile (aka Fennec), Firefox Dev Edition and Thunderbird releases we
     shipped in the past.
@@ -411,63 +1037,70 @@ def get_releases(
         }
     """
     details = dict()
-
     for product in products:
-        #
-        # get release details from the JSON files up to breakpoint_version
-        #
-        product_file = f"1.0/{product.value}.json"
-        if product in [Product.FENNEC, Product.FENIX, Product.FIREFOX_ANDROID]:
-            product_file = "1.0/mobile_android.json"
-
-        old_releases = typing.cast(typing.Dict[str, ReleaseDetails], old_product_details.get(product_file, {}).get("releases", dict()))  # noqa
-        for product_with_version in old_releases:
-            # product_with_version looks like "Fennec-1.0". There is nothing after the version
-            if "-" not in product_with_version:
-                raise ValueError(f'Invalid product_with_version "{product_with_version}". It must contain a -')
-            product_string, version_string = product_with_version.rsplit("-", 1)
-
-            # XXX Both Fennec and Fenix output to mobile_android.json. We don't want to
-            # parse Fennec version number as if it were Fenix because the parser is
-            # strict. So, this skip statement below is to make sure we don't try to
-            # parse version numbers with the wrong parser.
-            if product_string.lower() != product.value.lower():
-                continue
+        details.update(get_product_releases(breakpoint_version, product, release_index, old_product_details))
+    return dict(releases=details)
 
-            version = parse_version(product, version_string)
-            if version.major_number >= breakpoint_version:
-                continue
-            details[product_with_version] = old_releases[product_with_version]
 
-        #
-        # get release history from the database
-        #
-        for release in releases:
-            if release.product != product.value:
-                continue
-            categories = get_product_categories(Product(release.product), release.version)
-            release_version = release.version
-            for category in categories:
-                if release_version.endswith("esr"):
-                    release_version = release_version[: -len("esr")]
-                details[f"{release.product}-{release.version}"] = dict(
-                    category=category.value,
-                    product=release.product,
-                    build_number=release.build_number,
-                    description=None,
-                    is_security_driven=False,  # TODO: we don't have this field anymore
-                    version=release_version,
-                    date=with_default(release.completed, functools.partial(to_format, format="YYYY-MM-DD"), default=""),
-                )
+def get_product_releases(
+    breakpoint_version: int, product: Product, release_index: ReleaseIndex, old_product_details: ProductDetails
+) -> typing.Dict[str, ReleaseDetails]:
+    """The releases of a single product, see `get_releases`."""
+    details: typing.Dict[str, ReleaseDetails] = dict()
 
-    return dict(releases=details)
+    #
+    # get release details from the JSON files up to breakpoint_version
+    #
+    product_file = f"1.0/{product.value}.json"
+    if product in [Product.FENNEC, Product.FENIX, Product.FIREFOX_ANDROID]:
+        product_file = "1.0/mobile_android.json"
+
+    old_releases = typing.cast(typing.Dict[str, ReleaseDetails], old_product_details.get(product_file, {}).get("releases", dict()))  # noqa
+    for product_with_version in old_releases:
+        # product_with_version looks like "Fennec-1.0". There is nothing after the version
+        if "-" not in product_with_version:
+            raise ValueError(f'Invalid product_with_version "{product_with_version}". It must contain a -')
+        product_string, version_string = product_with_version.rsplit("-", 1)
+
+        # XXX Both Fennec and Fenix output to mobile_android.json. We don't want to
+        # parse Fennec version number as if it were Fenix because the parser is
+        # strict. So, this skip statement below is to make sure we don't try to
+        # parse version numbers with the wrong parser.
+        if product_string.lower() != product.value.lower():
+            continue
+
+        version = release_index.parse_version(product, version_string)
+        if version.major_number >= breakpoint_version:
+            continue
+        details[product_with_version] = old_releases[product_with_version]
+
+    #
+    # get release history from the database
+    #
+    for entry in release_index.get(product):
+        release = entry.release
+        release_version = release.version
+        for category in entry.categories:
+            if release_version.endswith("esr"):
+                release_version = release_version[: -len("esr")]
+            details[f"{release.product}-{release.version}"] = dict(
+                category=category.value,
+                product=release.product,
+                build_number=release.build_number,
+                description=None,
+                is_security_driven=False,  # TODO: we don't have this field anymore
+                version=release_version,
+                date=with_default(release.completed, functools.partial(to_format, format="YYYY-MM-DD"), default=""),
+            )
+
+    return details
 
 
 def get_release_history(
     breakpoint_version: int,
     product: Product,
     product_category: ProductCategory,
-    releases: typing.List[shipit_api.common.models.Release],
+    release_index: ReleaseIndex,
     old_product_details: ProductDetails,
 ) -> ReleasesHistory:
     """This file contains all the Product release dates for releases in that
@@ -522,52 +1155,21 @@ def get_release_history(
 
     old_history = typing.cast(ReleasesHistory, old_product_details.get(product_file, {}))
     for version_string in old_history:
-        version = parse_version(product, version_string)
+        version = release_index.parse_version(product, version_string)
         if version.major_number >= breakpoint_version:
             continue
         history[version_string] = old_history[version_string]
 
     #
-    # get release history from the database
+    # get release history from the database, only looking at the releases which
+    # fit into product category (see `get_history_categories`)
     #
-    for release in releases:
-        if product.value != release.product:
-            continue
-
+    for entry in release_index.get_history(product, product_category):
+        release = entry.release
         if release.status != "shipped":
             continue
 
-        release_version = parse_version(release.product, release.version)
-        if release_version is None or release_version.major_number < breakpoint_version:
-            continue
-
-        # short term hack: 125.0.1 is a major release. we should replace this with
-        # something that uses MozillaVersion to determine categories
-        if (
-            product_category is ProductCategory.MAJOR
-            and release_version.major_number == 125
-            and release_version.patch_number == 1
-            and release_version.beta_number is None
-            and not release_version.is_esr
-        ):
-            # history_version is a copy of stuff further down - we need it now, before
-            # this release gets skipped
-            history_version = release.version
-            if history_version.endswith("esr"):
-                history_version = history_version[: -len("esr")]
-            history[history_version] = with_default(release.completed, functools.partial(to_format, format="YYYY-MM-DD"), default="")
-            continue
-
-        # skip all releases which don't fit into product category
-        if product_category is ProductCategory.MAJOR and (
-            release_version.patch_number is not None or release_version.beta_number is not None or release_version.is_esr
-        ):
-            continue
-
-        elif product_category is ProductCategory.DEVELOPMENT and (release_version.beta_number is None or release_version.is_esr):
-            continue
-
-        elif product_category is ProductCategory.STABILITY and (release_version.beta_number is not None or release_version.patch_number is None):
+        if entry.version.major_number < breakpoint_version:
             continue
 
         history_version = release.version
@@ -582,14 +1184,13 @@ def get_release_history(
     return ordered_history
 
 
-async def get_primary_builds(
+def get_primary_builds(
     breakpoint_version: int,
     product: Product,
-    releases: typing.List[shipit_api.common.models.Release],
+    release_index: ReleaseIndex,
     releases_l10n: typing.Dict[shipit_api.common.models.Release, ReleaseL10ns],
     old_product_details: ProductDetails,
-    firefox_nightly_version: str,
-    thunderbird_nightly_version: str,
+    product_versions: typing.Union[FirefoxVersions, ThunderbirdVersions],
 ) -> PrimaryBuilds:
     """This file contains all the Thunderbird builds we provide per locale. The
     filesize fields have the same value for all locales, this is not a bug,
@@ -620,7 +1221,7 @@ async def get_primary_builds(
     """
 
     if product is Product.FIREFOX:
-        firefox_versions = await get_firefox_versions(releases, firefox_nightly_version)
+        firefox_versions = typing.cast(FirefoxVersions, product_versions)
         # make sure that Devedition is included in the list
         products = [Product.FIREFOX, Product.DEVEDITION]
         versions = set(
@@ -637,7 +1238,7 @@ async def get_primary_builds(
         if firefox_versions["FIREFOX_ESR115"]:
             versions.add(firefox_versions["FIREFOX_ESR115"])
     elif product is Product.THUNDERBIRD:
-        thunderbird_versions = get_thunderbird_versions(releases, thunderbird_nightly_version)
+        thunderbird_versions = typing.cast(ThunderbirdVersions, product_versions)
         products = [Product.THUNDERBIRD]
         versions = set(
             [
@@ -654,7 +1255,8 @@ async def get_primary_builds(
 
     builds: PrimaryBuilds = dict()
 
-    for release in releases:
+    releases = [entry.release for product_ in products for entry in release_index.get(product_)]
+    for release in itertools.chain(releases, release_index.nightly_builds):
         # Skip other products and older versions
         if Product(release.product) not in products or release.version not in versions:
             continue
@@ -663,7 +1265,7 @@ async def get_primary_builds(
         if release in releases_l10n:
             locales += releases_l10n[release].keys()
         elif f"1.0/l10n/{release.name}.json" in old_product_details:
-            locales += old_product_details[f"1.0/l10n/{release.name}.json"]["locales"]
+            locales += get_old_l10n_locales(old_product_details, f"1.0/l10n/{release.name}.json")
         for l10n in locales:
             # for compatibility with shipit v1, skip ja-JP-mac
             if l10n == "ja-JP-mac":
@@ -677,37 +1279,28 @@ async def get_primary_builds(
     return builds
 
 
-def get_latest_version(
-    releases: typing.List[shipit_api.common.models.Release], product: Product, branch: str = None, filter_closure: typing.Optional[typing.Callable] = None
-) -> str:
+def get_latest_version(release_index: ReleaseIndex, product: Product, branch: str = None, predicate: typing.Optional[str] = None) -> str:
     """Get latest version
 
     Get the latest shipped version for a particular branch/product,
-    optionally for a particular major version. The results should be sorted
-    by version, not by date, because we may publish a correction release
-    for old users (this has been done in the past).
+    optionally for a particular kind of version (see LATEST_VERSION_PREDICATES).
+    The results are sorted by version, not by date, because we may publish a
+    correction release for old users (this has been done in the past).
     """
-    filtered_releases = [r for r in releases if r.product == product.value and (r.branch == branch if branch else True)]
-    if filter_closure:
-        filtered_releases = list(filter(filter_closure, filtered_releases))
-    releases_ = sorted(filtered_releases, reverse=True, key=lambda r: parse_version(product, r.version))
-    if len(releases_) == 0:
-        # XXX: should we fallback to old_product_details?
-        return ""
-    return releases_[0].version
+    return release_index.latest_version(product, branch, predicate)
 
 
-def get_firefox_esr_version(releases: typing.List[shipit_api.common.models.Release], branch: str, product: Product) -> str:
+def get_firefox_esr_version(release_index: ReleaseIndex, branch: str, product: Product) -> str:
     """Return latest ESR version
 
     Get the latest version using CURRENT_ESR major version. Sometimes, when we
     have 2 overlapping ESR releases we want to point this to the older version,
     while ESR_NEXT will be pointing to the next release.
     """
-    return get_latest_version(releases, product, branch)
+    return get_latest_version(release_index, product, branch)
 
 
-def get_firefox_esr_next_version(releases: typing.List[shipit_api.common.models.Release], branch: str, product: Product, esr_next: typing.Optional[str]) -> str:
+def get_firefox_esr_next_version(release_index: ReleaseIndex, branch: str, product: Product, esr_next: typing.Optional[str]) -> str:
     """Next ESR version
 
     Return an empty string when there is only one ESR release published. If
@@ -717,50 +1310,82 @@ def get_firefox_esr_next_version(releases: typing.List[shipit_api.common.models.
     if not esr_next:
         return ""
     else:
-        return get_latest_version(releases, product, branch)
+        return get_latest_version(release_index, product, branch)
+
+
+fetch_json_with_retries = backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError), max_time=60)(fetch_json)
+
+
+async def fetch_release_schedule(
+    session: aiohttp.ClientSession, version: int, cache: typing.Optional[CacheStore] = None
+) -> typing.Tuple[typing.Dict[str, str], float]:
+    """The release schedule of a Firefox major version, and how many seconds ago
+    it was fetched from whattrainisitnow.com.
+
+    Schedules are kept in `cache` with the time they were fetched at, and
+    refetched once they are older than the TTL of the cache. They are stored as
+    permanent entries so that the last schedule fetched is still around when
+    whattrainisitnow.com is down or slow: it is then used with a warning,
+    after a single attempt bounded by PRODUCT_DETAILS_SCHEDULE_FETCH_TIMEOUT.
+    Without a schedule to fall back on, fetching is retried for up to a minute.
+    """
+    url = f"{shipit_api.common.config.WHATTRAINISITNOW_PREFIX}/api/release/schedule/?version={version}"
+    key = f"release_schedule/{version}"
+    now = time.time()
+    entry = cache.get(key) if cache is not None else None
+    if cache is not None and entry is not None and now - entry["fetched_at"] < cache.ttl:
+        return entry["schedule"], now - entry["fetched_at"]
+
+    try:
+        if entry is None:
+            schedule = await fetch_json_with_retries(session, url)
+        else:
+            schedule = await asyncio.wait_for(fetch_json(session, url), shipit_api.common.config.PRODUCT_DETAILS_SCHEDULE_FETCH_TIMEOUT)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if entry is None:
+            logger.info("Failed to fetch %s", url)
+            raise
+        age = now - entry["fetched_at"]
+        logger.warning(f"Failed to fetch {url} ({e!r}), using the release schedule fetched {age:.0f}s ago")
+        return entry["schedule"], age
+
+    if cache is not None:
+        cache.set(key, dict(fetched_at=now, schedule=schedule))
+    return schedule, 0.0
 
 
-@backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError), max_time=60)
 async def fetch_firefox_release_schedule_data(
-    releases: typing.List[shipit_api.common.models.Release], session: aiohttp.ClientSession, firefox_nightly_version: str
+    release_index: ReleaseIndex,
+    session: aiohttp.ClientSession,
+    firefox_nightly_version: str,
+    cache: typing.Optional[CacheStore] = None,
+    stats: typing.Optional[RebuildStats] = None,
 ):
     firefox_nightly_mozilla_version = FirefoxVersion.parse(firefox_nightly_version)
     current_nightly_version_major_number = firefox_nightly_mozilla_version.major_number
     previous_nightly_version_major_number = current_nightly_version_major_number - 1
-    url_template = "https://whattrainisitnow.com/api/release/schedule/?version={version}"
-    try:
-        url = url_template.format(version=current_nightly_version_major_number)
-        async with session.get(url) as response:
-            response.raise_for_status()
-            logger.debug(f"Fetched {url}")
-            current_nightly_version_schedule = await response.json()
-        url = url_template.format(version=previous_nightly_version_major_number)
-        async with session.get(url) as response:
-            response.raise_for_status()
-            logger.debug(f"Fetched {url}")
-            previous_nightly_version_schedule = await response.json()
-    except Exception:
-        logger.info("Failed to fetch %s", url)
-        raise
+    current_nightly_version_schedule, current_age = await fetch_release_schedule(session, current_nightly_version_major_number, cache)
+    previous_nightly_version_schedule, previous_age = await fetch_release_schedule(session, previous_nightly_version_major_number, cache)
+    if stats is not None:
+        stats.gauge("release_schedule_age", round(max(current_age, previous_age)))
     last_merge_date = iso_to_ymd(previous_nightly_version_schedule["merge_day"])
     releases_after_last_merge_date = sorted(
         [
-            release
-            for release in releases
-            if release.product == Product.FIREFOX.value
-            and FirefoxVersion.parse(release.version).is_release
-            and release.status == "shipped"
-            and release.completed is not None
-            and release.completed.replace(tzinfo=timezone.utc) > from_isoformat(previous_nightly_version_schedule["merge_day"])
+            entry
+            for entry in release_index.get(Product.FIREFOX)
+            if entry.version.is_release
+            and entry.release.status == "shipped"
+            and entry.release.completed is not None
+            and entry.release.completed.replace(tzinfo=timezone.utc) > from_isoformat(previous_nightly_version_schedule["merge_day"])
         ],
-        key=lambda release: FirefoxVersion.parse(release.version),
+        key=lambda entry: entry.version,
     )
     if not releases_after_last_merge_date:
         logger.info(f"No Firefox releases shipped after the last merge date ({last_merge_date})")
         last_release_date = dt_to_ymd(from_ymd_format(last_merge_date) + timedelta(days=1))
         logger.info(f"Assuming a Firefox release will be shipped on {last_release_date} (the day after the last merge date)")
     else:
-        first_release_after_last_merge_date = releases_after_last_merge_date[0]
+        first_release_after_last_merge_date = releases_after_last_merge_date[0].release
         last_release_date = dt_to_ymd(first_release_after_last_merge_date.completed)
     last_stringfreeze_date = iso_to_ymd(previous_nightly_version_schedule["string_freeze"])
     next_merge_date = iso_to_ymd(current_nightly_version_schedule["merge_day"])
@@ -776,7 +1401,13 @@ async def fetch_firefox_release_schedule_data(
     }
 
 
-async def get_firefox_versions(releases: typing.List[shipit_api.common.models.Release], firefox_nightly_version: str) -> FirefoxVersions:
+async def get_firefox_versions(
+    release_index: ReleaseIndex,
+    firefox_nightly_version: str,
+    session: typing.Optional[aiohttp.ClientSession] = None,
+    schedule_cache: typing.Optional[CacheStore] = None,
+    stats: typing.Optional[RebuildStats] = None,
+) -> FirefoxVersions:
     """All the versions we ship for Firefox for Desktop
 
     This function will output to the following files:
@@ -801,21 +1432,30 @@ async def get_firefox_versions(releases: typing.List[shipit_api.common.models.Re
             "NEXT_RELEASE_DATE":                      "2019-05-14"
         }
     """
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=50), timeout=aiohttp.ClientTimeout(total=30)) as session:
-        firefox_release_schedule_data = await fetch_firefox_release_schedule_data(releases, session, firefox_nightly_version)
+    async with contextlib.AsyncExitStack() as stack:
+        if session is None:
+            session = await stack.enter_async_context(
+                aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=50), timeout=aiohttp.ClientTimeout(total=30))
+            )
+        firefox_release_schedule_data = await fetch_firefox_release_schedule_data(release_index, session, firefox_nightly_version, schedule_cache, stats)
 
     return dict(
         FIREFOX_NIGHTLY=firefox_nightly_version,
         FIREFOX_AURORA=shipit_api.common.config.FIREFOX_AURORA,
-        LATEST_FIREFOX_VERSION=get_latest_version(releases, Product.FIREFOX, shipit_api.common.config.RELEASE_BRANCH),
-        FIREFOX_ESR=get_firefox_esr_version(releases, f"{shipit_api.common.config.ESR_BRANCH_PREFIX}{shipit_api.common.config.CURRENT_ESR}", Product.FIREFOX),
+        LATEST_FIREFOX_VERSION=get_latest_version(release_index, Product.FIREFOX, shipit_api.common.config.RELEASE_BRANCH),
+        FIREFOX_ESR=get_firefox_esr_version(
+            release_index, f"{shipit_api.common.config.ESR_BRANCH_PREFIX}{shipit_api.common.config.CURRENT_ESR}", Product.FIREFOX
+        ),
         FIREFOX_ESR_NEXT=get_firefox_esr_next_version(
-            releases, f"{shipit_api.common.config.ESR_BRANCH_PREFIX}{shipit_api.common.config.ESR_NEXT}", Product.FIREFOX, shipit_api.common.config.ESR_NEXT
+            release_index,
+            f"{shipit_api.common.config.ESR_BRANCH_PREFIX}{shipit_api.common.config.ESR_NEXT}",
+            Product.FIREFOX,
+            shipit_api.common.config.ESR_NEXT,
         ),
-        FIREFOX_ESR115=get_firefox_esr_next_version(releases, f"{shipit_api.common.config.ESR_BRANCH_PREFIX}115", Product.FIREFOX, "115"),
-        LATEST_FIREFOX_DEVEL_VERSION=get_latest_version(releases, Product.FIREFOX, shipit_api.common.config.BETA_BRANCH),
-        LATEST_FIREFOX_RELEASED_DEVEL_VERSION=get_latest_version(releases, Product.FIREFOX, shipit_api.common.config.BETA_BRANCH),
-        FIREFOX_DEVEDITION=get_latest_version(releases, Product.DEVEDITION, shipit_api.common.config.BETA_BRANCH),
+        FIREFOX_ESR115=get_firefox_esr_next_version(release_index, f"{shipit_api.common.config.ESR_BRANCH_PREFIX}115", Product.FIREFOX, "115"),
+        LATEST_FIREFOX_DEVEL_VERSION=get_latest_version(release_index, Product.FIREFOX, shipit_api.common.config.BETA_BRANCH),
+        LATEST_FIREFOX_RELEASED_DEVEL_VERSION=get_latest_version(release_index, Product.FIREFOX, shipit_api.common.config.BETA_BRANCH),
+        FIREFOX_DEVEDITION=get_latest_version(release_index, Product.DEVEDITION, shipit_api.common.config.BETA_BRANCH),
         LATEST_FIREFOX_OLDER_VERSION=shipit_api.common.config.LATEST_FIREFOX_OLDER_VERSION,
         LAST_STRINGFREEZE_DATE=firefox_release_schedule_data["LAST_STRINGFREEZE_DATE"],
         LAST_MERGE_DATE=firefox_release_schedule_data["LAST_MERGE_DATE"],
@@ -937,7 +1577,7 @@ def get_languages(old_product_details: ProductDetails) -> Languages:
     return typing.cast(Languages, languages)
 
 
-def get_mobile_details(releases: typing.List[shipit_api.common.models.Release], firefox_nightly_version: str) -> MobileDetails:
+def get_mobile_details(release_index: ReleaseIndex, firefox_nightly_version: str, mobile_versions: typing.Optional[MobileVersions] = None) -> MobileDetails:
     """This file contains all the release information for Firefox for Android
     and Firefox for iOS. We are keeping this file around for backward
     compatibility with consumers and only the version numbers are updated
@@ -1012,13 +1652,14 @@ def get_mobile_details(releases: typing.List[shipit_api.common.models.Release],
             },
         }
     """
-    mobile_versions = get_mobile_versions(releases, firefox_nightly_version)
+    if mobile_versions is None:
+        mobile_versions = get_mobile_versions(release_index, firefox_nightly_version)
     mobile_details = json.loads(shipit_api.common.config.MOBILE_DETAILS_TEMPLATE)
     mobile_details.update(mobile_versions)
     return mobile_details
 
 
-def get_mobile_versions(releases: typing.List[shipit_api.common.models.Release], firefox_nightly_version: str) -> MobileVersions:
+def get_mobile_versions(release_index: ReleaseIndex, firefox_nightly_version: str) -> MobileVersions:
     """This file contains all the versions we ship for Firefox for Android
 
     This function will output to the following files:
@@ -1040,12 +1681,12 @@ def get_mobile_versions(releases: typing.List[shipit_api.common.models.Release],
         ios_version=shipit_api.common.config.IOS_VERSION,
         nightly_version=firefox_nightly_version,
         alpha_version=firefox_nightly_version,
-        beta_version=get_latest_version(releases, Product.FIREFOX_ANDROID, filter_closure=lambda r: MobileVersion.parse(r.version).is_beta),
-        version=get_latest_version(releases, Product.FIREFOX_ANDROID, filter_closure=lambda r: MobileVersion.parse(r.version).is_release),
+        beta_version=get_latest_version(release_index, Product.FIREFOX_ANDROID, predicate="is_beta"),
+        version=get_latest_version(release_index, Product.FIREFOX_ANDROID, predicate="is_release"),
     )
 
 
-def get_thunderbird_versions(releases: typing.List[shipit_api.common.models.Release], thunderbird_nightly_version: str) -> ThunderbirdVersions:
+def get_thunderbird_versions(release_index: ReleaseIndex, thunderbird_nightly_version: str) -> ThunderbirdVersions:
     """
 
     This function will output to the following files:
@@ -1063,15 +1704,15 @@ def get_thunderbird_versions(releases: typing.List[shipit_api.common.models.Rele
         }
     """
     return dict(
-        LATEST_THUNDERBIRD_VERSION=get_latest_version(releases, Product.THUNDERBIRD, shipit_api.common.config.THUNDERBIRD_RELEASE_BRANCH),
-        LATEST_THUNDERBIRD_DEVEL_VERSION=get_latest_version(releases, Product.THUNDERBIRD, shipit_api.common.config.THUNDERBIRD_BETA_BRANCH),
+        LATEST_THUNDERBIRD_VERSION=get_latest_version(release_index, Product.THUNDERBIRD, shipit_api.common.config.THUNDERBIRD_RELEASE_BRANCH),
+        LATEST_THUNDERBIRD_DEVEL_VERSION=get_latest_version(release_index, Product.THUNDERBIRD, shipit_api.common.config.THUNDERBIRD_BETA_BRANCH),
         LATEST_THUNDERBIRD_NIGHTLY_VERSION=thunderbird_nightly_version,
         LATEST_THUNDERBIRD_ALPHA_VERSION=shipit_api.common.config.LATEST_THUNDERBIRD_ALPHA_VERSION,
         THUNDERBIRD_ESR=get_firefox_esr_version(
-            releases, f"{shipit_api.common.config.THUNDERBIRD_ESR_BRANCH_PREFIX}{shipit_api.common.config.CURRENT_ESR}", Product.THUNDERBIRD
+            release_index, f"{shipit_api.common.config.THUNDERBIRD_ESR_BRANCH_PREFIX}{shipit_api.common.config.CURRENT_ESR}", Product.THUNDERBIRD
         ),
         THUNDERBIRD_ESR_NEXT=get_firefox_esr_next_version(
-            releases,
+            release_index,
             f"{shipit_api.common.config.THUNDERBIRD_ESR_BRANCH_PREFIX}{shipit_api.common.config.ESR_NEXT}",
             Product.THUNDERBIRD,
             shipit_api.common.config.ESR_NEXT,
@@ -1092,84 +1733,111 @@ def get_thunderbird_beta_builds() -> typing.Dict:
     return dict()
 
 
-def first_continuous_releases(releases: typing.Iterable[tuple[FirstRelease, list[str]]]) -> dict[str, FirstRelease]:
+def first_continuous_releases(
+    releases: typing.Iterable[tuple[FirstRelease, typing.Iterable[str]]], ignored_locales: typing.Collection[str] = ()
+) -> dict[str, FirstRelease]:
     """Given an ordered (newest first) list of ``(release, locales)`` pairs, find the
     oldest release each locale has been continuously available on.
 
     Locales not present in the newest release are ignored, as they do not meet the
-    definition of "continuously available".
+    definition of "continuously available", and so are `ignored_locales`.
     """
     releases = iter(releases)
     try:
-        latest_release = next(releases)
+        latest_release, latest_locales = next(releases)
     except StopIteration:
         return {}
 
     # locales not present in the latest release are ignored completely, as they do
-    # not meet the definition of "continuously available"; make these easily
-    # available
-    needed_locales = set(latest_release[1])
-
-    last_releases: typing.Dict[str, FirstRelease] = {}
-    done: typing.Set[str] = set()
-
-    for release, locales in itertools.chain([latest_release], releases):
-        # identify any locales that we've already seen, and are missing from the current
-        # release being checked (ie: the next oldest release)
-        for locale in last_releases:
-            # locale has been seen before, but now goes missing; last_releases already
-            # contains the oldest continuous release, mark it as done
-            if locale not in locales:
-                done.add(locale)
-
-        # update last_releases for all locales present in the current release
-        # and the latest release that have not already had their last continuous
-        # release identified
-        for locale in locales:
-            if locale in done or locale not in needed_locales:
-                continue
-
-            last_releases[locale] = release
-
-        # once every locale of interest has had its oldest continuous release
-        # identified, no older release can change the result; stop fetching
-        if done == needed_locales:
-            break
-
-    return last_releases
+    # not meet the definition of "continuously available"; the other ones are
+    # interned to a bit each, so that the locales of a release are a single int
+    locales_by_index = [locale for locale in dict.fromkeys(latest_locales) if locale not in ignored_locales]
+    bits = {locale: 1 << index for index, locale in enumerate(locales_by_index)}
+    # the locales available in all the releases checked so far
+    continuous = (1 << len(bits)) - 1
+    first_releases: typing.Dict[int, FirstRelease] = {}
+
+    previous_release = latest_release
+    for release, locales in releases if continuous else ():
+        missing = continuous & ~functools.reduce(operator.or_, map(bits.get, locales, itertools.repeat(0)), 0)
+        if missing:
+            # the locales going missing in the current release being checked (ie: the
+            # next oldest release) have been continuously available since the previous one
+            continuous &= ~missing
+            while missing:
+                bit = missing & -missing
+                first_releases[bit.bit_length() - 1] = previous_release
+                missing ^= bit
+            # once every locale of interest has had its oldest continuous release
+            # identified, no older release can change the result; stop fetching
+            if not continuous:
+                break
+        previous_release = release
+
+    # the locales which never went missing have been available since the oldest release
+    return {locale: first_releases.get(index, previous_release) for index, locale in enumerate(locales_by_index)}
+
+
+def get_nightly_first_releases(nightly_releases: typing.Iterable[shipit_api.common.models.NightlyRelease]) -> FirstReleases:
+    """Find the oldest nightly build each locale of the latest nightly build has
+    been continuously available on, from the nightly builds ordered newest first.
+    """
+    # `first_continuous_releases` needs to work with these releases (which are NightlyRelease
+    # objects) and non-NightlyReleases (in order to implement `get_firefox_release_locales`);
+    # munge these releases into a generic format to accommodate this
+    releases = (({"version": nr.version, "buildid": nr.buildid}, nr.locales) for nr in nightly_releases)
+    # en-US is included in the NightlyRelease metadata, but not in the locale list
+    # that we spit out; ignore it
+    return first_continuous_releases(releases, ignored_locales={"en-US"})
+
+
+def add_nightly_first_releases(first_releases: FirstReleases, nightly_release: shipit_api.common.models.NightlyRelease) -> FirstReleases:
+    """Update the result of `get_nightly_first_releases` with a nightly build
+    newer than all the builds it was computed from.
+
+    The locales of the new build which were in the previous latest build keep
+    their first release, the other ones start a run at the new build, and the
+    locales missing from the new build are dropped.
+    """
+    return {
+        locale: first_releases.get(locale, {"version": nightly_release.version, "buildid": nightly_release.buildid})
+        for locale in nightly_release.locales
+        if locale != "en-US"
+    }
 
 
 def get_firefox_nightly_locales(nightly_releases: typing.Iterable[shipit_api.common.models.NightlyRelease]) -> FirefoxLocales:
     """Generate the first version each locale has been continuously available on
     for nightly releases.
     """
-    result: FirefoxLocales = {}
+    return format_firefox_nightly_locales(get_nightly_first_releases(nightly_releases))
 
-    def yield_releases() -> typing.Iterable[tuple[FirstRelease, list[str]]]:
-        # `first_continuous_releases` needs to work with these releases (which are NightlyRelease
-        # objects) and non-NightlyReleases (in order to implement `get_firefox_release_locales`);
-        # munge these releases into a generic format to accommodate this
-        for nr in nightly_releases:
-            # copy to avoid mutating the database object
-            locales = nr.locales.copy()
-            # en-US is included in the NightlyRelease metadata, but not in the locale list
-            # that we spit out; remove it upfront
-            if "en-US" in locales:
-                locales.remove("en-US")
-            yield ({"version": nr.version, "buildid": nr.buildid}, locales)
-
-    for locale, release in first_continuous_releases(yield_releases()).items():
-        result[locale] = {"first_release": {"nightly": release}}
 
-    return result
+def format_firefox_nightly_locales(first_releases: FirstReleases) -> FirefoxLocales:
+    return {locale: {"first_release": {"nightly": release}} for locale, release in first_releases.items()}
+
+
+def index_releases_l10n(
+    releases_l10n: dict[shipit_api.common.models.Release, ReleaseL10ns],
+) -> dict[typing.Tuple[str, str, int], ReleaseL10ns]:
+    """Key the l10n changesets of the releases by (product, version, build_number)."""
+    return {(release.product, release.version, release.build_number): l10n_changesets for release, l10n_changesets in releases_l10n.items()}
 
 
 def get_firefox_release_locales(
-    firefox_releases: Releases, releases_l10n: dict[shipit_api.common.models.Release, ReleaseL10ns], old_product_details: ProductDetails
+    firefox_releases: Releases,
+    releases_l10n: dict[shipit_api.common.models.Release, ReleaseL10ns],
+    old_product_details: ProductDetails,
+    release_index: typing.Optional[ReleaseIndex] = None,
 ) -> FirefoxLocales:
     """Generate the first version each locale has been continuously available
     on for non-Nightly releases.
     """
+    if release_index is None:
+        release_index = ReleaseIndex([])
+
+    l10n_index = index_releases_l10n(releases_l10n)
+
     channels = {}
     # Combine release information with locales for each release
     for product_with_version, details in firefox_releases["releases"].items():
@@ -1183,34 +1851,31 @@ def get_firefox_release_locales(
         # Older releases are only present in the old product details
         l10n_file = f"1.0/l10n/{details['product'].capitalize()}-{version}-build{build_number}.json"
         if l10n_file in old_product_details:
-            locales = set(old_product_details[l10n_file]["locales"].keys())
+            locales = set(get_old_l10n_locales(old_product_details, l10n_file))
         else:
             # Newer (ie: ones that are only being published with this product-details rebuild)
             # are only available in releases_l10n
-            for release, l10n_changesets in releases_l10n.items():
-                if release.product == details["product"] and release.version == version and release.build_number == details["build_number"]:
-                    locales = l10n_changesets.keys()
+            l10n_changesets = l10n_index.get((details["product"], version, build_number))
+            if l10n_changesets is not None:
+                locales = l10n_changesets.keys()
 
         if locales is None:
             # We don't have consistently available l10n information for versions < 40
             # Don't error out unless we're missing data for newer versions
-            if parse_version(Product.FIREFOX, version).major_number < 40:
+            if release_index.parse_version(Product.FIREFOX, version).major_number < 40:
                 continue
 
             raise Exception(f"Couldn't find l10n information for version: {version}")
 
         release_metadata = {"version": version, "build_number": build_number}
-        channels.setdefault(channel, []).append((parse_version(Product.FIREFOX, version), release_metadata, locales))
+        channels.setdefault(channel, []).append((release_index.parse_version(Product.FIREFOX, version), release_metadata, locales))
 
     # Find the first continuous release for each locale + channel (except `aurora`)
     result: FirefoxLocales = {}
     for channel, release_tuples in channels.items():
         release_tuples.sort(key=lambda item: item[0], reverse=True)
         ordered = [(release, locales) for _, release, locales in release_tuples]
-        for locale, release in first_continuous_releases(ordered).items():
-            if locale == "en-US":
-                continue
-
+        for locale, release in first_continuous_releases(ordered, ignored_locales={"en-US"}).items():
             result.setdefault(locale, {"first_release": {}})["first_release"][channel] = release
 
     # Populate `first_release` for the aurora channel, which is a snowflake.
@@ -1220,13 +1885,13 @@ def get_firefox_release_locales(
     # yet is a shipping channel of Firefox that must be included in the firefox locale metadata.
     # To simplify things, we ignore the pre-54.0b11 state and simply treat it the same as Beta
     # with a minimum version of 54.0b11.
-    aurora_floor = parse_version(Product.FIREFOX, AURORA_FIRST_VERSION)
+    aurora_floor = release_index.parse_version(Product.FIREFOX, AURORA_FIRST_VERSION)
     for data in result.values():
         beta = data["first_release"].get("beta")
         if beta is None:
             continue
 
-        if parse_version(Product.FIREFOX, beta["version"]) < aurora_floor:
+        if release_index.parse_version(Product.FIREFOX, beta["version"]) < aurora_floor:
             data["first_release"]["aurora"] = {"version": AURORA_FIRST_VERSION, "build_number": 1}
         else:
             data["first_release"]["aurora"] = beta.copy()
@@ -1238,7 +1903,8 @@ def get_firefox_locales(
     firefox_releases: Releases,
     releases_l10n: dict[shipit_api.common.models.Release, ReleaseL10ns],
     old_product_details: ProductDetails,
-    nightly_releases: typing.List[shipit_api.common.models.NightlyRelease],
+    nightly_first_releases: FirstReleases,
+    release_index: typing.Optional[ReleaseIndex] = None,
 ) -> FirefoxLocales:
     """Generate the first version each locale has been continuously available on
     for each Firefox channel (nightly, aurora, beta, release).
@@ -1247,8 +1913,8 @@ def get_firefox_locales(
     `firefox_history_locales.json`.
     """
 
-    nightly_locales = get_firefox_nightly_locales(nightly_releases)
-    release_locales = get_firefox_release_locales(firefox_releases, releases_l10n, old_product_details)
+    nightly_locales = format_firefox_nightly_locales(nightly_first_releases)
+    release_locales = get_firefox_release_locales(firefox_releases, releases_l10n, old_product_details, release_index)
 
     return merge_or_raise.merge(nightly_locales, release_locales)
 
@@ -1308,45 +1974,398 @@ def run_check(*arg, **kw):
     return cli_common.utils.retry(lambda: cli_common.command.run_check(*arg, **kw))
 
 
-def setup_working_copy(git_branch, git_repo_url, secrets):
-    # Clone/pull latest product details
-    logger.info(f"Getting latest product details from {cli_common.command.hide_secrets(git_repo_url, secrets)}.")
-    if shipit_api.common.config.PRODUCT_DETAILS_DIR.exists():
-        # Checkout the branch we are working on
-        logger.info(f"Checkout {git_branch} branch.")
-        run_check(["git", "checkout", git_branch], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-        run_check(["git", "pull"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-        # make sure checkout is clean by removing changes to existing files
-        run_check(["git", "reset", "--hard", "HEAD"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-        # make sure checkout is clean by removing files which are new
-        run_check(["git", "clean", "-xfd"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-    else:
-        run_check(
-            ["git", "clone", "-b", git_branch, git_repo_url, shipit_api.common.config.PRODUCT_DETAILS_DIR.name],
-            cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR.parent,
-            secrets=secrets,
-        )
-        run_check(["git", "config", "http.postBuffer", "12M"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-        run_check(["git", "config", "user.email", "release-services+robot@mozilla.com"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-        run_check(["git", "config", "user.name", "Release Services Robot"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
+def run_git(git_dir: pathlib.Path, *args: str, input: typing.Optional[bytes] = None, env: typing.Optional[typing.Dict[str, str]] = None) -> bytes:
+    """Run a git command which only works on the local mirror, so there is
+    nothing worth retrying when it fails."""
+    command = ["git", "--git-dir", str(git_dir), *args]
+    process = subprocess.run(command, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    if process.returncode != 0:
+        logger.info(f"Command failed with code: {process.returncode}, {' '.join(command)}, {process.stderr!r}")
+        raise click.ClickException(f"`git {args[0]}` failed with code: {process.returncode}.")
+    return process.stdout
 
 
-async def rebuild(
-    db_session: sqlalchemy.orm.Session,
-    git_branch: str,
-    git_repo_url: str,
-    folder_in_repo: str,
-    breakpoint_version: typing.Optional[int],
-    clean_working_copy: bool = True,
-):
-    secrets = [urllib.parse.urlparse(git_repo_url).password]
+def git_blob_oid(content: bytes) -> str:
+    """The id git gives to a blob with `content`, without having to write it."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
 
-    # Sometimes we want to work from a clean working copy
-    if clean_working_copy and shipit_api.common.config.PRODUCT_DETAILS_DIR.exists():
-        shutil.rmtree(shipit_api.common.config.PRODUCT_DETAILS_DIR)
 
-    setup_working_copy(git_branch, git_repo_url, secrets)
+def list_git_files(git_dir: pathlib.Path, commit: str, folder_in_repo: str) -> typing.Dict[File, str]:
+    """Return the blob ids of the files in `folder_in_repo` at `commit`, keyed
+    by their path relative to that folder."""
+    prefix = folder_in_repo.rstrip("/") + "/"
+    output = run_git(git_dir, "ls-tree", "-r", "-z", "--full-tree", commit, "--", prefix)
+    files = dict()
+    for entry in output.split(b"\0"):
+        if not entry:
+            continue
+        info, path = entry.decode("utf-8").split("\t", 1)
+        _, _, oid = info.split(" ")
+        files[path[len(prefix) :]] = oid
+    return files
+
+
+def read_git_blobs(git_dir: pathlib.Path, oids: typing.List[str]) -> typing.List[bytes]:
+    """Read the content of many blobs with a single git process."""
+    output = run_git(git_dir, "cat-file", "--batch", input="".join(f"{oid}\n" for oid in oids).encode())
+    blobs = []
+    offset = 0
+    for _ in oids:
+        # every blob is preceded by "<oid> <type> <size>\n" and followed by "\n"
+        end = output.index(b"\n", offset)
+        size = int(output[offset:end].rsplit(b" ", 1)[1])
+        blobs.append(output[end + 1 : end + 1 + size])
+        offset = end + 1 + size + 1
+    return blobs
+
+
+def write_git_blobs(git_dir: pathlib.Path, contents: typing.List[bytes]) -> typing.List[str]:
+    """Write blobs to the object database with a single git process."""
+    if not contents:
+        return []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for index, content in enumerate(contents):
+            path = pathlib.Path(tmp_dir, str(index))
+            path.write_bytes(content)
+            paths.append(f"{path}\n")
+        output = run_git(git_dir, "hash-object", "-w", "--no-filters", "--stdin-paths", input="".join(paths).encode())
+    return output.decode().split()
+
+
+def serialize_product_details_file(file_: File, content: typing.Any, json_writer: JSONWriter) -> bytes:
+    if not file_.endswith(".json"):
+        return content.encode("utf-8")
+    return json_writer.dumps(content, sort_keys=(not isinstance(content, collections.OrderedDict)))
+
+
+def commit_product_details(
+    git_dir: pathlib.Path,
+    parent: str,
+    folder_in_repo: str,
+    files: typing.Dict[File, typing.Union[bytes, RawFile]],
+    message: str,
+) -> typing.Tuple[typing.Optional[str], typing.Tuple[int, int, int]]:
+    """Create a commit on top of `parent` where `folder_in_repo` contains exactly `files`.
+
+    The commit is built with git plumbing from the generated contents, there
+    is no working tree. Only the blobs of the files which changed are written.
+    Returns the new commit (None when nothing changed) and the number of
+    written, skipped and deleted files.
+    """
+    prefix = folder_in_repo.rstrip("/") + "/"
+    old_files = list_git_files(git_dir, parent, folder_in_repo)
+
+    changes = dict()
+    to_write = []
+    skipped = 0
+    for file_, content in files.items():
+        oid = content.oid if isinstance(content, RawFile) else git_blob_oid(content)
+        if old_files.get(file_) == oid:
+            skipped += 1
+            continue
+        changes[file_] = oid
+        if not isinstance(content, RawFile):
+            to_write.append(content)
+    deleted = [file_ for file_ in old_files if file_ not in files]
+    counts = (len(changes), skipped, len(deleted))
+
+    if not changes and not deleted:
+        return None, counts
+
+    written = write_git_blobs(git_dir, to_write)
+    assert written == [git_blob_oid(content) for content in to_write], "git and shipit disagree on blob ids"
+
+    index_info = [f"100644 {oid}\t{prefix}{file_}\0" for file_, oid in changes.items()]
+    index_info.extend(f"0 {'0' * 40}\t{prefix}{file_}\0" for file_ in deleted)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ, GIT_INDEX_FILE=os.path.join(tmp_dir, "index"))
+        run_git(git_dir, "read-tree", parent, env=env)
+        run_git(git_dir, "update-index", "-z", "--index-info", input="".join(index_info).encode("utf-8"), env=env)
+        tree = run_git(git_dir, "write-tree", env=env).decode().strip()
+    commit = run_git(git_dir, "commit-tree", tree, "-p", parent, "-m", message).decode().strip()
+    return commit, counts
+
+
+def setup_mirror(git_branch, git_repo_url, secrets) -> str:
+    """Bring the local mirror of the product details repository up to date
+    and return the commit `git_branch` points to."""
+    git_dir = shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR
+    logger.info(f"Getting latest product details from {cli_common.command.hide_secrets(git_repo_url, secrets)}.")
+    if not git_dir.exists():
+        run_check(["git", "init", "--bare", "--quiet", str(git_dir)], secrets=secrets)
+        run_check(["git", "config", "http.postBuffer", "12M"], cwd=git_dir, secrets=secrets)
+        run_check(["git", "config", "user.email", "release-services+robot@mozilla.com"], cwd=git_dir, secrets=secrets)
+        run_check(["git", "config", "user.name", "Release Services Robot"], cwd=git_dir, secrets=secrets)
+    # the url may carry a token which changes over time
+    run_check(["git", "config", "remote.origin.url", git_repo_url], cwd=git_dir, secrets=secrets)
+    run_check(["git", "fetch", "--no-tags", "origin", f"+refs/heads/{git_branch}:refs/heads/{git_branch}"], cwd=git_dir, secrets=secrets)
+    return run_git(git_dir, "rev-parse", f"refs/heads/{git_branch}^{{commit}}").decode().strip()
+
+
+# The context of the rebuild in the processes generating files, it is sent to
+# each of them once, when it starts
+_generation_context: typing.Optional["RebuildContext"] = None
+
+
+def init_generation_process(context: "RebuildContext", settings: typing.Dict[str, typing.Any]) -> None:
+    global _generation_context
+    _generation_context = context
+    # the settings of the rebuild, including the ones changed at runtime
+    for name, value in settings.items():
+        setattr(shipit_api.common.config, name, value)
+    if context.old_product_details_source is not None:
+        # usually from the snapshot the rebuild loaded them from
+        context.old_product_details = load_old_product_details(*context.old_product_details_source)
+    if shipit_api.common.config.PRODUCT_DETAILS_PROFILE is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        # the pool doesn't tell its processes when they generated their last file
+        path = f"{shipit_api.common.config.PRODUCT_DETAILS_PROFILE}.{os.getpid()}"
+        multiprocessing.util.Finalize(None, profiler.dump_stats, (path,), exitpriority=0)
+
+
+def generate_file_in_process(file_: File) -> typing.Tuple[typing.Any, int]:
+    """Generate `file_`, and return it with the number of files this process
+    generated for it: the ones it depends on are generated too, unless this
+    process generated them already."""
+    assert _generation_context is not None
+    generated = _generation_context.generated
+    content = asyncio.run(_generation_context.file(file_))
+    return content, _generation_context.generated - generated
+
+
+def get_l10n_in_process(start: int, stop: int) -> ProductDetails:
+    assert _generation_context is not None
+    releases_l10n = dict(itertools.islice(_generation_context.releases_l10n.items(), start, stop))
+    return get_l10n(_generation_context.all_releases, releases_l10n, {})
+
+
+# Files whose generators fetch data, they are always generated by the process
+# running the rebuild, which holds the HTTP session
+PRODUCT_DETAILS_FETCHED_FILES = {"firefox_versions.json"}
+
+# Generators of each file, keyed by file name, in the order the files are
+# generated. Generators get the other files they are built from through the
+# context, which generates them first when needed.
+PRODUCT_DETAILS_GENERATORS: typing.Dict[File, typing.Callable[["RebuildContext"], typing.Any]] = {
+    "all.json": lambda context: context.releases(
+        [Product.DEVEDITION, Product.FIREFOX, Product.FENIX, Product.FENNEC, Product.THUNDERBIRD]
+    ),  # consider adding `android-components` at some point.
+    "devedition.json": lambda context: context.releases([Product.DEVEDITION]),
+    "firefox.json": lambda context: context.releases([Product.FIREFOX]),
+    "firefox_history_development_releases.json": lambda context: context.release_history(Product.FIREFOX, ProductCategory.DEVELOPMENT),
+    "firefox_history_major_releases.json": lambda context: context.release_history(Product.FIREFOX, ProductCategory.MAJOR),
+    "firefox_history_stability_releases.json": lambda context: context.release_history(Product.FIREFOX, ProductCategory.STABILITY),
+    "firefox_versions.json": lambda context: get_firefox_versions(
+        context.release_index, context.firefox_nightly_version, context.session, context.schedule_cache, context.stats
+    ),
+    "firefox_primary_builds.json": lambda context: context.primary_builds(Product.FIREFOX, "firefox_versions.json"),
+    # `firefox.json` contains all data for both pre and post breakpoint versions,
+    # which is why `firefox_history_locales.json` is generated from it
+    "firefox_history_locales.json": lambda context: context.firefox_locales(),
+    "languages.json": lambda context: get_languages(context.old_product_details),
+    "mobile_android.json": lambda context: context.releases([Product.FENNEC, Product.FENIX, Product.FIREFOX_ANDROID]),
+    "mobile_details.json": lambda context: context.mobile_details(),
+    "mobile_history_development_releases.json": lambda context: context.release_history(Product.FENNEC, ProductCategory.DEVELOPMENT),
+    "mobile_history_major_releases.json": lambda context: context.release_history(Product.FENNEC, ProductCategory.MAJOR),
+    "mobile_history_stability_releases.json": lambda context: context.release_history(Product.FENNEC, ProductCategory.STABILITY),
+    "mobile_versions.json": lambda context: get_mobile_versions(context.release_index, context.firefox_nightly_version),
+    "thunderbird.json": lambda context: context.releases([Product.THUNDERBIRD]),
+    "thunderbird_beta_builds.json": lambda context: get_thunderbird_beta_builds(),
+    "thunderbird_history_development_releases.json": lambda context: context.release_history(Product.THUNDERBIRD, ProductCategory.DEVELOPMENT),
+    "thunderbird_history_major_releases.json": lambda context: context.release_history(Product.THUNDERBIRD, ProductCategory.MAJOR),
+    "thunderbird_history_stability_releases.json": lambda context: context.release_history(Product.THUNDERBIRD, ProductCategory.STABILITY),
+    "thunderbird_versions.json": lambda context: get_thunderbird_versions(context.release_index, context.thunderbird_nightly_version),
+    "thunderbird_primary_builds.json": lambda context: context.primary_builds(Product.THUNDERBIRD, "thunderbird_versions.json"),
+}
+
+
+@dataclasses.dataclass
+class RebuildContext:
+    """The inputs of a rebuild, shared by all the generators, and what they
+    compute once for all of them.
+
+    Each file of PRODUCT_DETAILS_GENERATORS is generated at most once, the first
+    time it is asked for, either by the rebuild or by the generator of another
+    file. The files which are not affected by what triggered the rebuild are
+    taken from the previous build instead.
+    """
 
+    session: aiohttp.ClientSession
+    breakpoint_version: int
+    all_releases: typing.List[shipit_api.common.models.Release]
+    release_index: ReleaseIndex
+    old_product_details: ProductDetails
+    releases_l10n: typing.Dict[shipit_api.common.models.Release, ReleaseL10ns]
+    combined_l10n: typing.Dict[shipit_api.common.models.Release, ReleaseL10ns]
+    firefox_nightly_version: str
+    thunderbird_nightly_version: str
+    firefox_nightly_first_releases: FirstReleases
+    affected_files: typing.Optional[typing.Set[File]] = None
+    schedule_cache: typing.Optional[CacheStore] = None
+    stats: typing.Optional[RebuildStats] = None
+    # the git directory, commit and folder old_product_details are loaded from,
+    # if they can be loaded again
+    old_product_details_source: typing.Optional[typing.Tuple[pathlib.Path, str, str]] = None
+    generated: int = 0
+    reused: int = 0
+    _files: typing.Dict[File, typing.Any] = dataclasses.field(default_factory=dict)
+    _product_releases: typing.Dict[Product, typing.Dict[str, ReleaseDetails]] = dataclasses.field(default_factory=dict)
+
+    def is_reused(self, file_: File) -> bool:
+        """Whether none of the inputs of `file_` changed since the previous build."""
+        return self.affected_files is not None and file_ not in self.affected_files and f"1.0/{file_}" in self.old_product_details
+
+    async def file(self, file_: File) -> typing.Any:
+        if file_ not in self._files:
+            if self.is_reused(file_):
+                # reuse it as it was published (including its key ordering)
+                content = collections.OrderedDict(self.old_product_details[f"1.0/{file_}"])
+                self.reused += 1
+            else:
+                content = PRODUCT_DETAILS_GENERATORS[file_](self)
+                if inspect.isawaitable(content):
+                    content = await content
+                self.generated += 1
+            self._files[file_] = content
+        return self._files[file_]
+
+    async def generate(self, jobs: int = 1) -> ProductDetails:
+        """Generate all the files of product details but the index pages.
+
+        With more than one job, the files which don't fetch anything and the
+        l10n files are generated by `jobs` processes, which get a copy of the
+        context when they start. They load the old product details from
+        `old_product_details_source` when it is set, instead of getting a copy
+        of them. Each process generates the files the ones it is given depend
+        on again, unless it generated them already, and they count in
+        `generated`.
+        """
+        if jobs > 1:
+            await self.prefetch()
+            pending = [file_ for file_ in PRODUCT_DETAILS_GENERATORS if file_ not in self._files and not self.is_reused(file_)]
+            l10n_chunk = max(1, math.ceil(len(self.releases_l10n) / jobs))
+            loop = asyncio.get_running_loop()
+            settings = {name: value for name, value in vars(shipit_api.common.config).items() if name.isupper()}
+            # the processes are started from a new interpreter: forking this one
+            # isn't safe, with the threads and connections it has open
+            mp_context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+            executor = concurrent.futures.ProcessPoolExecutor(jobs, mp_context, init_generation_process, (self, settings))
+            try:
+                files = [loop.run_in_executor(executor, generate_file_in_process, file_) for file_ in pending]
+                l10n = [
+                    loop.run_in_executor(executor, get_l10n_in_process, start, start + l10n_chunk) for start in range(0, len(self.releases_l10n), l10n_chunk)
+                ]
+                try:
+                    for file_, (content, generated) in zip(pending, await asyncio.gather(*files)):
+                        self._files[file_] = content
+                        self.generated += generated
+                    l10n_chunks = await asyncio.gather(*l10n)
+                finally:
+                    # when one of them fails, the other ones are cancelled and
+                    # their exceptions are retrieved
+                    for future in files + l10n:
+                        future.cancel()
+                    await asyncio.gather(*files, *l10n, return_exceptions=True)
+            finally:
+                # waiting for the processes to exit doesn't block the event loop
+                await asyncio.to_thread(executor.shutdown, cancel_futures=True)
+        else:
+            l10n_chunks = [get_l10n(self.all_releases, self.releases_l10n, {})]
+
+        product_details: ProductDetails = {file_: await self.file(file_) for file_ in PRODUCT_DETAILS_GENERATORS}
+        product_details.update(get_regions(self.old_product_details))
+        # the l10n files of the previous build come first, updated with the ones generated
+        product_details.update(get_l10n(self.all_releases, {}, self.old_product_details))
+        for l10n_chunk in l10n_chunks:
+            product_details.update(l10n_chunk)
+        return product_details
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # what only the files fetching data use stays in the process running
+        # the rebuild, which generates them
+        state = dict(self.__dict__, session=None, schedule_cache=None, stats=None)
+        if self.old_product_details_source is not None:
+            # the largest input, loaded again by the processes generating files
+            state["old_product_details"] = None
+        return state
+
+    async def prefetch(self) -> None:
+        """Generate the files which fetch data, so that their fetches run
+        alongside the ones of the l10n changesets. The releases_l10n and
+        combined_l10n of the context aren't used by their generators, they may
+        still be empty."""
+        for file_ in PRODUCT_DETAILS_FETCHED_FILES:
+            await self.file(file_)
+
+    def releases(self, products: Products) -> Releases:
+        details = dict()
+        for product in products:
+            if product not in self._product_releases:
+                self._product_releases[product] = get_product_releases(self.breakpoint_version, product, self.release_index, self.old_product_details)
+            details.update(self._product_releases[product])
+        return dict(releases=details)
+
+    def release_history(self, product: Product, product_category: ProductCategory) -> ReleasesHistory:
+        return get_release_history(self.breakpoint_version, product, product_category, self.release_index, self.old_product_details)
+
+    async def primary_builds(self, product: Product, versions_file: File) -> PrimaryBuilds:
+        product_versions = typing.cast(typing.Union[FirefoxVersions, ThunderbirdVersions], await self.file(versions_file))
+        return get_primary_builds(self.breakpoint_version, product, self.release_index, self.combined_l10n, self.old_product_details, product_versions)
+
+    async def firefox_locales(self) -> FirefoxLocales:
+        firefox_releases = typing.cast(Releases, await self.file("firefox.json"))
+        return get_firefox_locales(firefox_releases, self.releases_l10n, self.old_product_details, self.firefox_nightly_first_releases, self.release_index)
+
+    async def mobile_details(self) -> MobileDetails:
+        mobile_versions = typing.cast(MobileVersions, await self.file("mobile_versions.json"))
+        return get_mobile_details(self.release_index, self.firefox_nightly_version, mobile_versions)
+
+
+@dataclasses.dataclass
+class DatabaseUpdates:
+    """What a rebuild fetched which is stored in the database once the product
+    details are published, so that the next rebuilds don't fetch it again."""
+
+    releases_l10n: typing.List[typing.Tuple[shipit_api.common.models.Release, typing.Optional[ReleaseL10ns]]] = dataclasses.field(default_factory=list)
+    nightly_first_releases: typing.List[NightlyFirstReleasesState] = dataclasses.field(default_factory=list)
+
+
+def store_database_updates(db_session: sqlalchemy.orm.Session, updates: DatabaseUpdates, stats: RebuildStats) -> None:
+    # the releases are shipped, their l10n changesets are final
+    stats.count("l10n_stored", store_releases_l10n_changesets(db_session, updates.releases_l10n))
+    # best effort too: the next rebuild applies the nightly builds added since
+    # the stored first releases
+    for state in updates.nightly_first_releases:
+        try:
+            store_nightly_first_releases(db_session, state)
+        except Exception:
+            logger.exception(f"Failed to store the first releases of {state.product} {state.channel} {state.buildid}")
+            db_session.rollback()
+
+
+async def generate_product_details(
+    db_session: sqlalchemy.orm.Session,
+    git_dir: pathlib.Path,
+    head: str,
+    folder_in_repo: str,
+    breakpoint_version: typing.Optional[int],
+    triggers: typing.Optional[typing.Sequence[typing.Optional[RebuildTrigger]]],
+    raise_on_failure: bool,
+    stats: RebuildStats,
+    jobs: typing.Optional[int] = None,
+) -> typing.Tuple[typing.Dict[File, typing.Union[bytes, RawFile]], DatabaseUpdates]:
+    """Generate the content of `folder_in_repo` from the database and from the
+    product details at `head` in the local mirror, serialized and ready to be
+    committed. Files are generated by `jobs` processes, PRODUCT_DETAILS_JOBS by
+    default.
+
+    Nothing is written to the database, what is worth storing once the product
+    details are published is returned along with them.
+    """
+    if jobs is None:
+        jobs = shipit_api.common.config.PRODUCT_DETAILS_JOBS
     # XXX: we need to implement how to figure out breakpoint_version from old_product_details
     # if breakpoint_version is not provided we should figure it out from old_product_details
     # and if we can not figure it out we should use shipit_api.common.config.BREAKPOINT_VERSION
@@ -1355,175 +2374,217 @@ async def rebuild(
         breakpoint_version = shipit_api.common.config.BREAKPOINT_VERSION
     logger.info(f"Breakpoint version is {breakpoint_version}")
 
-    # get data from older product-details
-    logger.info(f"Reading old product details from {shipit_api.common.config.PRODUCT_DETAILS_DIR / folder_in_repo}")
-    old_product_details = get_old_product_details(shipit_api.common.config.PRODUCT_DETAILS_DIR / folder_in_repo)
-
-    # get all the releases from the database from (including)
-    # breakpoint_version on
-    logger.info("Getting old releases from the database")
-    releases = get_releases_from_db(db_session, breakpoint_version)
-
-    # get the current nightly version from the database
-    logger.info("Getting the current nightly version from the database")
-    firefox_nightly_version = get_product_channel_version(db_session, "firefox", "nightly")
-    thunderbird_nightly_version = get_product_channel_version(db_session, "thunderbird", "nightly")
-
-    # get all firefox nightly builds (with their locales) for firefox_history_locales.json
-    logger.info("Getting firefox nightly releases from the database")
-    firefox_nightly_releases = get_nightly_releases_from_db(db_session, "firefox", "nightly")
-
-    # Also fetch latest nightly builds with their L10N info
-    nightly_builds = [
-        shipit_api.common.models.Release(
-            product=Product.FIREFOX.value,
-            version=firefox_nightly_version,
-            branch="mozilla-central",
-            revision="default",
-            build_number=None,
-            release_eta=None,
-            partial_updates=None,
-            status=None,
-        ),
-        shipit_api.common.models.Release(
-            product=Product.THUNDERBIRD.value,
-            version=thunderbird_nightly_version,
-            branch="comm-central",
-            revision="default",
-            build_number=None,
-            release_eta=None,
-            partial_updates=None,
-            status=None,
-        ),
-    ]
-    logger.info("Getting locales from hg.mozilla.org for each release from database")
-    # use limit_per_host=50 since hg.mozilla.org doesn't like too many connections
-    headers = {"User-Agent": "ship-it"}
-    async with aiohttp.ClientSession(headers=headers, connector=aiohttp.TCPConnector(limit_per_host=50), timeout=aiohttp.ClientTimeout(total=30)) as session:
-        # XXX: for some reason we didn't generate l10n for devedition in old_product_details
-        # However, we do need to include devedition releases if there's no corresponding firefox
-        # release, to populate firefox_primary_builds.json
-        missing_releases = [release for release in releases if f"1.0/l10n/{release.name}.json".replace("Devedition", "Firefox") not in old_product_details]
-        raise_on_failure = git_branch in ["production", "staging"]
-        releases_l10n = await asyncio.gather(*[fetch_l10n_data(session, release, raise_on_failure) for release in missing_releases])
-        nightly_l10n = await asyncio.gather(*[fetch_l10n_data(session, release, raise_on_failure) for release in nightly_builds])
-
-    releases_l10n = {release: changeset for (release, changeset) in releases_l10n if changeset is not None}
-    nightly_l10n = {release: changeset for (release, changeset) in nightly_l10n if changeset is not None}
-
-    combined_releases = releases + nightly_builds
-    combined_l10n = releases_l10n.copy()
-    combined_l10n.update(nightly_l10n)
-
-    # `firefox_releases` contains all data for both pre and post breakpoint versions
-    # this information is published in `firefox.json` and is also needed to create
-    # `firefox_history_locales.json`, so we pull it into an intermediate variable
-    # (unlike all of the other data below, which is only used for creation of a single
-    # file.)
-    firefox_releases = get_releases(breakpoint_version, [Product.FIREFOX], releases, old_product_details)
-
-    # combine old and new data
-    product_details: ProductDetails = {
-        "all.json": get_releases(
-            breakpoint_version,
-            [Product.DEVEDITION, Product.FIREFOX, Product.FENIX, Product.FENNEC, Product.THUNDERBIRD],
-            releases,
-            old_product_details,
-        ),  # consider adding `android-components` at some point.
-        "devedition.json": get_releases(breakpoint_version, [Product.DEVEDITION], releases, old_product_details),
-        "firefox.json": firefox_releases,
-        "firefox_history_development_releases.json": get_release_history(
-            breakpoint_version, Product.FIREFOX, ProductCategory.DEVELOPMENT, releases, old_product_details
-        ),
-        "firefox_history_major_releases.json": get_release_history(breakpoint_version, Product.FIREFOX, ProductCategory.MAJOR, releases, old_product_details),
-        "firefox_history_stability_releases.json": get_release_history(
-            breakpoint_version, Product.FIREFOX, ProductCategory.STABILITY, releases, old_product_details
-        ),
-        "firefox_primary_builds.json": await get_primary_builds(
-            breakpoint_version, Product.FIREFOX, combined_releases, combined_l10n, old_product_details, firefox_nightly_version, thunderbird_nightly_version
-        ),
-        "firefox_versions.json": await get_firefox_versions(releases, firefox_nightly_version),
-        "firefox_history_locales.json": get_firefox_locales(firefox_releases, releases_l10n, old_product_details, firefox_nightly_releases),
-        "languages.json": get_languages(old_product_details),
-        "mobile_android.json": get_releases(breakpoint_version, [Product.FENNEC, Product.FENIX, Product.FIREFOX_ANDROID], releases, old_product_details),
-        "mobile_details.json": get_mobile_details(releases, firefox_nightly_version),
-        "mobile_history_development_releases.json": get_release_history(
-            breakpoint_version, Product.FENNEC, ProductCategory.DEVELOPMENT, releases, old_product_details
-        ),
-        "mobile_history_major_releases.json": get_release_history(breakpoint_version, Product.FENNEC, ProductCategory.MAJOR, releases, old_product_details),
-        "mobile_history_stability_releases.json": get_release_history(
-            breakpoint_version, Product.FENNEC, ProductCategory.STABILITY, releases, old_product_details
-        ),
-        "mobile_versions.json": get_mobile_versions(releases, firefox_nightly_version),
-        "thunderbird.json": get_releases(breakpoint_version, [Product.THUNDERBIRD], releases, old_product_details),
-        "thunderbird_beta_builds.json": get_thunderbird_beta_builds(),
-        "thunderbird_history_development_releases.json": get_release_history(
-            breakpoint_version, Product.THUNDERBIRD, ProductCategory.DEVELOPMENT, releases, old_product_details
-        ),
-        "thunderbird_history_major_releases.json": get_release_history(
-            breakpoint_version, Product.THUNDERBIRD, ProductCategory.MAJOR, releases, old_product_details
-        ),
-        "thunderbird_history_stability_releases.json": get_release_history(
-            breakpoint_version, Product.THUNDERBIRD, ProductCategory.STABILITY, releases, old_product_details
-        ),
-        "thunderbird_primary_builds.json": await get_primary_builds(
-            breakpoint_version, Product.THUNDERBIRD, combined_releases, combined_l10n, old_product_details, firefox_nightly_version, thunderbird_nightly_version
-        ),
-        "thunderbird_versions.json": get_thunderbird_versions(releases, thunderbird_nightly_version),
-    }
-
-    product_details.update(get_regions(old_product_details))
-    product_details.update(get_l10n(releases, releases_l10n, old_product_details))
+    # figure out which files need to be generated again, based on what triggered
+    # this rebuild
+    affected_files = get_affected_files(merge_rebuild_inputs(triggers))
+    if affected_files is None:
+        logger.info("Rebuilding all product details")
+    else:
+        logger.info(f"Rebuilding product details affected by {triggers}: {sorted(affected_files)}")
+
+    # the inputs are loaded as a pipeline: the old product details are read from
+    # disk and the database is queried in threads, while the fetches start as
+    # soon as what they need is known
+    def read_old_product_details() -> ProductDetails:
+        logger.info(f"Reading old product details from {folder_in_repo} at {head}")
+        with stats.stage("old_product_details"):
+            return load_old_product_details(git_dir, head, folder_in_repo)
+
+    def query_database(query: typing.Callable[..., typing.Any], *args: typing.Any) -> typing.Any:
+        with stats.stage("database"):
+            return query(db_session, *args)
+
+    def get_nightly_versions(db_session: sqlalchemy.orm.Session) -> typing.Tuple[str, str]:
+        # get the current nightly version from the database
+        logger.info("Getting the current nightly version from the database")
+        return get_product_channel_version(db_session, "firefox", "nightly"), get_product_channel_version(db_session, "thunderbird", "nightly")
+
+    def get_releases(db_session: sqlalchemy.orm.Session) -> typing.Tuple[typing.List[shipit_api.common.models.Release], NightlyFirstReleasesState]:
+        # get all the releases from the database from (including)
+        # breakpoint_version on
+        logger.info("Getting old releases from the database")
+        releases = get_releases_from_db(db_session, breakpoint_version)
+        # get the first nightly build of each locale for firefox_history_locales.json
+        logger.info("Getting the first releases of firefox nightly locales from the database")
+        return releases, get_nightly_first_releases_from_db(db_session, "firefox", "nightly")
+
+    scheduler = create_fetch_scheduler()
+    # a single HTTP session for all the requests of the rebuild
+    async with create_hg_session() as session, contextlib.AsyncExitStack() as stack:
+        l10n_cache = stack.enter_context(open_l10n_cache())
+        old_product_details_task = asyncio.ensure_future(asyncio.to_thread(read_old_product_details))
+        fetch_tasks: typing.List[asyncio.Future] = []
+        try:
+            firefox_nightly_version, thunderbird_nightly_version = await asyncio.to_thread(query_database, get_nightly_versions)
+
+            # Also fetch latest nightly builds with their L10N info
+            nightly_builds = [
+                shipit_api.common.models.Release(
+                    product=Product.FIREFOX.value,
+                    version=firefox_nightly_version,
+                    branch="mozilla-central",
+                    revision="default",
+                    build_number=None,
+                    release_eta=None,
+                    partial_updates=None,
+                    status=None,
+                ),
+                shipit_api.common.models.Release(
+                    product=Product.THUNDERBIRD.value,
+                    version=thunderbird_nightly_version,
+                    branch="comm-central",
+                    revision="default",
+                    build_number=None,
+                    release_eta=None,
+                    partial_updates=None,
+                    status=None,
+                ),
+            ]
+            nightly_l10n_task = asyncio.gather(*[fetch_l10n_data(session, release, raise_on_failure, l10n_cache, scheduler) for release in nightly_builds])
+            fetch_tasks.append(nightly_l10n_task)
+
+            releases, firefox_nightly_state = await asyncio.to_thread(query_database, get_releases)
+            old_product_details = await old_product_details_task
+
+            # XXX: for some reason we didn't generate l10n for devedition in old_product_details
+            # However, we do need to include devedition releases if there's no corresponding firefox
+            # release, to populate firefox_primary_builds.json
+            missing_releases = [release for release in releases if f"1.0/l10n/{release.name}.json".replace("Devedition", "Firefox") not in old_product_details]
+            stored_l10n = await asyncio.to_thread(query_database, get_releases_l10n_from_db, missing_releases)
+            missing_releases = [release for release in missing_releases if release not in stored_l10n]
+            stats.count("releases", len(releases))
+            stats.count("stored_l10n", len(stored_l10n))
+
+            context = RebuildContext(
+                session=session,
+                breakpoint_version=breakpoint_version,
+                all_releases=releases,
+                # parse and classify all the releases once, for all the generators
+                release_index=ReleaseIndex(releases, nightly_builds),
+                old_product_details=old_product_details,
+                # filled in below, once fetched
+                releases_l10n={},
+                combined_l10n={},
+                firefox_nightly_version=firefox_nightly_version,
+                thunderbird_nightly_version=thunderbird_nightly_version,
+                firefox_nightly_first_releases=firefox_nightly_state.first_releases,
+                affected_files=affected_files,
+                schedule_cache=stack.enter_context(open_release_schedule_cache()),
+                stats=stats,
+                old_product_details_source=(git_dir, head, folder_in_repo),
+            )
+            # the files fetching data don't depend on the l10n changesets
+            prefetch_task = asyncio.ensure_future(context.prefetch())
+            fetch_tasks.append(prefetch_task)
+
+            logger.info(f"Getting locales from hg.mozilla.org for {len(missing_releases)} releases, {len(stored_l10n)} releases had them stored")
+            with stats.stage("l10n_fetch"):
+                releases_l10n = await fetch_releases_l10n(
+                    session, missing_releases, raise_on_failure, l10n_cache, scheduler, dedupe=shipit_api.common.config.PRODUCT_DETAILS_L10N_DEDUPE
+                )
+                nightly_l10n = await nightly_l10n_task
+            await prefetch_task
+        finally:
+            # nothing is left running once the rebuild is over, in particular
+            # not the thread reading the old product details
+            for task in fetch_tasks:
+                task.cancel()
+            await asyncio.gather(old_product_details_task, *fetch_tasks, return_exceptions=True)
+
+        context.releases_l10n = {release: changeset for (release, changeset) in releases_l10n if changeset is not None}
+        context.releases_l10n.update(stored_l10n)
+        context.combined_l10n = context.releases_l10n.copy()
+        context.combined_l10n.update({release: changeset for (release, changeset) in nightly_l10n if changeset is not None})
+
+        with stats.stage("generate"):
+            product_details = await context.generate(jobs)
+            logger.info(f"Generated {context.generated} files, reused {context.reused} files from the previous build")
+    stats.count("files_generated", context.generated)
+    stats.count("files_reused", context.reused)
 
     #  add '1.0/' in front of each file path
     product_details = {f"1.0/{file_}": content for file_, content in product_details.items()}
 
     # create index.html for every folder
-    product_details = create_index_listing(product_details)
+    with stats.stage("index"):
+        product_details = create_index_listing(product_details, list_git_files(git_dir, head, folder_in_repo))
 
     # run sanity checks
-    sanity_checks(product_details)
-
-    if shipit_api.common.config.PRODUCT_DETAILS_NEW_DIR.exists():
-        shutil.rmtree(shipit_api.common.config.PRODUCT_DETAILS_NEW_DIR)
-
-    for file__, content in product_details.items():
-        new_file = shipit_api.common.config.PRODUCT_DETAILS_NEW_DIR / file__
+    with stats.stage("sanity_checks"):
+        sanity_checks(product_details)
+
+    json_writer = get_json_writer(shipit_api.common.config.PRODUCT_DETAILS_JSON_WRITER)
+    with stats.stage("serialize"):
+        files = {
+            file_: content if isinstance(content, RawFile) else serialize_product_details_file(file_, content, json_writer)
+            for file_, content in product_details.items()
+        }
 
-        # we must ensure that all needed folders exists
-        os.makedirs(new_file.parent, exist_ok=True)
+    l10n_cache.log_stats("l10n")
+    scheduler.log_stats("hg.mozilla.org fetches")
+    stats.count("l10n_fetched", len(missing_releases))
+    stats.count("l10n_cache_hits", l10n_cache.hits)
+    stats.count("l10n_cache_misses", l10n_cache.misses)
+    stats.count("fetches", len(scheduler.latencies))
+    stats.count("fetch_congestions", scheduler.congestions)
+    return files, DatabaseUpdates(releases_l10n=releases_l10n, nightly_first_releases=[firefox_nightly_state])
 
-        # write content into json file
-        with new_file.open("w+") as f:
-            if new_file.suffix == ".json":
-                f.write(json.dumps(content, sort_keys=(not isinstance(content, collections.OrderedDict)), indent=4))
-            else:
-                f.write(content)
-
-    # remove all top level items in folder_in_repo
-    for item in os.listdir(shipit_api.common.config.PRODUCT_DETAILS_DIR / folder_in_repo):
-        item = shipit_api.common.config.PRODUCT_DETAILS_DIR / folder_in_repo / item
-        if item.exists():
-            if item.is_dir():
-                shutil.rmtree(item)
-            else:
-                os.unlink(item)
 
-    # Move new files to be committed
-    for item in os.listdir(shipit_api.common.config.PRODUCT_DETAILS_NEW_DIR):
-        shutil.move(shipit_api.common.config.PRODUCT_DETAILS_NEW_DIR / item, shipit_api.common.config.PRODUCT_DETAILS_DIR / folder_in_repo / item)
+async def rebuild(
+    db_session: sqlalchemy.orm.Session,
+    git_branch: str,
+    git_repo_url: str,
+    folder_in_repo: str,
+    breakpoint_version: typing.Optional[int],
+    clean_working_copy: bool = True,
+    triggers: typing.Optional[typing.Sequence[typing.Optional[RebuildTrigger]]] = None,
+    jobs: typing.Optional[int] = None,
+) -> RebuildStats:
+    secrets = [urllib.parse.urlparse(git_repo_url).password]
+    stats = RebuildStats()
+
+    # Sometimes we want to work from a clean mirror
+    git_dir = shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR
+    with stats.stage("mirror"):
+        if clean_working_copy and git_dir.exists():
+            shutil.rmtree(git_dir)
+        head = setup_mirror(git_branch, git_repo_url, secrets)
+
+    raise_on_failure = git_branch in ["production", "staging"]
+    files, updates = await generate_product_details(db_session, git_dir, head, folder_in_repo, breakpoint_version, triggers, raise_on_failure, stats, jobs)
+
+    # XXX: we need a better commit message, maybe mention what triggered this update
+    commit_message = "Updating product details"
+    with stats.stage("commit"):
+        commit, (written, skipped, deleted) = commit_product_details(git_dir, head, folder_in_repo, files, commit_message)
+    logger.info(f"Product details: {written} files written, {skipped} unchanged files skipped, {deleted} files deleted")
+    stats.count("files", len(files))
+    stats.count("files_written", written)
+    stats.count("files_skipped", skipped)
+    stats.count("files_deleted", deleted)
+
+    if commit is not None:
+        with stats.stage("push"):
+            git_push(git_branch, commit, secrets)
+            run_git(git_dir, "update-ref", f"refs/heads/{git_branch}", commit, head)
+        with stats.stage("snapshot"):
+            # the next rebuild starts from what was just pushed, parse it the same way
+            # it would be parsed from the repository
+            new_old_product_details = {
+                file_: content if isinstance(content, RawFile) else make_old_product_details_entry(git_blob_oid(content), file_, lambda: json.loads(content))
+                for file_, content in files.items()
+                if file_.endswith(".json")
+            }
+            save_old_product_details_snapshot(commit, folder_in_repo, new_old_product_details)
 
-    # Add, commit and push changes
-    run_check(["git", "add", "."], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
+    # only what was published is stored, the push raises when it fails
+    with stats.stage("store"):
+        store_database_updates(db_session, updates, stats)
 
-    # check if there is something to commit
-    output = run_check(["git", "status", "--short"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-    if output != b"":
-        # XXX: we need a better commit message, maybe mention what triggered this update
-        commit_message = "Updating product details"
-        run_check(["git", "commit", "-m", commit_message], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
-        git_push(git_branch, secrets)
+    stats.log_summary("Product details rebuild")
+    return stats
 
 
-def git_push(git_branch, secrets):
-    run_check(["git", "push", "origin", git_branch], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR, secrets=secrets)
+def git_push(git_branch, commit, secrets):
+    # commit is a child of the fetched head, anything else than a fast-forward is refused
+    run_check(["git", "push", "origin", f"{commit}:refs/heads/{git_branch}"], cwd=shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR, secrets=secrets)
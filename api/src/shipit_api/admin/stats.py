@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import contextlib
+import json
+import logging
+import pathlib
+import sys
+import time
+import typing
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_peak_rss() -> typing.Optional[int]:
+    """The peak resident set size of this process in bytes, if the platform reports it."""
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, the other platforms report kilobytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RebuildStats:
+    """The wall clock and CPU time spent in each stage of a rebuild, counts
+    of what it went through, and gauges of the state it found (eg: the age of
+    cached data it used).
+
+    Stages are timed in the order they ran; a stage entered more than once
+    adds up. The CPU time is the one of the whole process, which includes
+    the work of other threads running during the stage.
+    """
+
+    def __init__(self) -> None:
+        self.stages: typing.Dict[str, typing.Dict[str, float]] = {}
+        self.counts: typing.Dict[str, int] = {}
+        self.gauges: typing.Dict[str, float] = {}
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+            stage["wall"] += time.perf_counter() - start
+            stage["cpu"] += time.process_time() - start_cpu
+
+    def count(self, name: str, value: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        """Record the last value of `name`, unlike counts gauges don't add up."""
+        self.gauges[name] = value
+
+    def summary(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "wall": round(time.perf_counter() - self._start, 6),
+            "cpu": round(time.process_time() - self._start_cpu, 6),
+            "peak_rss": get_peak_rss(),
+            "stages": {name: {key: round(value, 6) for key, value in stage.items()} for name, stage in self.stages.items()},
+            "counts": dict(self.counts),
+            "gauges": dict(self.gauges),
+        }
+
+    def log_summary(self, name: str) -> None:
+        summary = self.summary()
+        stages = ", ".join(f"{stage} {times['wall']:.3f}s ({times['cpu']:.3f}s CPU)" for stage, times in summary["stages"].items())
+        counts = ", ".join(f"{count} {value}" for count, value in [*summary["counts"].items(), *summary["gauges"].items()])
+        peak_rss = "unknown" if summary["peak_rss"] is None else f"{summary['peak_rss'] // (1024 * 1024)} MiB"
+        logger.info(
+            f"{name}: {summary['wall']:.3f}s ({summary['cpu']:.3f}s CPU), peak RSS {peak_rss}; stages: {stages}; counts: {counts}",
+            extra={"rebuild_stats": summary},
+        )
+
+    def write_report(self, path: pathlib.Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w") as f:
+            json.dump(self.summary(), f, indent=4)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Helpers shared by the tools running product details rebuilds outside of the
+worker: the comparison of variants, and the benchmark in the tests."""
+
+import contextlib
+import typing
+
+import shipit_api.common.config
+
+
+@contextlib.contextmanager
+def override_config(**values: typing.Any) -> typing.Iterator[None]:
+    """Change settings of shipit_api.common.config, and restore them on exit."""
+    old_values = {name: getattr(shipit_api.common.config, name) for name in values}
+    for name, value in values.items():
+        setattr(shipit_api.common.config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old_values.items():
+            setattr(shipit_api.common.config, name, value)
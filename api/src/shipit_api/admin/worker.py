@@ -3,37 +3,179 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import asyncio
+import json
 import logging
+import typing
+from datetime import datetime, timezone
 
 import click
 import flask
 
 from cli_common.pulse import create_consumer, run_consumer
-from shipit_api.admin.product_details import rebuild
-from shipit_api.common.config import BREAKPOINT_VERSION, PROJECT_NAME, PULSE_ROUTE_REBUILD_PRODUCT_DETAILS
+from shipit_api.admin.product_details import RebuildTrigger, rebuild
+from shipit_api.common.config import (
+    BREAKPOINT_VERSION,
+    PRODUCT_DETAILS_JOBS,
+    PRODUCT_DETAILS_REBUILD_DEBOUNCE,
+    PROJECT_NAME,
+    PULSE_ROUTE_REBUILD_PRODUCT_DETAILS,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def rebuild_product_details(git_repo_url, folder_in_repo, app_channel, breakpoint_version):
+def get_rebuild_trigger(body):
+    """Extract what triggered the rebuild from a pulse message, if anything."""
+    try:
+        payload = json.loads(body)["payload"]
+    except (ValueError, KeyError, TypeError):
+        logger.info("Could not read the rebuild trigger from the pulse message.")
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def get_message_sent_at(body) -> datetime:
+    """When the pulse message was sent, or now if the message doesn't say."""
+    try:
+        sent = json.loads(body)["_meta"]["sent"]
+        # messages are sent with a naive UTC timestamp
+        return datetime.fromisoformat(sent).replace(tzinfo=timezone.utc)
+    except (ValueError, KeyError, TypeError):
+        return datetime.now(timezone.utc)
+
+
+class RebuildQueue:
+    """Run the rebuilds of product details one at a time, and merge all the
+    triggers received while a rebuild is running into a single rebuild.
+
+    A trigger which doesn't say what changed (None) needs a full rebuild, which
+    covers all the other triggers. With a debounce window, every rebuild waits
+    that many seconds for more triggers before starting. A failed rebuild is
+    retried with its triggers after `retry_delay` seconds, doubled after every
+    failure in a row up to `max_retry_delay`. If the queue is cancelled or
+    interrupted, the next trigger starts it again. The time between a
+    trigger being sent and product details being published is logged for
+    every rebuild, and kept in `lags`.
+    """
+
+    def __init__(
+        self,
+        rebuild: typing.Callable[[typing.Optional[typing.List[RebuildTrigger]]], typing.Awaitable[None]],
+        debounce: float = 0,
+        retry_delay: float = 10,
+        max_retry_delay: float = 600,
+    ):
+        self.rebuild = rebuild
+        self.debounce = debounce
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.failures = 0
+        self.triggers: typing.Optional[typing.List[RebuildTrigger]] = []
+        self.sent_at: typing.List[datetime] = []
+        self.lags: typing.List[float] = []
+        self.rebuilds = 0
+        self._pending = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def put(self, trigger: typing.Optional[RebuildTrigger], sent_at: datetime) -> None:
+        self.add([trigger] if trigger is not None else None, [sent_at])
+        self._pending.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    def add(self, triggers: typing.Optional[typing.List[RebuildTrigger]], sent_at: typing.List[datetime]) -> None:
+        if triggers is None or self.triggers is None:
+            self.triggers = None
+        else:
+            self.triggers.extend(triggers)
+        self.sent_at.extend(sent_at)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await self._pending.wait()
+                if self.failures:
+                    await asyncio.sleep(min(self.retry_delay * 2 ** (self.failures - 1), self.max_retry_delay))
+                elif self.debounce:
+                    await asyncio.sleep(self.debounce)
+                await self.run_once()
+        except BaseException:
+            # cancelled, or interrupted: the next trigger starts the queue again
+            logger.exception("Stopped rebuilding product details")
+            raise
+        finally:
+            self._task = None
+
+    async def run_once(self) -> None:
+        self._pending.clear()
+        triggers, sent_at = self.triggers, self.sent_at
+        self.triggers, self.sent_at = [], []
+        logger.info(f"Rebuilding product details for {len(sent_at)} pulse messages")
+        try:
+            await self.rebuild(triggers)
+        except BaseException as e:
+            # the messages are acknowledged already, keep their triggers for the next rebuild
+            self.add(triggers, sent_at)
+            self.failures += 1
+            self._pending.set()
+            if not isinstance(e, Exception):
+                raise
+            logger.exception("Failed to rebuild product details")
+            return
+        self.failures = 0
+
+        now = datetime.now(timezone.utc)
+        lags = [(now - sent).total_seconds() for sent in sent_at]
+        self.lags.extend(lags)
+        self.rebuilds += 1
+        logger.info(
+            f"Product details rebuilt for {len(lags)} pulse messages, published {max(lags):.1f}s after the oldest one was sent",
+            extra={"rebuild_messages": len(lags), "publish_lag": max(lags)},
+        )
+
+
+def rebuild_product_details(git_repo_url, folder_in_repo, app_channel, breakpoint_version, debounce=0, jobs=1):
     """Rebuild product details."""
     logger.debug("Rebuilding product details")
+    # The first rebuild of the worker always regenerates everything, since the
+    # configuration (ESR versions, etc.) may have changed since the product
+    # details we start from were published. Only later rebuilds are partial.
+    full_rebuild_done = False
 
-    async def rebuild_product_details_async(channel, body, envelope, properties):
-        await channel.basic_client_ack(delivery_tag=envelope.delivery_tag)
-        logger.info("Marked pulse message as acknowledged.")
+    async def rebuild_product_details_async(triggers):
+        nonlocal full_rebuild_done
         try:
-            await rebuild(flask.current_app.db.session, app_channel, git_repo_url, folder_in_repo, breakpoint_version)
+            await rebuild(
+                flask.current_app.db.session,
+                app_channel,
+                git_repo_url,
+                folder_in_repo,
+                breakpoint_version,
+                triggers=triggers if full_rebuild_done else None,
+                jobs=jobs,
+            )
+            full_rebuild_done = True
         finally:
             flask.current_app.db.session.rollback()
         logger.info("Product details rebuilt")
 
-    return rebuild_product_details_async
+    queue = RebuildQueue(rebuild_product_details_async, debounce=debounce)
+
+    async def on_message(channel, body, envelope, properties):
+        # only queue the rebuild, so that messages keep being received (and
+        # merged) while a rebuild is running
+        await channel.basic_client_ack(delivery_tag=envelope.delivery_tag)
+        logger.info("Marked pulse message as acknowledged.")
+        queue.put(get_rebuild_trigger(body), get_message_sent_at(body))
+
+    return on_message
 
 
 @click.command()
+@click.option("--jobs", default=PRODUCT_DETAILS_JOBS, type=click.IntRange(min=1), help="Number of processes generating the product details files")
 @flask.cli.with_appcontext
-def cmd():
+def cmd(jobs):
     app_config = flask.current_app.config
     app_channel = app_config["APP_CHANNEL"]
     git_repo_url = app_config["PRODUCT_DETAILS_GIT_REPO_URL"]
@@ -46,7 +188,7 @@ def cmd():
         pulse_pass,
         exchange,
         PULSE_ROUTE_REBUILD_PRODUCT_DETAILS,
-        rebuild_product_details(git_repo_url, folder_in_repo, app_channel, BREAKPOINT_VERSION),
+        rebuild_product_details(git_repo_url, folder_in_repo, app_channel, BREAKPOINT_VERSION, PRODUCT_DETAILS_REBUILD_DEBOUNCE, jobs),
     )
     logger.info("Listening for new messages on %s %s", exchange, PULSE_ROUTE_REBUILD_PRODUCT_DETAILS)
     run_consumer(rebuild_product_details_consumer)
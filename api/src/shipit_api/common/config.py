@@ -21,10 +21,46 @@ SCOPE_PREFIX = f"project:releng:services/{APP_NAME}"
 # Worker will listen to this route key to trigger the rebuild.
 PULSE_ROUTE_REBUILD_PRODUCT_DETAILS = "rebuild_product_details"
 
-# A folder where we will keep a checkout of product details
-PRODUCT_DETAILS_DIR = pathlib.Path(tempfile.gettempdir(), "product-details")
-PRODUCT_DETAILS_NEW_DIR = pathlib.Path(tempfile.gettempdir(), "product-details-new")
+# A bare mirror of the product details repository, kept between rebuilds
+PRODUCT_DETAILS_GIT_DIR = pathlib.Path(tempfile.gettempdir(), "product-details.git")
 PRODUCT_DETAILS_CACHE_DIR = pathlib.Path(tempfile.gettempdir(), "product-details-cache")
+# Responses fetched from hg.mozilla.org while rebuilding product details. Files
+# fetched at an immutable revision are kept until they get evicted because the
+# cache is full, files fetched at a mutable revision (eg: nightly builds are
+# using "default") are refetched once they are older than the TTL.
+PRODUCT_DETAILS_L10N_CACHE_MAX_SIZE = 512 * 1024 * 1024
+PRODUCT_DETAILS_L10N_CACHE_TTL = 60 * 60
+# Release schedules fetched from whattrainisitnow.com, per major version. They
+# are refetched once they are older than the TTL. When refetching one fails or
+# takes longer than the timeout, the last schedule fetched is used instead.
+PRODUCT_DETAILS_SCHEDULE_CACHE_MAX_SIZE = 1024 * 1024
+PRODUCT_DETAILS_SCHEDULE_CACHE_TTL = config("PRODUCT_DETAILS_SCHEDULE_CACHE_TTL", default=6 * 60 * 60, cast=float)
+PRODUCT_DETAILS_SCHEDULE_FETCH_TIMEOUT = config("PRODUCT_DETAILS_SCHEDULE_FETCH_TIMEOUT", default=10, cast=float)
+# Number of concurrent requests to hg.mozilla.org while rebuilding product
+# details. The window starts at the initial value, is halved when hg.mozilla.org
+# looks overloaded and grows back up to the maximum while requests succeed.
+PRODUCT_DETAILS_FETCH_CONCURRENCY_INITIAL = config("PRODUCT_DETAILS_FETCH_CONCURRENCY_INITIAL", default=10, cast=int)
+PRODUCT_DETAILS_FETCH_CONCURRENCY_MAX = config("PRODUCT_DETAILS_FETCH_CONCURRENCY_MAX", default=50, cast=int)
+# Fetch the l10n changesets file once per changeset which modified it on each
+# branch, instead of once per release. The changesets are mapped using the
+# given number of latest changesets of each branch.
+PRODUCT_DETAILS_L10N_DEDUPE = config("PRODUCT_DETAILS_L10N_DEDUPE", default=False, cast=bool)
+PRODUCT_DETAILS_L10N_DEDUPE_REVCOUNT = config("PRODUCT_DETAILS_L10N_DEDUPE_REVCOUNT", default=10000, cast=int)
+# Encoder used for the JSON files of product details, "stdlib" or "orjson".
+# Both write the same bytes and reject NaN and infinite floats, the default
+# is orjson, the fastest one.
+PRODUCT_DETAILS_JSON_WRITER = config("PRODUCT_DETAILS_JSON_WRITER", default=None)
+# Seconds the product details worker waits for more pulse messages before
+# starting a rebuild. Messages received meanwhile, or while a rebuild is
+# running, are merged into a single rebuild.
+PRODUCT_DETAILS_REBUILD_DEBOUNCE = config("PRODUCT_DETAILS_REBUILD_DEBOUNCE", default=0, cast=float)
+# Number of processes generating the product details files. Each of them
+# starts with a copy of the inputs of the rebuild, which pays off for large
+# rebuilds on machines with several cores only.
+PRODUCT_DETAILS_JOBS = config("PRODUCT_DETAILS_JOBS", default=1, cast=int)
+# When set, each of these processes profiles the files it generates with
+# cProfile, and dumps the stats to this path suffixed with its pid on exit.
+PRODUCT_DETAILS_PROFILE = None
 
 # Use CURRENT_ESR-1. Releases with major version equal or less than the
 # breakpoint version will be served using static files. No related
@@ -63,6 +99,7 @@ THUNDERBIRD_ESR_BRANCH_PREFIX = "releases/comm-esr"
 
 # Mixed
 HG_PREFIX = "https://hg.mozilla.org"
+WHATTRAINISITNOW_PREFIX = "https://whattrainisitnow.com"
 
 MOBILE_DETAILS_TEMPLATE = r"""
 {
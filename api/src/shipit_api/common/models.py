@@ -16,6 +16,13 @@ from backend_common.db import db
 from shipit_api.common.config import ALLOW_PHASE_SKIPPING, SIGNOFFS
 
 
+def get_major_version(version):
+    """The number before the first dot of a version, as releases are filtered
+    on in product details, or None if it isn't a number."""
+    major, _, _ = version.partition(".")
+    return int(major) if major.isdigit() else None
+
+
 class SignoffBase:
     def __init__(self, uid, name, description, permissions):
         self.uid = uid
@@ -137,6 +144,8 @@ class Release(db.Model, ReleaseBase):
     name = sa.Column(sa.String(80), nullable=False, unique=True)
     product = sa.Column(sa.String, nullable=False)
     version = sa.Column(sa.String, nullable=False)
+    # derived from version, so that releases can be filtered on it with an index
+    major_version = sa.Column(sa.Integer, index=True)
     branch = sa.Column(sa.String, nullable=False)
     revision = sa.Column(sa.String, nullable=False)
     build_number = sa.Column(sa.Integer, nullable=False)
@@ -152,6 +161,7 @@ class Release(db.Model, ReleaseBase):
         self.name = f"{product.capitalize()}-{version}-build{build_number}"
         self.product = product
         self.version = version
+        self.major_version = get_major_version(version)
         self.branch = branch
         self.revision = revision
         self.build_number = build_number
@@ -174,6 +184,16 @@ class Release(db.Model, ReleaseBase):
         return self.branch.split("/")[-1]
 
 
+class ReleaseL10nChangesets(db.Model):
+    """The l10n changesets a release shipped with, stored at ship time since
+    they never change afterwards."""
+
+    __tablename__ = "shipit_api_release_l10n_changesets"
+    id = sa.Column(sa.Integer, primary_key=True)
+    release_id = sa.Column(sa.Integer, sa.ForeignKey("shipit_api_releases.id"), nullable=False, unique=True)
+    changesets = sa.Column(sa.JSON, nullable=False)
+
+
 class DisabledProduct(db.Model):
     __tablename__ = "shipit_api_disabled_products"
 
@@ -353,3 +373,21 @@ class NightlyRelease(db.Model):
             "buildid": self.buildid,
             "locales": self.locales,
         }
+
+
+class NightlyFirstReleases(db.Model):
+    """The oldest nightly build each locale of the latest nightly build of a
+    product and channel has been continuously available on, kept up to date by
+    the product details rebuilds as nightly builds are added."""
+
+    __tablename__ = "shipit_api_nightly_first_releases"
+    id = sa.Column(sa.Integer, primary_key=True)
+    product = sa.Column(sa.String, nullable=False)
+    channel = sa.Column(sa.String, nullable=False)
+    # the latest nightly build the first releases are computed up to
+    buildid = sa.Column(sa.String, nullable=False)
+    # the number of nightly builds up to `buildid` they are computed from, more
+    # of them means that older builds were added since
+    builds = sa.Column(sa.Integer, nullable=False)
+    first_releases = sa.Column(sa.JSON, nullable=False)
+    __table_args__ = (sa.UniqueConstraint("product", "channel", name="_nightly_first_releases_uc"),)
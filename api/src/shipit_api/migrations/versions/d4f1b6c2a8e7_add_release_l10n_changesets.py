@@ -0,0 +1,32 @@
+"""Add release l10n changesets
+
+Revision ID: d4f1b6c2a8e7
+Revises: c7e2a5f8b9d3
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d4f1b6c2a8e7"
+down_revision = "c7e2a5f8b9d3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "shipit_api_release_l10n_changesets",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("release_id", sa.Integer(), nullable=False),
+        sa.Column("changesets", sa.JSON(), nullable=False),
+        sa.ForeignKeyConstraint(["release_id"], ["shipit_api_releases.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("release_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("shipit_api_release_l10n_changesets")
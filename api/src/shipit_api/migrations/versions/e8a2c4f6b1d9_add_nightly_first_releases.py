@@ -0,0 +1,34 @@
+"""Add nightly first releases
+
+Revision ID: e8a2c4f6b1d9
+Revises: d4f1b6c2a8e7
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e8a2c4f6b1d9"
+down_revision = "d4f1b6c2a8e7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "shipit_api_nightly_first_releases",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("product", sa.String(), nullable=False),
+        sa.Column("channel", sa.String(), nullable=False),
+        sa.Column("buildid", sa.String(), nullable=False),
+        sa.Column("builds", sa.Integer(), nullable=False),
+        sa.Column("first_releases", sa.JSON(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("product", "channel", name="_nightly_first_releases_uc"),
+    )
+
+
+def downgrade():
+    op.drop_table("shipit_api_nightly_first_releases")
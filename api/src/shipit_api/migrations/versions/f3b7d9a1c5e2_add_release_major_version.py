@@ -0,0 +1,47 @@
+"""Add release major version
+
+Revision ID: f3b7d9a1c5e2
+Revises: e8a2c4f6b1d9
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3b7d9a1c5e2"
+down_revision = "e8a2c4f6b1d9"
+branch_labels = None
+depends_on = None
+
+releases = sa.table("shipit_api_releases", sa.column("id", sa.Integer), sa.column("version", sa.String), sa.column("major_version", sa.Integer))
+
+
+def get_major_version(version):
+    # same as shipit_api.common.models.get_major_version at the time of this
+    # migration, computed in python since doing it in SQL is database specific
+    major, _, _ = version.partition(".")
+    return int(major) if major.isdigit() else None
+
+
+def upgrade():
+    op.add_column("shipit_api_releases", sa.Column("major_version", sa.Integer(), nullable=True))
+    op.create_index(op.f("ix_shipit_api_releases_major_version"), "shipit_api_releases", ["major_version"], unique=False)
+
+    connection = op.get_bind()
+    rows = [
+        {"release_id": release_id, "value": major_version}
+        for release_id, version in connection.execute(sa.select(releases.c.id, releases.c.version))
+        if (major_version := get_major_version(version)) is not None
+    ]
+    if rows:
+        connection.execute(
+            releases.update().where(releases.c.id == sa.bindparam("release_id")).values(major_version=sa.bindparam("value")),
+            rows,
+        )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_shipit_api_releases_major_version"), table_name="shipit_api_releases")
+    op.drop_column("shipit_api_releases", "major_version")
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""An offline benchmark of the product details rebuilds.
+
+The database is seeded with synthetic releases and nightly builds, hg.mozilla.org
+and whattrainisitnow.com are replaced by a local aiohttp server, and the
+product details are pushed to a local bare repository. The tests use the same
+synthetic data. Run it with::
+
+    python tests/product_details_benchmark.py --output results.json
+"""
+
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+import pathlib
+import platform
+import shutil
+import tempfile
+import typing
+
+import aiohttp.web
+import click
+import sqlalchemy
+import sqlalchemy.orm
+
+import shipit_api.common.config
+from backend_common.db import db
+from backend_common.log import configure_logging
+from shipit_api.admin.json_writer import get_json_writer
+from shipit_api.admin.product_details import (
+    commit_product_details,
+    rebuild,
+    recompute_nightly_first_releases,
+    run_git,
+    serialize_product_details_file,
+    write_git_blobs,
+)
+from shipit_api.admin.tooling import override_config
+from shipit_api.common.models import NightlyRelease, Release, Version
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_START = datetime.datetime(2023, 5, 1)
+BENCHMARK_FIRST_MAJOR = 114
+BENCHMARK_ESR_MAJORS = (115, 128, 140, 153)
+# number of majors an ESR branch gets dot releases for
+BENCHMARK_ESR_LIFETIME = 16
+BENCHMARK_LOCALES = (
+    "ach af an ar ast az be bg bn br bs ca ca-valencia cak cs cy da de dsb el en-CA en-GB eo es-AR es-CL es-ES es-MX et eu fa ff fi fr "
+    "fur fy-NL ga-IE gd gl gn gu-IN he hi-IN hr hsb hu hy-AM ia id is it ja ja-JP-mac ka kab kk km kn ko lij lt lv mk mr ms my nb-NO "
+    "ne-NP nl nn-NO oc pa-IN pl pt-BR pt-PT rm ro ru sat sc sco si sk skr sl son sq sr sv-SE szl ta te tg th tl tr trs uk ur uz vi "
+    "xh zh-CN zh-TW"
+).split()
+
+
+def major_release_date(major: int) -> datetime.datetime:
+    return BENCHMARK_START + datetime.timedelta(weeks=4 * (major - BENCHMARK_FIRST_MAJOR))
+
+
+def generate_releases(count: int) -> typing.Iterator[Release]:
+    """Yield `count` releases of a synthetic release history, 4 weeks per major
+    version from BENCHMARK_FIRST_MAJOR on: Firefox and Thunderbird betas, releases,
+    dot releases and ESRs, Devedition betas and Firefox for Android betas and
+    releases. About one build out of 20 is not shipped."""
+
+    def release(product: str, branch: str, version: str, completed: datetime.datetime) -> typing.Iterator[Release]:
+        nonlocal index
+        for build_number in (1, 2) if index % 20 == 0 else (1,):
+            status = "aborted" if build_number == 1 and index % 20 == 0 else "shipped"
+            revision = hashlib.sha1(f"{product}-{version}-{build_number}".encode()).hexdigest()[:12]
+            entry = Release(product, version, branch, revision, build_number, None, None, status)
+            entry.created = completed - datetime.timedelta(hours=6)
+            entry.completed = completed
+            yield entry
+        index += 1
+
+    def major_releases(major: int) -> typing.Iterator[Release]:
+        date = major_release_date(major)
+        for beta in range(1, 10):
+            beta_date = date - datetime.timedelta(days=28 - 3 * beta)
+            yield from release("firefox", "releases/mozilla-beta", f"{major}.0b{beta}", beta_date)
+            yield from release("devedition", "releases/mozilla-beta", f"{major}.0b{beta}", beta_date)
+            if beta <= 4:
+                yield from release("firefox-android", "releases/mozilla-beta", f"{major}.0b{beta}", beta_date)
+            if beta <= 3:
+                yield from release("thunderbird", "releases/comm-beta", f"{major}.0b{beta}", beta_date + datetime.timedelta(days=1))
+        yield from release("firefox", "releases/mozilla-release", f"{major}.0", date)
+        yield from release("firefox-android", "releases/mozilla-release", f"{major}.0", date)
+        yield from release("thunderbird", "releases/comm-release", f"{major}.0", date + datetime.timedelta(days=1))
+        for dot in (1, 2):
+            dot_date = date + datetime.timedelta(weeks=dot)
+            yield from release("firefox", "releases/mozilla-release", f"{major}.0.{dot}", dot_date)
+            if dot == 1:
+                yield from release("thunderbird", "releases/comm-release", f"{major}.0.{dot}", dot_date + datetime.timedelta(days=1))
+        for esr in esr_majors(major):
+            version = f"{esr}.0esr" if esr == major else f"{esr}.{major - esr}.0esr"
+            yield from release("firefox", f"releases/mozilla-esr{esr}", version, date)
+            yield from release("thunderbird", f"releases/comm-esr{esr}", version, date + datetime.timedelta(days=1))
+
+    index = 0
+    major = BENCHMARK_FIRST_MAJOR
+    while True:
+        for entry in major_releases(major):
+            if count <= 0:
+                return
+            yield entry
+            count -= 1
+        major += 1
+
+
+def esr_majors(major: int) -> typing.List[int]:
+    """The ESR majors which get a dot release along with `major`. mozilla-version
+    only accepts the ESR majors which exist, there are none after the last one."""
+    return [esr for esr in BENCHMARK_ESR_MAJORS if esr <= major < esr + BENCHMARK_ESR_LIFETIME]
+
+
+def generate_nightly_releases(count: int, nightly_major: int) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yield `count` Firefox nightly builds, two a day, going back from the start
+    of the nightly cycle of `nightly_major`. Older builds ship fewer locales."""
+    last = major_release_date(nightly_major - 1)
+    for age in range(count):
+        built = last - datetime.timedelta(hours=12 * age)
+        major = max(nightly_major - (last - built).days // 28, 1)
+        locales = max(len(BENCHMARK_LOCALES) - len(BENCHMARK_LOCALES) * age // count, 10)
+        yield dict(
+            product="firefox",
+            channel="nightly",
+            version=f"{major}.0a1",
+            buildid=built.strftime("%Y%m%d%H%M%S"),
+            locales=list(BENCHMARK_LOCALES[:locales]) + ["en-US"],
+        )
+
+
+def create_database(path: pathlib.Path) -> sqlalchemy.engine.Engine:
+    """Create an empty SQLite database with the tables of shipit."""
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    return engine
+
+
+def seed_database(session: sqlalchemy.orm.Session, releases: int, nightly_releases: int, batch_size: int = 5000) -> int:
+    """Fill an empty database with `releases` releases and `nightly_releases`
+    nightly builds. Return the major version of nightly."""
+    nightly_major = BENCHMARK_FIRST_MAJOR
+    batch = []
+    for release in generate_releases(releases):
+        nightly_major = max(nightly_major, int(release.version.split(".")[0]) + 1)
+        batch.append(release)
+        if len(batch) == batch_size:
+            session.add_all(batch)
+            session.flush()
+            batch.clear()
+    session.add_all(batch)
+
+    session.add(Version(product_name="firefox", product_channel="nightly", current_version=f"{nightly_major}.0a1"))
+    session.add(Version(product_name="thunderbird", product_channel="nightly", current_version=f"{nightly_major}.0a1"))
+
+    rows = []
+    for row in generate_nightly_releases(nightly_releases, nightly_major):
+        rows.append(row)
+        if len(rows) == batch_size:
+            session.execute(sqlalchemy.insert(NightlyRelease), rows)
+            rows.clear()
+    if rows:
+        session.execute(sqlalchemy.insert(NightlyRelease), rows)
+    session.commit()
+    # as `shipit_recompute_nightly_locales` does when deploying
+    recompute_nightly_first_releases(session, "firefox", "nightly")
+    return nightly_major
+
+
+def get_l10n_changesets(revision: str) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """The l10n changesets file of a synthetic revision, "default" ships all locales."""
+    count = len(BENCHMARK_LOCALES) if revision == "default" else 40 + int(hashlib.sha1(revision.encode()).hexdigest(), 16) % 40
+    return {
+        locale: {"revision": hashlib.sha1(f"{revision}-{locale}".encode()).hexdigest()[:12], "platforms": ["linux64", "macosx64", "win64"], "pin": False}
+        for locale in BENCHMARK_LOCALES[:count]
+    }
+
+
+def get_release_schedule(major: int) -> typing.Dict[str, str]:
+    merge_day = major_release_date(major) - datetime.timedelta(days=1)
+    return {
+        "version": f"{major}.0",
+        "string_freeze": (merge_day - datetime.timedelta(days=3)).isoformat() + "+00:00",
+        "merge_day": merge_day.isoformat() + "+00:00",
+        "release": major_release_date(major).isoformat() + "+00:00",
+    }
+
+
+def create_upstream_app() -> aiohttp.web.Application:
+    """An aiohttp application serving the parts of hg.mozilla.org and
+    whattrainisitnow.com the product details rebuilds fetch."""
+
+    async def schedule(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(get_release_schedule(int(request.query["version"])))
+
+    async def raw_file(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        if not request.match_info["path"].endswith("l10n-changesets.json"):
+            raise aiohttp.web.HTTPNotFound()
+        return aiohttp.web.json_response(get_l10n_changesets(request.match_info["revision"]))
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/api/release/schedule/", schedule)
+    app.router.add_get("/{branch:.+}/raw-file/{revision}/{path:.+}", raw_file)
+    return app
+
+
+@contextlib.asynccontextmanager
+async def serve_upstream() -> typing.AsyncIterator[str]:
+    """Run the upstream stand-in on a free local port and yield its URL."""
+    runner = aiohttp.web.AppRunner(create_upstream_app(), access_log=None)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        host, port = runner.addresses[0][:2]
+        yield f"http://{host}:{port}"
+    finally:
+        await runner.cleanup()
+
+
+def create_remote(git_dir: pathlib.Path, git_branch: str, folder_in_repo: str) -> None:
+    """Create a bare repository to push the product details to. `git_branch`
+    holds the files which are only carried over by the rebuilds: the
+    languages and the regions."""
+    run_git(git_dir, "init", "--bare", "--quiet")
+    run_git(git_dir, "config", "user.email", "benchmark@localhost")
+    run_git(git_dir, "config", "user.name", "Benchmark")
+    (readme,) = write_git_blobs(git_dir, [b"Product details benchmark\n"])
+    tree = run_git(git_dir, "mktree", input=f"100644 blob {readme}\tREADME.md\n".encode()).decode().strip()
+    commit = run_git(git_dir, "commit-tree", tree, "-m", "Initial commit").decode().strip()
+
+    json_writer = get_json_writer("stdlib")
+    files = {"1.0/languages.json": {locale: {"English": f"Language {locale}", "native": locale} for locale in BENCHMARK_LOCALES}}
+    for locale in BENCHMARK_LOCALES:
+        files[f"1.0/regions/{locale}.json"] = {region: f"Region {region} in {locale}" for region in ("ca", "de", "fr", "jp", "us")}
+    contents = {file_: serialize_product_details_file(file_, content, json_writer) for file_, content in files.items()}
+    commit, _ = commit_product_details(git_dir, commit, folder_in_repo, contents, "Add the languages and the regions")
+    run_git(git_dir, "update-ref", f"refs/heads/{git_branch}", commit)
+
+
+async def run_benchmark(
+    work_dir: pathlib.Path,
+    releases: int = 20000,
+    nightly_releases: int = 100000,
+    breakpoint_version: int = shipit_api.common.config.BREAKPOINT_VERSION,
+) -> typing.Dict[str, typing.Any]:
+    """Seed a database in `work_dir` and run rebuilds against it:
+
+    - ``cold``: a full rebuild, without any cache, into an empty repository;
+    - ``noop``: a full rebuild when nothing changed;
+    - ``partial``: a rebuild triggered by a new release.
+
+    Return the parameters and the stats of every rebuild.
+    """
+    git_branch = "main"
+    remote = work_dir / "remote.git"
+    database = work_dir / "shipit.db"
+    git_dir = work_dir / "product-details.git"
+    cache_dir = work_dir / "product-details-cache"
+    # every benchmark starts from scratch
+    for path in (remote, git_dir, cache_dir):
+        shutil.rmtree(path, ignore_errors=True)
+    database.unlink(missing_ok=True)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    folder_in_repo = "public/"
+    create_remote(remote, git_branch, folder_in_repo)
+
+    engine = create_database(database)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+
+    logger.info(f"Seeding the database with {releases} releases and {nightly_releases} nightly releases")
+    nightly_major = seed_database(session, releases, nightly_releases)
+
+    runs = dict()
+    async with serve_upstream() as upstream_url:
+        with override_config(
+            PRODUCT_DETAILS_GIT_DIR=git_dir,
+            PRODUCT_DETAILS_CACHE_DIR=cache_dir,
+            HG_PREFIX=upstream_url,
+            WHATTRAINISITNOW_PREFIX=upstream_url,
+        ):
+            for name in ("cold", "noop", "partial"):
+                triggers = None
+                if name == "partial":
+                    release = Release("firefox", f"{nightly_major - 1}.0.3", "releases/mozilla-release", "f" * 12, 1, None, None, "shipped")
+                    release.completed = major_release_date(nightly_major - 1) + datetime.timedelta(weeks=3)
+                    session.add(release)
+                    session.commit()
+                    triggers = [{"release": release.name, "product": release.product, "version": release.version}]
+                logger.info(f"Running the {name} rebuild")
+                stats = await rebuild(
+                    session, git_branch, str(remote), folder_in_repo, breakpoint_version, clean_working_copy=name == "cold", triggers=triggers
+                )
+                runs[name] = stats.summary()
+
+    session.close()
+    engine.dispose()
+    return {
+        "parameters": {"releases": releases, "nightly_releases": nightly_releases, "breakpoint_version": breakpoint_version},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "runs": runs,
+    }
+
+
+@click.command()
+@click.option("--releases", default=20000, type=int, help="Number of releases in the synthetic database")
+@click.option("--nightly-releases", default=100000, type=int, help="Number of nightly builds in the synthetic database")
+@click.option("--breakpoint-version", default=shipit_api.common.config.BREAKPOINT_VERSION, type=int)
+@click.option("--work-dir", type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path), help="Keep the database and the repositories there")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path), required=True, help="Write the results to this JSON file")
+def main(releases: int, nightly_releases: int, breakpoint_version: int, work_dir: typing.Optional[pathlib.Path], output: pathlib.Path):
+    """Benchmark product details rebuilds offline, against a synthetic database."""
+    configure_logging()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = asyncio.run(run_benchmark(work_dir or pathlib.Path(tmp_dir), releases, nightly_releases, breakpoint_version))
+    output.write_text(json.dumps(results, indent=4))
+    for name, run in results["runs"].items():
+        click.echo(f"{name}: {run['wall']:.3f}s ({run['cpu']:.3f}s CPU)")
+    click.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
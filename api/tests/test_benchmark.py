@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import aiohttp
+import pytest
+
+from product_details_benchmark import esr_majors, generate_nightly_releases, generate_releases, get_l10n_changesets, run_benchmark, serve_upstream
+
+
+def test_generate_releases():
+    releases = list(generate_releases(700))
+    assert len(releases) == 700
+    assert len({release.name for release in releases}) == 700
+    assert releases[0].version == "114.0b1"
+    assert {release.product for release in releases} == {"devedition", "firefox", "firefox-android", "thunderbird"}
+    assert {release.branch for release in releases if release.version.endswith("esr")} == {
+        "releases/comm-esr115",
+        "releases/comm-esr128",
+        "releases/mozilla-esr115",
+        "releases/mozilla-esr128",
+    }
+    aborted = {release.name for release in releases if release.status == "aborted"}
+    assert aborted
+    assert {name.replace("-build1", "-build2") for name in aborted} <= {release.name for release in releases if release.status == "shipped"}
+
+
+def test_esr_majors():
+    assert esr_majors(114) == []
+    assert esr_majors(130) == [115, 128]
+    assert esr_majors(160) == [153]
+    assert esr_majors(170) == []
+
+
+def test_generate_nightly_releases():
+    nightly_releases = list(generate_nightly_releases(100, 120))
+    assert nightly_releases[0]["buildid"] > nightly_releases[-1]["buildid"]
+    assert nightly_releases[0]["version"] == "120.0a1"
+    assert len(nightly_releases[0]["locales"]) > len(nightly_releases[-1]["locales"])
+
+
+@pytest.mark.asyncio
+async def test_serve_upstream():
+    async with serve_upstream() as url:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{url}/releases/mozilla-beta/raw-file/abcdef123456/browser/locales/l10n-changesets.json") as response:
+                assert await response.json() == get_l10n_changesets("abcdef123456")
+            async with session.get(f"{url}/api/release/schedule/?version=130") as response:
+                assert (await response.json())["version"] == "130.0"
+            async with session.get(f"{url}/mozilla-central/raw-file/default/README") as response:
+                assert response.status == 404
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark(tmp_path):
+    results = await run_benchmark(tmp_path, releases=600, nightly_releases=200)
+    assert results["parameters"] == {"releases": 600, "nightly_releases": 200, "breakpoint_version": 114}
+    runs = results["runs"]
+    assert list(runs) == ["cold", "noop", "partial"]
+    assert runs["cold"]["counts"]["fetches"] > 0
+    assert runs["noop"]["counts"]["files_written"] == 0
+    assert runs["noop"]["counts"]["fetches"] == 0
+    assert 0 < runs["partial"]["counts"]["files_written"] < runs["partial"]["counts"]["files"]
+    assert "push" in runs["partial"]["stages"]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import re
+
+import aiohttp
+import pytest
+from aioresponses import aioresponses
+
+from shipit_api.admin.cache import CacheStore
+from shipit_api.admin.product_details import fetch_l10n_data, is_immutable_revision
+from shipit_api.common.models import Release
+
+
+def test_cache_store(tmp_path):
+    with CacheStore(tmp_path / "cache.sqlite", max_size=1024, ttl=60) as cache:
+        assert cache.get("a") is None
+        cache.set("a", {"de": "abc"})
+        cache.set("b", [1, 2], mutable=True)
+        assert cache.get("a") == {"de": "abc"}
+        assert cache.get("b") == [1, 2]
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    # entries survive the store being closed
+    with CacheStore(tmp_path / "cache.sqlite", max_size=1024, ttl=60) as cache:
+        assert cache.get("a") == {"de": "abc"}
+        assert cache.size == len('{"de": "abc"}') + len("[1, 2]")
+
+
+def test_cache_store_ttl(tmp_path):
+    with CacheStore(tmp_path / "cache.sqlite", max_size=1024, ttl=0) as cache:
+        cache.set("immutable", "a")
+        cache.set("mutable", "b", mutable=True)
+        assert cache.get("immutable") == "a"
+        assert cache.get("mutable") is None
+        assert cache.expired == 1
+        assert cache.size == len('"a"')
+
+
+def test_cache_store_eviction(tmp_path):
+    with CacheStore(tmp_path / "cache.sqlite", max_size=20, ttl=60) as cache:
+        cache.set("a", "x" * 6)
+        cache.set("b", "y" * 6)
+        # "a" is now the most recently used entry
+        assert cache.get("a") == "x" * 6
+        cache.set("c", "z" * 6)
+        assert cache.evicted == 1
+        assert cache.get("b") is None
+        assert cache.get("a") == "x" * 6
+        assert cache.get("c") == "z" * 6
+        assert cache.size <= 20
+
+
+@pytest.mark.parametrize(
+    "revision, expected",
+    (
+        ("812b11ed03e0", True),
+        ("812b11ed03e02e7d5ec9f23c6abcbc46d7859740", True),
+        ("default", False),
+        ("FIREFOX_62_0b16_RELEASE", False),
+    ),
+)
+def test_is_immutable_revision(revision, expected):
+    assert is_immutable_revision(revision) is expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("revision, fetches", (("812b11ed03e02e7d5ec9f23c6abcbc46d7859740", 1), ("default", 2)))
+async def test_fetch_l10n_data_cache(tmp_path, revision, fetches):
+    release = Release(
+        product="firefox",
+        branch="mozilla-central",
+        version="64.0a1",
+        revision=revision,
+        build_number=1,
+        release_eta=None,
+        status="shipped",
+        partial_updates=None,
+    )
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1))
+    url = re.compile(r"^https://hg\.mozilla\.org/")
+    with aioresponses() as m, CacheStore(tmp_path / "cache.sqlite", max_size=1024, ttl=0) as cache:
+        m.get(url, status=200, payload=dict(a="a"), repeat=True)
+        for _ in range(2):
+            _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True, cache=cache)
+            assert changesets == {"a": "a"}
+        assert sum(len(calls) for calls in m.requests.values()) == fetches
+    await session.close()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import pytest
+import sqlalchemy.orm
+
+import shipit_api.admin.product_details
+from shipit_api.admin.compare import compare_product_details, get_deltas, get_median_stats, parse_variant
+from shipit_api.admin.product_details import run_git
+from shipit_api.admin.tooling import override_config
+from shipit_api.common.models import ReleaseL10nChangesets
+
+from product_details_benchmark import create_database, create_remote, seed_database, serve_upstream
+
+
+def add_test_language():
+    # the setup of a variant going through another code path
+    get_languages = shipit_api.admin.product_details.get_languages
+    shipit_api.admin.product_details.get_languages = lambda old_product_details: dict(get_languages(old_product_details), zz={"English": "Test"})
+
+
+def test_parse_variant():
+    assert parse_variant([]) == {}
+    assert parse_variant(["breakpoint_version=120", "PRODUCT_DETAILS_JSON_WRITER=stdlib", "PRODUCT_DETAILS_L10N_DEDUPE=True"]) == {
+        "breakpoint_version": 120,
+        "PRODUCT_DETAILS_JSON_WRITER": "stdlib",
+        "PRODUCT_DETAILS_L10N_DEDUPE": True,
+    }
+    with pytest.raises(ValueError):
+        parse_variant(["breakpoint_version"])
+    with pytest.raises(ValueError):
+        parse_variant(["NOT_A_SETTING=1"])
+    assert parse_variant(["setup=test_compare:add_test_language"]) == {"setup": "test_compare:add_test_language"}
+    with pytest.raises(ValueError):
+        parse_variant(["setup=add_test_language"])
+
+
+def test_get_deltas():
+    a = {"wall": 2.0, "cpu": 1.5, "peak_rss": 100, "stages": {"generate": {"wall": 1.0, "cpu": 1.0}, "index": {"wall": 0.5, "cpu": 0.5}}}
+    b = {"wall": 1.5, "cpu": 1.0, "peak_rss": 150, "stages": {"generate": {"wall": 0.25, "cpu": 0.5}}}
+    assert get_deltas(a, b) == {"wall": -0.5, "cpu": -0.5, "peak_rss": 50, "stages": {"generate": {"wall": -0.75, "cpu": -0.5}}}
+
+
+def test_get_median_stats():
+    runs = [
+        {
+            "wall": 3.0,
+            "cpu": 2.0,
+            "peak_rss": 100,
+            "stages": {"generate": {"wall": 2.0, "cpu": 1.0}, "index": {"wall": 1.0, "cpu": 1.0}},
+            "counts": {"files": 2},
+            "gauges": {},
+        },
+        {"wall": 1.0, "cpu": 1.0, "peak_rss": 300, "stages": {"generate": {"wall": 0.5, "cpu": 0.5}}, "counts": {"files": 2}, "gauges": {}},
+        {"wall": 2.0, "cpu": 4.0, "peak_rss": 200, "stages": {"generate": {"wall": 1.0, "cpu": 2.0}}, "counts": {"files": 2}, "gauges": {}},
+    ]
+    assert get_median_stats(runs) == {
+        "wall": 2.0,
+        "cpu": 2.0,
+        "peak_rss": 200,
+        "stages": {"generate": {"wall": 1.0, "cpu": 1.0}},
+        "counts": {"files": 2},
+        "gauges": {},
+    }
+    runs[0]["peak_rss"] = None
+    assert get_median_stats(runs)["peak_rss"] is None
+
+
+@pytest.mark.asyncio
+async def test_compare_product_details(tmp_path):
+    remote = tmp_path / "remote.git"
+    create_remote(remote, "main", "public/")
+    database = tmp_path / "shipit.db"
+    engine = create_database(database)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    seed_database(session, 400, 50)
+    session.close()
+    engine.dispose()
+
+    async with serve_upstream() as url:
+        with override_config(
+            PRODUCT_DETAILS_GIT_DIR=tmp_path / "product-details.git",
+            PRODUCT_DETAILS_CACHE_DIR=tmp_path / "product-details-cache",
+            HG_PREFIX=url,
+            WHATTRAINISITNOW_PREFIX=url,
+        ):
+            b = {"breakpoint_version": 118, "setup": "test_compare:add_test_language"}
+            comparison = await compare_product_details(f"sqlite:///{database}", "main", str(remote), "public/", {}, b)
+
+    assert comparison["variants"]["b"]["options"] == b
+    assert len(comparison["variants"]["a"]["runs"]) == len(comparison["variants"]["b"]["runs"]) == 2
+    assert comparison["variants"]["a"]["stats"]["counts"]["releases"] > comparison["variants"]["b"]["stats"]["counts"]["releases"]
+    files = comparison["files"]
+    assert files["identical"] > 0
+    assert "1.0/firefox.json" in [change["file"] for change in files["changed"]]
+    assert "1.0/languages.json" in [change["file"] for change in files["changed"]]
+    assert "1.0/regions/fr.json" not in [change["file"] for change in files["changed"]]
+    assert files["removed"] and all(file_.startswith("1.0/l10n/") and "-11" in file_ for file_ in files["removed"])
+    assert files["added"] == []
+    # nothing was pushed, nor stored
+    assert run_git(remote, "rev-parse", "main").decode().strip() == comparison["head"]
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    assert session.query(ReleaseL10nChangesets).count() == 0
+    session.close()
+    engine.dispose()
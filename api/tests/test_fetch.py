@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import asyncio
+import re
+
+import aiohttp
+import pytest
+from aioresponses import aioresponses
+
+from shipit_api.admin.fetch import FetchScheduler, is_congestion
+from shipit_api.admin.product_details import fetch_l10n_data
+from shipit_api.common.models import Release
+
+
+def response_error(status):
+    return aiohttp.ClientResponseError(None, (), status=status)
+
+
+@pytest.mark.parametrize(
+    "exception, expected",
+    (
+        (asyncio.TimeoutError(), True),
+        (response_error(429), True),
+        (response_error(503), True),
+        (response_error(404), False),
+        (aiohttp.ServerDisconnectedError(), True),
+        (ValueError(), False),
+    ),
+)
+def test_is_congestion(exception, expected):
+    assert is_congestion(exception) is expected
+
+
+@pytest.mark.asyncio
+async def test_fetch_scheduler_window():
+    scheduler = FetchScheduler(initial=3, maximum=3)
+    max_in_flight = 0
+
+    async def fetch():
+        nonlocal max_in_flight
+        async with scheduler.request():
+            max_in_flight = max(max_in_flight, scheduler.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[fetch() for _ in range(12)])
+    assert max_in_flight == 3
+    assert scheduler.in_flight == 0
+    assert len(scheduler.latencies) == 12
+    assert scheduler.window == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_scheduler_cancel():
+    scheduler = FetchScheduler(initial=1, maximum=1)
+    release = asyncio.Event()
+
+    async def fetch():
+        async with scheduler.request():
+            await release.wait()
+
+    first = asyncio.ensure_future(fetch())
+    queued = [asyncio.ensure_future(fetch()) for _ in range(3)]
+    await asyncio.sleep(0)
+    queued[0].cancel()
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, *queued[1:])
+    assert queued[0].cancelled()
+    assert scheduler.in_flight == 0
+    assert len(scheduler.latencies) == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_scheduler_cancel_then_release():
+    scheduler = FetchScheduler(initial=1, maximum=1)
+    await scheduler.acquire()
+    queued = asyncio.ensure_future(scheduler.acquire())
+    waiting = asyncio.ensure_future(scheduler.acquire())
+    await asyncio.sleep(0)
+    # the slot is released before the cancelled acquire gets to run
+    queued.cancel()
+    scheduler.release()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    await waiting
+    assert scheduler.in_flight == 1
+    scheduler.release()
+    assert scheduler.in_flight == 0
+    assert not scheduler._waiters
+
+
+@pytest.mark.asyncio
+async def test_fetch_scheduler_growth():
+    scheduler = FetchScheduler(initial=3, maximum=10)
+    for _ in range(12):
+        async with scheduler.request():
+            pass
+    # grows by about one for every window worth of successful requests
+    assert int(scheduler.window) == 5
+
+    for _ in range(100):
+        async with scheduler.request():
+            pass
+    assert scheduler.window == 10
+
+
+@pytest.mark.asyncio
+async def test_fetch_scheduler_congestion():
+    scheduler = FetchScheduler(initial=8, maximum=10, cooldown=60)
+
+    async def fail():
+        async with scheduler.request():
+            raise response_error(503)
+
+    for _ in range(2):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await fail()
+    # the second failure happened within the cooldown
+    assert scheduler.window == 4
+    assert scheduler.congestions == 1
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        async with scheduler.request():
+            raise response_error(404)
+    assert scheduler.window == 4
+
+    scheduler = FetchScheduler(initial=1, maximum=10, cooldown=0)
+    with pytest.raises(asyncio.TimeoutError):
+        async with scheduler.request():
+            raise asyncio.TimeoutError()
+    assert scheduler.window == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_l10n_data_scheduler():
+    release = Release(
+        product="firefox",
+        branch="releases/mozilla-beta",
+        version="62.0b16",
+        revision="812b11ed03e02e7d5ec9f23c6abcbc46d7859740",
+        build_number=1,
+        release_eta=None,
+        status="shipped",
+        partial_updates=None,
+    )
+    scheduler = FetchScheduler(initial=4, maximum=10, cooldown=60)
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1))
+    url = re.compile(r"^https://hg\.mozilla\.org/")
+    with aioresponses() as m:
+        m.get(url, status=503)
+        m.get(url, status=200, payload=dict(a="a"))
+        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True, scheduler=scheduler)
+    await session.close()
+
+    assert changesets == {"a": "a"}
+    assert scheduler.congestions == 1
+    assert len(scheduler.latencies) == 2
+    assert scheduler.in_flight == 0
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import collections
+import json
+
+import pytest
+
+from shipit_api.admin.json_writer import JSON_WRITERS, double_indent, get_json_writer
+
+GOLDEN_TREE = {
+    "1.0/firefox_versions.json": {"LATEST_FIREFOX_VERSION": "133.0", "FIREFOX_NIGHTLY": "135.0a1", "FIREFOX_ESR": "128.5.1esr"},
+    "1.0/firefox_history_major_releases.json": collections.OrderedDict([("1.0", "2004-11-09"), ("1.5", "2005-11-29"), ("10.0", "2012-01-31")]),
+    "1.0/thunderbird_primary_builds.json": {"de": {"132.0": {"Windows": {"filesize": 25.1}, "OS X": {"filesize": 50.8}, "Linux": {"filesize": 0}}}},
+    "1.0/languages.json": {"fr": {"English": "French", "native": "Français"}, "ja": {"English": "Japanese", "native": "日本語"}, "xx": {"native": "😀 \x7f"}},
+    "1.0/regions/de.json": {"de": "Deutschland", "quoted": 'say "hi"\\ \n\t\x00\x1f', "indented": "    not indentation"},
+    "1.0/empty.json": {"dict": {}, "list": [], "nested": [[[]], [{}]], "values": [None, True, False, 0, -1]},
+    "1.0/numbers.json": {"floats": [0.1, 1e-05, 5e-05, 0.0001, 1e16, 1.5e300, -0.0, 123456789.123], "big": 2**70},
+    "1.0/keys.json": {10: "ten", 9: "nine"},
+    "1.0/list.json": [1, "a", {"b": [2]}],
+}
+
+
+@pytest.mark.parametrize("name", sorted(JSON_WRITERS))
+@pytest.mark.parametrize("file_", sorted(GOLDEN_TREE))
+def test_json_writer(name, file_):
+    content = GOLDEN_TREE[file_]
+    sort_keys = not isinstance(content, collections.OrderedDict)
+    assert JSON_WRITERS[name]().dumps(content, sort_keys=sort_keys) == json.dumps(content, sort_keys=sort_keys, indent=4).encode("utf-8")
+
+
+@pytest.mark.parametrize("name", sorted(JSON_WRITERS))
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), -float("inf")])
+def test_json_writer_non_finite(name, value):
+    with pytest.raises(ValueError):
+        JSON_WRITERS[name]().dumps({"a": [None, {"b": (1, value)}]}, sort_keys=True)
+
+
+def test_double_indent():
+    assert double_indent(b'{\n  "a": [\n    1\n  ],\n  "b  c": 2\n}') == b'{\n    "a": [\n        1\n    ],\n    "b  c": 2\n}'
+
+
+def test_get_json_writer():
+    assert type(get_json_writer("stdlib")) is JSON_WRITERS["stdlib"]
+    assert type(get_json_writer()) is JSON_WRITERS["orjson"]
+    with pytest.raises(ValueError):
+        get_json_writer("simplejson")
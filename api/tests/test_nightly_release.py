@@ -1,7 +1,7 @@
 from unittest.mock import Mock, patch
 
 from backend_common.db import db
-from shipit_api.common.models import NightlyRelease
+from shipit_api.common.models import NightlyFirstReleases, NightlyRelease
 
 
 def test_list_nightly_releases_empty(app):
@@ -93,6 +93,41 @@ def test_add_nightly_release(mock_user, app):
         assert response.status_code == 201
 
 
+@patch("shipit_api.admin.api.current_user", new_callable=lambda: Mock())
+def test_add_nightly_release_keeps_first_releases(mock_user, app):
+    mock_user.has_permissions.return_value = True
+    db.session.add(NightlyRelease(product="firefox", channel="nightly", version="140.0a1", buildid="20260522093015", locales=["en-US", "de"]))
+    db.session.add(
+        NightlyFirstReleases(
+            product="firefox",
+            channel="nightly",
+            buildid="20260522093015",
+            builds=1,
+            first_releases={"de": {"version": "140.0a1", "buildid": "20260522093015"}},
+        )
+    )
+    db.session.commit()
+
+    with app.test_client() as client:
+        response = client.post(
+            "/nightly-release",
+            json={
+                "product": "firefox",
+                "channel": "nightly",
+                "version": "140.0a1",
+                "buildid": "20260523093015",
+                "locales": ["en-US", "de", "fr"],
+            },
+        )
+        assert response.status_code == 201
+
+    # only the build is recorded, the rebuilds apply it to the first releases
+    stored = db.session.query(NightlyFirstReleases).one()
+    assert stored.buildid == "20260522093015"
+    assert stored.builds == 1
+    assert db.session.query(NightlyRelease).count() == 2
+
+
 @patch("shipit_api.admin.api.current_user", new_callable=lambda: Mock())
 def test_add_nightly_release_duplicate_buildid_returns_400(mock_user, app):
     mock_user.has_permissions.return_value = True
@@ -3,33 +3,37 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import asyncio
+import collections
+import datetime
+import functools
+import hashlib
 import json
+import logging
 import pathlib
+import pstats
+import random
 import re
 import subprocess
+import threading
+import time
 from unittest import mock
 
 import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
 import pytest
 from aioresponses import aioresponses
-from sqlalchemy import engine, event
 
 import shipit_api.admin.product_details
-from shipit_api.admin.product_details import fetch_l10n_data, rebuild
-from shipit_api.common.models import NightlyRelease, Release, Version
+import shipit_api.admin.worker
+from shipit_api.admin.cache import CacheStore
+from shipit_api.admin.json_writer import JSON_WRITERS, StdlibJSONWriter
+from shipit_api.admin.product_details import RawFile, fetch_l10n_data, rebuild
+from shipit_api.common.models import NightlyFirstReleases, NightlyRelease, Release, ReleaseL10nChangesets, Version
+from shipit_api.common.product import Product, ProductCategory
 
-
-# product_details uses a postgresql-specific "split_part" sql function
-@event.listens_for(engine.Engine, "connect")
-def setup_split_part(dbapi_connection, conn_rec):
-    def split_part(string, delimiter, position):
-        return string.split(delimiter, position)[position - 1]
-
-    dbapi_connection.create_function(
-        "split_part",
-        3,
-        split_part,
-    )
+from product_details_benchmark import run_benchmark
 
 
 def create_html(folder, items):
@@ -55,6 +59,32 @@ def test_create_index_listing(product_details, product_details_final):
     assert shipit_api.admin.product_details.create_index_listing(product_details) == product_details_final
 
 
+def test_create_index_listing_old_files():
+    product_details = {"1.0/all.json": {}, "1.0/l10n/de.json": {}, "1.0/l10n/fr.json": {}}
+    old_files = {
+        "index.html": "a" * 40,
+        "1.0/all.json": "b" * 40,
+        "1.0/index.html": "c" * 40,
+        "1.0/l10n/de.json": "d" * 40,
+        "1.0/l10n/index.html": "e" * 40,
+    }
+    assert shipit_api.admin.product_details.create_index_listing(product_details, old_files) == {
+        **product_details,
+        "index.html": RawFile("a" * 40),
+        "1.0/index.html": RawFile("c" * 40),
+        # fr.json is new
+        "1.0/l10n/index.html": create_html("1.0/l10n", ["1.0/l10n/de.json", "1.0/l10n/fr.json"]),
+    }
+
+
+def test_get_folder_tree():
+    assert shipit_api.admin.product_details.get_folder_tree(["1.0/all.json", "1.0/l10n/de.json", "1.0/l10n/fr.json", "index.html"]) == {
+        "": {"1.0", "index.html"},
+        "1.0": {"all.json", "l10n"},
+        "1.0/l10n": {"de.json", "fr.json"},
+    }
+
+
 @pytest.mark.asyncio
 async def test_fetch_l10n_data():
     release = Release(
@@ -71,7 +101,7 @@ async def test_fetch_l10n_data():
     url = re.compile(r"^https://hg\.mozilla\.org/")
     with aioresponses() as m:
         m.get(url, status=200, payload=dict(a="a"))
-        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True, use_cache=False)
+        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True)
         assert changesets == {"a": "a"}
 
         # simulate HTTP errors.
@@ -79,7 +109,7 @@ async def test_fetch_l10n_data():
         m.get(url, status=500)
         # Return proper result second time
         m.get(url, status=200, payload=dict(a="a"))
-        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True, use_cache=False)
+        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True)
         assert changesets == {"a": "a"}
 
         # simulate timeout
@@ -87,19 +117,285 @@ async def test_fetch_l10n_data():
         m.get(url, timeout=True)
         # Return proper result second time
         m.get(url, status=200, payload=dict(a="a"))
-        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True, use_cache=False)
+        _, changesets = await fetch_l10n_data(session, release, raise_on_failure=True)
         assert changesets == {"a": "a"}
 
 
-def mock_setup_working_copy(branch, url, secrets):
-    subprocess.check_call(["git", "clone", "-n", url, str(shipit_api.common.config.PRODUCT_DETAILS_DIR)])
-    subprocess.check_call(["git", "checkout", "-b", branch, "26140d3435c386f36a94bd23ded5d08f8a41f080"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR)
-    subprocess.check_call(["git", "config", "user.email", "release-services+robot@mozilla.com"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR)
-    subprocess.check_call(["git", "config", "user.name", "Release Services Robot"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR)
-    subprocess.check_call(["git", "config", "commit.gpgsign", "false"], cwd=shipit_api.common.config.PRODUCT_DETAILS_DIR)
+class FakeHg:
+    """A stand-in for hg.mozilla.org, serving a single linear branch where
+    browser/locales/l10n-changesets.json is modified by some changesets."""
+
+    def __init__(self, count, modified_at):
+        self.nodes = [hashlib.sha1(str(index).encode()).hexdigest() for index in range(count)]
+        self.modified = [self.nodes[index] for index in modified_at]
+        self.requests = []
+        self.file_revisions = {}
+        file_revision = None
+        for node in self.nodes:
+            if node in self.modified:
+                file_revision = node
+            self.file_revisions[node] = file_revision
+
+    async def handle(self, request):
+        self.requests.append(request.path)
+        if "/json-filelog/" in request.path:
+            return aiohttp.web.json_response({"entries": [{"node": node} for node in reversed(self.modified)]})
+        if "/json-log/" in request.path:
+            changesets = [{"node": node, "parents": [parent] if parent else []} for parent, node in zip([None] + self.nodes, self.nodes)]
+            return aiohttp.web.json_response({"changesets": list(reversed(changesets))})
+        revision = request.match_info["tail"].split("/raw-file/")[1].split("/")[0]
+        file_revision = next(file_revision for node, file_revision in self.file_revisions.items() if node.startswith(revision))
+        return aiohttp.web.json_response({"de": {"revision": file_revision}})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("dedupe, fetches", ((False, 6), (True, 2 + 3 + 1)))
+async def test_fetch_releases_l10n(monkeypatch, dedupe, fetches):
+    hg = FakeHg(count=10, modified_at=[0, 4, 7])
+    app = aiohttp.web.Application()
+    app.router.add_get("/{tail:.*}", hg.handle)
+    server = aiohttp.test_utils.TestServer(app)
+    await server.start_server()
+    monkeypatch.setattr(shipit_api.common.config, "HG_PREFIX", str(server.make_url("")).rstrip("/"))
+
+    # the last release isn't part of the changelog
+    revisions = [hg.nodes[2][:12], hg.nodes[3][:12], hg.nodes[5][:12], hg.nodes[6], hg.nodes[8][:12], "f" * 12]
+    hg.file_revisions["f" * 40] = "f" * 40
+    releases = [make_release("firefox", f"100.0b{index}", branch="releases/mozilla-beta") for index in range(len(revisions))]
+    for release, revision in zip(releases, revisions):
+        release.revision = revision
+
+    async with aiohttp.ClientSession() as session:
+        results = await shipit_api.admin.product_details.fetch_releases_l10n(session, releases, raise_on_failure=True, dedupe=dedupe)
+    await server.close()
+
+    assert [release for release, _ in results] == releases
+    assert [changesets["de"]["revision"] for _, changesets in results] == [
+        hg.nodes[0],
+        hg.nodes[0],
+        hg.nodes[4],
+        hg.nodes[4],
+        hg.nodes[7],
+        "f" * 40,
+    ]
+    assert len(hg.requests) == fetches
+
+
+@pytest.mark.asyncio
+async def test_fetch_file_revisions():
+    # a -- b ------ m -- d -- e
+    #  \           /
+    #   ---- c ----
+    a, b, c, m, d, e = [char * 40 for char in "abc0de"]
+    changesets = [(e, [d]), (d, [m]), (m, [b, c]), (c, [a]), (b, [a]), (a, [])]
+    url = re.compile(r"^https://hg\.mozilla\.org/releases/mozilla-beta/")
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r".*/json-filelog/.*"), payload={"entries": [{"node": e}, {"node": c}, {"node": a}]})
+        mocked.get(url, payload={"changesets": [{"node": node, "parents": parents} for node, parents in changesets]})
+        async with aiohttp.ClientSession() as session:
+            result = await shipit_api.admin.product_details.fetch_file_revisions(
+                session, "releases/mozilla-beta", "browser/locales/l10n-changesets.json", [a, b[:12], c, m, d, e, "f" * 12]
+            )
+
+    # the merge and its descendants can't be mapped until the file is modified again
+    assert result == {a: a, b[:12]: a, c: c, e: e}
+
+
+@pytest.mark.asyncio
+async def test_fetch_release_schedule(tmp_path, caplog):
+    url = "https://whattrainisitnow.com/api/release/schedule/?version=135"
+    schedule = {"version": "135.0", "merge_day": "2025-01-06 00:00:00+00:00"}
+    fetch_release_schedule = shipit_api.admin.product_details.fetch_release_schedule
+
+    with CacheStore(tmp_path / "release_schedule.sqlite", max_size=1024 * 1024, ttl=3600) as cache:
+        async with aiohttp.ClientSession() as session:
+            with aioresponses() as m:
+                m.get(url, payload=schedule)
+                assert await fetch_release_schedule(session, 135, cache) == (schedule, 0.0)
+                # fresh schedules are not fetched again
+                cached_schedule, age = await fetch_release_schedule(session, 135, cache)
+                assert cached_schedule == schedule and 0 <= age < 60
+
+            # stale schedules are fetched again, the last one fetched is used if that fails
+            cache.ttl = 0
+            with aioresponses() as m, caplog.at_level(logging.WARNING):
+                m.get(url, exception=aiohttp.ClientConnectionError("whattrainisitnow.com is down"))
+                cached_schedule, age = await fetch_release_schedule(session, 135, cache)
+            assert cached_schedule == schedule and age >= 0
+            assert f"Failed to fetch {url}" in caplog.text
+
+            updated_schedule = dict(schedule, merge_day="2025-01-07 00:00:00+00:00")
+            with aioresponses() as m:
+                m.get(url, payload=updated_schedule)
+                assert await fetch_release_schedule(session, 135, cache) == (updated_schedule, 0.0)
+
+
+def test_get_releases_from_db(app):
+    session = app.app.db.session
+    shipped = [make_release("firefox", "130.0"), make_release("firefox", "128.5.0esr", branch="releases/mozilla-esr128")]
+    session.add_all(shipped + [make_release("firefox", "131.0", status="scheduled"), make_release("firefox", "99.0"), make_release("firefox", "1.0")])
+    session.commit()
+
+    releases = shipit_api.admin.product_details.get_releases_from_db(session, 100)
+    assert sorted(release.name for release in releases) == sorted(release.name for release in shipped)
+    assert all(isinstance(release, shipit_api.admin.product_details.ReleaseRecord) for release in releases)
+    # the l10n changesets stored are looked up with the records
+    session.add(ReleaseL10nChangesets(release_id=shipped[0].id, changesets=L10N_CHANGESETS))
+    session.commit()
+    assert {release.name: changesets for release, changesets in shipit_api.admin.product_details.get_releases_l10n_from_db(session, releases).items()} == {
+        "Firefox-130.0-build1": L10N_CHANGESETS
+    }
+
+
+def test_store_releases_l10n_changesets(app):
+    session = app.app.db.session
+    release = make_release("firefox", "134.0b8", branch="releases/mozilla-beta")
+    failed = make_release("firefox", "134.0b9", branch="releases/mozilla-beta")
+    session.add_all([release, failed])
+    session.commit()
+    store_releases_l10n_changesets = shipit_api.admin.product_details.store_releases_l10n_changesets
+
+    # failed fetches are not stored
+    assert store_releases_l10n_changesets(session, [(release, L10N_CHANGESETS), (failed, {}), (failed, None)]) == 1
+    assert shipit_api.admin.product_details.get_releases_l10n_from_db(session, [release, failed]) == {release: L10N_CHANGESETS}
+    # failures are not fatal
+    assert store_releases_l10n_changesets(session, [(release, L10N_CHANGESETS)]) == 0
+    assert shipit_api.admin.product_details.get_releases_l10n_from_db(session, [release, failed]) == {release: L10N_CHANGESETS}
+
+
+@pytest.mark.asyncio
+async def test_backfill_release_l10n_changesets(app, tmp_path):
+    session = app.app.db.session
+    stored = make_release("firefox", "134.0b8", branch="releases/mozilla-beta")
+    missing = make_release("firefox", "134.0b9", branch="releases/mozilla-beta")
+    missing.revision = "9fb87e89c26069198ce2a59a0a790a264d225169"
+    failing = make_release("thunderbird", "134.0b1", branch="releases/comm-beta")
+    failing.revision = "615791f9752c70ef1757abf68544c8275f219ce3"
+    old = make_release("firefox", "100.0", branch="releases/mozilla-release")
+    session.add_all([stored, missing, failing, old])
+    session.commit()
+    session.add(shipit_api.common.models.ReleaseL10nChangesets(release_id=stored.id, changesets={"de": {"revision": "abc"}}))
+    session.commit()
+
+    with (
+        mock.patch("shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR", tmp_path),
+        aioresponses() as m,
+    ):
+        m.get(
+            "https://hg.mozilla.org/releases/mozilla-beta/raw-file/9fb87e89c26069198ce2a59a0a790a264d225169/browser/locales/l10n-changesets.json",
+            payload=L10N_CHANGESETS,
+        )
+        m.get(re.compile(r"^https://hg\.mozilla\.org/releases/comm-beta/"), status=404, repeat=True)
+        assert await shipit_api.admin.product_details.backfill_release_l10n_changesets(session, 130) == 1
+
+    assert shipit_api.admin.product_details.get_releases_l10n_from_db(session, [stored, missing, failing, old]) == {
+        stored: {"de": {"revision": "abc"}},
+        missing: L10N_CHANGESETS,
+    }
+
+
+def git(*args, cwd):
+    return subprocess.check_output(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", "-c", "commit.gpgsign=false", *args], cwd=cwd)
+
 
+def make_git_repo(path, files):
+    path.mkdir()
+    git("init", "--quiet", cwd=path)
+    for name, content in files.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(content)
+    git("add", ".", cwd=path)
+    git("commit", "--quiet", "-m", "Initial commit", cwd=path)
+    return path / ".git", git("rev-parse", "HEAD", cwd=path).decode().strip()
 
-def mock_git_push(branch, secrets):
+
+def test_load_old_product_details(tmp_path):
+    git_dir, commit = make_git_repo(
+        tmp_path / "repo",
+        {
+            "README.md": "product details",
+            "public/1.0/firefox.json": '{"releases": {"firefox-1.0": {}}}',
+            "public/1.0/l10n/Firefox-1.0-build1.json": '{"locales": {"de": {}, "af": {}}}',
+            # passed through files are never parsed
+            "public/1.0/regions/de.json": "not json",
+            "public/1.0/index.html": "<html></html>",
+        },
+    )
+    oid = shipit_api.admin.product_details.git_blob_oid
+    expected = {
+        "1.0/firefox.json": {"releases": {"firefox-1.0": {}}},
+        "1.0/l10n/Firefox-1.0-build1.json": RawFile(oid(b'{"locales": {"de": {}, "af": {}}}'), ("de", "af")),
+        "1.0/regions/de.json": RawFile(oid(b"not json")),
+    }
+    assert shipit_api.admin.product_details.get_old_product_details(git_dir, commit, "public/") == expected
+
+    load_old_product_details = shipit_api.admin.product_details.load_old_product_details
+    with mock.patch("shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR", tmp_path / "cache"):
+        assert load_old_product_details(git_dir, commit, "public/") == expected
+        with mock.patch("shipit_api.admin.product_details.get_old_product_details") as get_old_product_details:
+            # the repository is not read again for the same commit
+            assert load_old_product_details(git_dir, commit, "public/") == expected
+            get_old_product_details.assert_not_called()
+        assert shipit_api.admin.product_details.load_old_product_details_snapshot(commit, "other/") is None
+
+        with mock.patch("shipit_api.admin.product_details.OLD_PRODUCT_DETAILS_SNAPSHOT_VERSION", 0):
+            assert shipit_api.admin.product_details.load_old_product_details_snapshot(commit, "public/") is None
+
+
+def test_get_old_l10n_locales():
+    old_product_details = {
+        "1.0/l10n/Firefox-1.0-build1.json": RawFile("9fb87e89c26069198ce2a59a0a790a264d225169", ("de", "af")),
+        "1.0/l10n/Firefox-2.0-build1.json": {"locales": {"fr": {"changeset": "default"}}},
+    }
+    get_old_l10n_locales = functools.partial(shipit_api.admin.product_details.get_old_l10n_locales, old_product_details)
+    assert get_old_l10n_locales("1.0/l10n/Firefox-1.0-build1.json") == ("de", "af")
+    assert get_old_l10n_locales("1.0/l10n/Firefox-2.0-build1.json") == ["fr"]
+    assert get_old_l10n_locales("1.0/l10n/Firefox-3.0-build1.json") is None
+
+
+def test_commit_product_details(tmp_path):
+    git_dir, parent = make_git_repo(
+        tmp_path / "repo",
+        {
+            "README.md": "product details",
+            "public/1.0/firefox.json": "{}",
+            "public/1.0/index.html": "<html></html>",
+            "public/1.0/l10n/Firefox-1.0-build1.json": '{"locales": {}}',
+            "public/1.0/old/gone.json": "{}",
+        },
+    )
+    git("config", "user.name", "Test", cwd=git_dir)
+    git("config", "user.email", "test@example.com", cwd=git_dir)
+
+    serialize = functools.partial(shipit_api.admin.product_details.serialize_product_details_file, json_writer=StdlibJSONWriter())
+    files = {
+        "1.0/firefox.json": serialize("1.0/firefox.json", {}),
+        "1.0/index.html": serialize("1.0/index.html", "<html>new</html>"),
+        "1.0/l10n/Firefox-1.0-build1.json": RawFile(shipit_api.admin.product_details.git_blob_oid(b'{"locales": {}}'), ()),
+        "1.0/regions/de.json": serialize("1.0/regions/de.json", {"de": "Deutschland"}),
+    }
+    commit_product_details = shipit_api.admin.product_details.commit_product_details
+    commit, counts = commit_product_details(git_dir, parent, "public/", files, "Updating product details")
+    assert counts == (2, 2, 1)
+    assert git("rev-parse", f"{commit}^", cwd=git_dir).decode().strip() == parent
+    assert git("show", f"{commit}:public/1.0/index.html", cwd=git_dir) == b"<html>new</html>"
+    assert json.loads(git("show", f"{commit}:public/1.0/regions/de.json", cwd=git_dir)) == {"de": "Deutschland"}
+    tree = git("ls-tree", "-r", "--name-only", commit, cwd=git_dir).decode().split()
+    assert sorted(tree) == sorted(["README.md"] + [f"public/{file_}" for file_ in files])
+
+    assert commit_product_details(git_dir, commit, "public/", files, "Updating product details") == (None, (0, 4, 0))
+
+
+def mock_setup_mirror(branch, url, secrets):
+    git_dir = shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR
+    subprocess.check_call(["git", "clone", "--bare", url, str(git_dir)])
+    subprocess.check_call(["git", "update-ref", f"refs/heads/{branch}", "26140d3435c386f36a94bd23ded5d08f8a41f080"], cwd=git_dir)
+    subprocess.check_call(["git", "config", "user.email", "release-services+robot@mozilla.com"], cwd=git_dir)
+    subprocess.check_call(["git", "config", "user.name", "Release Services Robot"], cwd=git_dir)
+    return "26140d3435c386f36a94bd23ded5d08f8a41f080"
+
+
+def mock_git_push(branch, commit, secrets):
     return
 
 
@@ -144,7 +440,7 @@ L10N_CHANGESETS = {
 
 
 @pytest.mark.asyncio
-@mock.patch("shipit_api.admin.product_details.setup_working_copy", mock_setup_working_copy)
+@mock.patch("shipit_api.admin.product_details.setup_mirror", mock_setup_mirror)
 @mock.patch("shipit_api.admin.product_details.git_push", mock_git_push)
 async def test_rebuild(app, tmp_path):
     fxnightly = Version(product_name="firefox", current_version="135.0a1", product_channel="nightly")
@@ -196,8 +492,7 @@ async def test_rebuild(app, tmp_path):
     app.app.db.session.add(nightly_build_2)
     app.app.db.session.commit()
     with (
-        mock.patch("shipit_api.common.config.PRODUCT_DETAILS_DIR", tmp_path / "product-details"),
-        mock.patch("shipit_api.common.config.PRODUCT_DETAILS_NEW_DIR", tmp_path / "product-details-new"),
+        mock.patch("shipit_api.common.config.PRODUCT_DETAILS_GIT_DIR", tmp_path / "product-details.git"),
         mock.patch("shipit_api.common.config.PRODUCT_DETAILS_CACHE_DIR", tmp_path / "product-details-cache"),
         aioresponses() as m,
     ):
@@ -269,27 +564,33 @@ async def test_rebuild(app, tmp_path):
                 "release": "2025-01-07 14:00:00+00:00",
             },
         )
-        await rebuild(app.app.db.session, "testing", "https://github.com/mozilla-releng/product-details", "public", 130)
+        stats = await rebuild(app.app.db.session, "testing", "https://github.com/mozilla-releng/product-details", "public", 130)
+
+    assert {"mirror", "old_product_details", "database", "l10n_fetch", "generate", "index", "serialize", "commit", "push", "store"} <= set(stats.stages)
+    assert stats.counts["files"] == stats.counts["files_written"] + stats.counts["files_skipped"]
+    assert stats.gauges["release_schedule_age"] == 0
+
+    git_dir = tmp_path / "product-details.git"
 
-    parent = tmp_path / "product-details" / "public" / "1.0"
-    with (parent / "firefox_versions.json").open() as f:
-        versions = json.load(f)
+    def read_json(file_):
+        return json.loads(git("show", f"testing:public/1.0/{file_}", cwd=git_dir))
+
+    files = git("ls-tree", "-r", "--name-only", "testing", "public/1.0/l10n/", cwd=git_dir).decode().split()
+    versions = read_json("firefox_versions.json")
     assert versions["FIREFOX_NIGHTLY"] == "135.0a1"
     assert versions["FIREFOX_DEVEDITION"] == "134.0b9"
     assert versions["LATEST_FIREFOX_DEVEL_VERSION"] == "134.0b8"
     assert versions["LATEST_FIREFOX_VERSION"] == "133.0"
 
-    with (parent / "firefox_primary_builds.json").open() as f:
-        primary_builds = json.load(f)
+    primary_builds = read_json("firefox_primary_builds.json")
     assert set(primary_builds["ach"].keys()) == {"133.0", "134.0b8", "134.0b9", "135.0a1"}
 
-    assert not list(parent.glob("l10n/Devedition-*"))
-    assert next(parent.glob("l10n/Firefox-134.0b8-*")).name == "Firefox-134.0b8-build1.json"
+    assert not [file_ for file_ in files if file_.startswith("public/1.0/l10n/Devedition-")]
+    assert [file_ for file_ in files if file_.startswith("public/1.0/l10n/Firefox-134.0b8-")] == ["public/1.0/l10n/Firefox-134.0b8-build1.json"]
 
     # we do some basic checking of this file; it is too large to do extensive checks of
     # note that most of its contents come from the `testing` branch of the product-details repo
-    with (parent / "firefox_history_locales.json").open() as f:
-        locales = json.load(f)
+    locales = read_json("firefox_history_locales.json")
     assert locales["ach"]["first_release"] == {
         "nightly": {"version": "134.0a1", "buildid": "20241101093000"},
         "beta": {"version": "19.0b1", "build_number": 1},
@@ -301,6 +602,15 @@ async def test_rebuild(app, tmp_path):
     # "zz" only appears in the newer nightly build, and in no release channel
     assert locales["zz"]["first_release"] == {"nightly": {"version": "135.0a1", "buildid": "20241225093000"}}
 
+    # every writer reproduces the whole published tree byte for byte
+    published = {file_: oid for file_, oid in shipit_api.admin.product_details.list_git_files(git_dir, "testing", "public").items() if file_.endswith(".json")}
+    blobs = shipit_api.admin.product_details.read_git_blobs(git_dir, list(published.values()))
+    for name, writer in JSON_WRITERS.items():
+        for file_, blob in zip(published, blobs):
+            # the files which are not sorted are OrderedDicts, which keep the order of the keys
+            content = json.loads(blob, object_pairs_hook=collections.OrderedDict)
+            assert writer().dumps(content, sort_keys=False) == blob, f"{name} writes {file_} differently"
+
 
 def build_old_product_details(l10n_files):
     return {f"1.0/l10n/{name}.json": {"locales": {locale: {"changeset": "default"} for locale in locales}} for name, locales in l10n_files.items()}
@@ -372,7 +682,8 @@ def test_get_firefox_locales():
         ]
     )
 
-    result = shipit_api.admin.product_details.get_firefox_locales(firefox_releases, releases_l10n, old_product_details, nightly_releases)
+    nightly_first_releases = shipit_api.admin.product_details.get_nightly_first_releases(nightly_releases)
+    result = shipit_api.admin.product_details.get_firefox_locales(firefox_releases, releases_l10n, old_product_details, nightly_first_releases)
 
     # dropped after esr128
     assert "as" not in result
@@ -404,6 +715,44 @@ def test_get_firefox_locales():
     }
 
 
+def test_get_firefox_release_locales_scales_linearly(monkeypatch):
+    """firefox_history_locales.json generation should read every release of
+    releases_l10n and parse every version a bounded number of times, instead of
+    searching releases_l10n for each release."""
+
+    class CountingDict(dict):
+        reads = 0
+
+        def items(self):
+            for item in super().items():
+                self.reads += 1
+                yield item
+
+        def __iter__(self):
+            for key in super().__iter__():
+                self.reads += 1
+                yield key
+
+    parse_version = shipit_api.admin.product_details.ReleaseIndex.parse_version
+    parsed = []
+
+    def counting_parse_version(self, product, version):
+        parsed.append(version)
+        return parse_version(self, product, version)
+
+    monkeypatch.setattr(shipit_api.admin.product_details.ReleaseIndex, "parse_version", counting_parse_version)
+
+    for count in (500, 1000):
+        versions = [f"{count}.0.{patch}" for patch in range(1, count + 1)]
+        releases_l10n = CountingDict(build_releases_l10n([(version, 1, ["de", "fr"]) for version in versions]))
+        parsed.clear()
+        shipit_api.admin.product_details.get_firefox_release_locales(
+            build_firefox_releases([(version, "stability", 1) for version in versions]), releases_l10n, {}
+        )
+        assert releases_l10n.reads == count
+        assert len(parsed) <= count + 10
+
+
 def test_get_firefox_nightly_locales_stops_early():
     # newest-first; "af" (the only locale of interest) is continuous in the two
     # newest builds, then disappears in 58.0a1. At that point the result is fully
@@ -427,3 +776,521 @@ def test_get_firefox_nightly_locales_stops_early():
 
     assert result["af"]["first_release"] == {"nightly": {"version": "59.0a1", "buildid": "20180200000000"}}
     assert consumed == ["20180300000000", "20180200000000", "20180100000000"]
+
+
+def test_first_continuous_releases():
+    def reference(releases):
+        # a straightforward implementation, checking every locale of every release
+        releases = list(releases)
+        if not releases:
+            return {}
+        result = {}
+        for locale in releases[0][1]:
+            for release, locales in releases:
+                if locale not in locales:
+                    break
+                result[locale] = release
+        return result
+
+    rng = random.Random(0)
+    locales = [f"l{i}" for i in range(70)]
+    for _ in range(200):
+        releases = [
+            ({"version": f"{major}.0", "build_number": 1}, rng.sample(locales, rng.randint(0, 5)) + [l for l in locales if rng.random() < 0.97])
+            for major in range(rng.randint(0, 40), 0, -1)
+        ]
+        assert list(shipit_api.admin.product_details.first_continuous_releases(releases).items()) == list(reference(releases).items())
+
+
+def test_add_nightly_first_releases():
+    rng = random.Random(0)
+    locales = ["af", "de", "en-US", "fr", "ja", "zh-TW"]
+    nightly_releases = []
+    first_releases = {}
+    for day in range(1, 60):
+        nightly_release = NightlyRelease(
+            product="firefox", channel="nightly", version="140.0a1", buildid=f"2025{day:04d}000000", locales=[l for l in locales if rng.random() < 0.8]
+        )
+        nightly_releases.insert(0, nightly_release)
+        first_releases = shipit_api.admin.product_details.add_nightly_first_releases(first_releases, nightly_release)
+        assert first_releases == shipit_api.admin.product_details.get_nightly_first_releases(nightly_releases)
+
+
+def test_nightly_first_releases_from_db(app):
+    session = app.app.db.session
+    get_nightly_first_releases_from_db = functools.partial(shipit_api.admin.product_details.get_nightly_first_releases_from_db, session, "firefox", "nightly")
+
+    def add(buildid, locales):
+        session.add(NightlyRelease(product="firefox", channel="nightly", version="140.0a1", buildid=buildid, locales=locales))
+        session.commit()
+
+    def expected():
+        nightly_releases = shipit_api.admin.product_details.get_nightly_releases_from_db(session, "firefox", "nightly")
+        return shipit_api.admin.product_details.get_nightly_first_releases(nightly_releases)
+
+    def stored():
+        return session.query(NightlyFirstReleases).one()
+
+    add("20250102000000", ["en-US", "af", "de"])
+    # reading them doesn't store them
+    state = get_nightly_first_releases_from_db()
+    assert state.first_releases == expected()
+    assert (state.buildid, state.builds) == ("20250102000000", 1)
+    assert session.query(NightlyFirstReleases).count() == 0
+    assert shipit_api.admin.product_details.store_nightly_first_releases(session, state)
+    # storing the same ones again doesn't write anything
+    assert not shipit_api.admin.product_details.store_nightly_first_releases(session, get_nightly_first_releases_from_db())
+
+    # builds added since they were stored are applied when they're read
+    add("20250103000000", ["en-US", "de", "fr"])
+    state = get_nightly_first_releases_from_db()
+    assert (state.buildid, state.builds) == ("20250103000000", 2)
+    assert state.first_releases == {
+        "de": {"version": "140.0a1", "buildid": "20250102000000"},
+        "fr": {"version": "140.0a1", "buildid": "20250103000000"},
+    }
+    assert state.first_releases == expected()
+    assert stored().buildid == "20250102000000"
+    assert shipit_api.admin.product_details.store_nightly_first_releases(session, state)
+    assert (stored().buildid, stored().builds) == ("20250103000000", 2)
+
+    # an older build makes them computed from all the builds
+    add("20250101000000", ["en-US", "de"])
+    state = get_nightly_first_releases_from_db()
+    assert state.first_releases["de"] == {"version": "140.0a1", "buildid": "20250101000000"}
+    assert state.first_releases == expected()
+    assert (state.buildid, state.builds) == ("20250103000000", 3)
+    assert shipit_api.admin.product_details.store_nightly_first_releases(session, state)
+
+    add("20250104000000", ["en-US", "fr", "ja"])
+    add("20250105000000", ["en-US", "de", "fr", "ja"])
+    newer = get_nightly_first_releases_from_db()
+    assert newer.first_releases == expected()
+    assert newer.first_releases["de"] == {"version": "140.0a1", "buildid": "20250105000000"}
+    assert shipit_api.admin.product_details.store_nightly_first_releases(session, newer)
+    # a rebuild which read them before doesn't store older ones
+    assert not shipit_api.admin.product_details.store_nightly_first_releases(session, state)
+    assert stored().buildid == "20250105000000"
+
+    assert shipit_api.admin.product_details.recompute_nightly_first_releases(session, "firefox", "nightly") == 3
+    assert (stored().buildid, stored().builds, stored().first_releases) == ("20250105000000", 5, expected())
+
+
+@pytest.mark.parametrize(
+    "trigger, expected",
+    (
+        (None, None),
+        ({}, None),
+        ({"release": "Firefox-133.0-build1"}, None),
+        ({"product": "unknown-product", "version": "1.0"}, None),
+        ({"product": "firefox", "version": "133.0"}, {"firefox", "firefox:major"}),
+        ({"product": "firefox", "version": "133.0b3"}, {"firefox", "firefox:dev"}),
+        ({"product": "thunderbird", "version": "132.0.1"}, {"thunderbird", "thunderbird:stability"}),
+        ({"product": "firefox", "product_channel": "nightly", "version": "135.0a1"}, {"nightly:firefox"}),
+        ({"product": "firefox", "product_channel": "beta", "version": "134.0b1"}, set()),
+    ),
+)
+def test_get_rebuild_inputs(trigger, expected):
+    assert shipit_api.admin.product_details.get_rebuild_inputs(trigger) == expected
+
+
+def test_merge_rebuild_inputs():
+    merge_rebuild_inputs = shipit_api.admin.product_details.merge_rebuild_inputs
+    assert merge_rebuild_inputs(None) is None
+    assert merge_rebuild_inputs([{"product": "firefox", "version": "133.0"}, {"product": "thunderbird", "version": "132.0.1"}]) == {
+        "firefox",
+        "firefox:major",
+        "thunderbird",
+        "thunderbird:stability",
+    }
+    assert merge_rebuild_inputs([{"product": "firefox", "version": "133.0"}, {}]) is None
+
+
+def test_get_affected_files():
+    get_affected_files = shipit_api.admin.product_details.get_affected_files
+    assert get_affected_files(None) is None
+    # the files depending on the nightly builds and the release schedules are
+    # generated again whatever triggered the rebuild
+    always_generated = {"firefox_history_locales.json", "firefox_primary_builds.json", "firefox_versions.json", "thunderbird_primary_builds.json"}
+    assert get_affected_files(set()) == always_generated
+    assert (
+        get_affected_files({"thunderbird", "thunderbird:stability"})
+        == {
+            "all.json",
+            "thunderbird.json",
+            "thunderbird_history_stability_releases.json",
+            "thunderbird_versions.json",
+        }
+        | always_generated
+    )
+    assert (
+        get_affected_files({"nightly:firefox"})
+        == {
+            "firefox_history_locales.json",
+            "firefox_primary_builds.json",
+            "firefox_versions.json",
+            "mobile_details.json",
+            "mobile_versions.json",
+        }
+        | always_generated
+    )
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    (
+        (b'{"payload": {"product": "firefox", "version": "133.0"}, "_meta": {}}', {"product": "firefox", "version": "133.0"}),
+        (b'{"payload": {}, "_meta": {}}', {}),
+        (b'{"_meta": {}}', None),
+        (b"not json", None),
+    ),
+)
+def test_get_rebuild_trigger(body, expected):
+    assert shipit_api.admin.worker.get_rebuild_trigger(body) == expected
+
+
+def test_get_message_sent_at():
+    sent_at = shipit_api.admin.worker.get_message_sent_at(b'{"payload": {}, "_meta": {"sent": "2024-12-10T12:00:00.5"}}')
+    assert sent_at == datetime.datetime(2024, 12, 10, 12, 0, 0, 500000, tzinfo=datetime.timezone.utc)
+    assert shipit_api.admin.worker.get_message_sent_at(b"not json").tzinfo is datetime.timezone.utc
+
+
+@pytest.mark.asyncio
+async def test_rebuild_queue():
+    rebuilds = []
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def rebuild(triggers):
+        rebuilds.append(triggers)
+        started.set()
+        await release.wait()
+
+    queue = shipit_api.admin.worker.RebuildQueue(rebuild)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    firefox = {"product": "firefox", "version": "133.0"}
+    thunderbird = {"product": "thunderbird", "version": "132.0.1"}
+    queue.put(firefox, now)
+    await started.wait()
+    # received while the first rebuild is running
+    queue.put(thunderbird, now)
+    queue.put(firefox, now)
+    release.set()
+    while queue.rebuilds < 2:
+        await asyncio.sleep(0)
+    assert rebuilds == [[firefox], [thunderbird, firefox]]
+    assert len(queue.lags) == 3
+
+    release.clear()
+    queue.put(firefox, now)
+    queue.put(None, now)
+    queue.put(thunderbird, now)
+    release.set()
+    while queue.rebuilds < 3:
+        await asyncio.sleep(0)
+    # a full rebuild covers everything
+    assert rebuilds[2:] == [None]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_queue_failure():
+    rebuilds = []
+
+    async def rebuild(triggers):
+        rebuilds.append(triggers)
+        if len(rebuilds) == 1:
+            raise Exception("push failed")
+
+    queue = shipit_api.admin.worker.RebuildQueue(rebuild, debounce=0.01, retry_delay=0.1)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    queue.put({"product": "firefox", "version": "133.0"}, now)
+    await asyncio.sleep(0.05)
+    assert queue.rebuilds == 0
+    assert queue.failures == 1
+    # the triggers of the failed rebuild are kept for the next one
+    queue.put({"product": "thunderbird", "version": "132.0.1"}, now)
+    queue.put({"product": "firefox", "version": "133.0.1"}, now)
+    await asyncio.sleep(0.2)
+    assert queue.rebuilds == 1
+    assert queue.failures == 0
+    assert rebuilds[1] == [
+        {"product": "firefox", "version": "133.0"},
+        {"product": "thunderbird", "version": "132.0.1"},
+        {"product": "firefox", "version": "133.0.1"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_queue_cancelled():
+    rebuilds = []
+
+    async def rebuild(triggers):
+        rebuilds.append(triggers)
+        if len(rebuilds) == 1:
+            raise asyncio.CancelledError()
+
+    queue = shipit_api.admin.worker.RebuildQueue(rebuild, retry_delay=0.01)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    queue.put({"product": "firefox", "version": "133.0"}, now)
+    task = queue._task
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert queue._task is None
+    # the next trigger starts the queue again, with the triggers of the cancelled rebuild
+    queue.put({"product": "thunderbird", "version": "132.0.1"}, now)
+    await asyncio.wait_for(wait_for_rebuilds(queue, 1), 5)
+    assert rebuilds[1] == [{"product": "firefox", "version": "133.0"}, {"product": "thunderbird", "version": "132.0.1"}]
+    queue._task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_rebuild_queue_retry():
+    rebuilds = []
+
+    async def rebuild(triggers):
+        rebuilds.append(time.monotonic())
+        if len(rebuilds) < 4:
+            raise Exception("hg is down")
+
+    queue = shipit_api.admin.worker.RebuildQueue(rebuild, retry_delay=0.02, max_retry_delay=0.04)
+    queue.put({"product": "firefox", "version": "133.0"}, datetime.datetime.now(datetime.timezone.utc))
+    # failed rebuilds are retried without waiting for another message
+    await asyncio.wait_for(wait_for_rebuilds(queue, 1), 5)
+    assert len(rebuilds) == 4
+    delays = [b - a for a, b in zip(rebuilds, rebuilds[1:])]
+    # backing off exponentially, up to max_retry_delay (with some slack for the clock)
+    assert delays[0] > 0.015 and delays[1] > 0.035 and delays[2] > 0.035
+
+
+async def wait_for_rebuilds(queue, rebuilds):
+    while queue.rebuilds < rebuilds:
+        await asyncio.sleep(0.01)
+
+
+def make_release(product, version, branch="", build_number=1, status="shipped"):
+    return Release(
+        product=product,
+        version=version,
+        branch=branch,
+        revision="default",
+        build_number=build_number,
+        release_eta=None,
+        partial_updates=None,
+        status=status,
+    )
+
+
+@pytest.mark.parametrize(
+    "version, expected",
+    (
+        ("133.0", {ProductCategory.MAJOR}),
+        ("133.0b3", {ProductCategory.DEVELOPMENT}),
+        ("133.0.1", {ProductCategory.STABILITY}),
+        ("128.3.0esr", {ProductCategory.STABILITY}),
+        ("140.0esr", set()),
+        ("125.0.1", {ProductCategory.MAJOR, ProductCategory.STABILITY}),
+    ),
+)
+def test_get_history_categories(version, expected):
+    version = shipit_api.admin.product_details.parse_version(Product.FIREFOX, version)
+    assert shipit_api.admin.product_details.get_history_categories(version) == expected
+
+
+def test_release_index():
+    releases = [
+        make_release("firefox", "133.0"),
+        make_release("firefox", "134.0b1"),
+        make_release("thunderbird", "133.0.1"),
+        make_release("firefox-android", "133.0b1"),
+    ]
+    release_index = shipit_api.admin.product_details.ReleaseIndex(releases)
+
+    assert [entry.release for entry in release_index.get(Product.FIREFOX)] == releases[:2]
+    assert release_index.get(Product.DEVEDITION) == []
+    assert [entry.release for entry in release_index.get_history(Product.FIREFOX, ProductCategory.DEVELOPMENT)] == [releases[1]]
+    assert [entry.release for entry in release_index.get_history(Product.THUNDERBIRD, ProductCategory.STABILITY)] == [releases[2]]
+    assert release_index.get(Product.THUNDERBIRD)[0].categories == [ProductCategory.STABILITY, ProductCategory.STABILITY]
+    # mobile releases are not part of any release history
+    assert release_index.get(Product.FIREFOX_ANDROID)[0].history_categories == set()
+    # versions are parsed only once
+    assert release_index.parse_version(Product.FIREFOX, "133.0") is release_index.get(Product.FIREFOX)[0].version
+
+
+def test_release_index_latest_version():
+    releases = [
+        make_release("firefox", "133.0", branch="releases/mozilla-release"),
+        make_release("firefox", "134.0b2", branch="releases/mozilla-beta"),
+        make_release("firefox", "128.5.0esr", branch="releases/mozilla-esr128"),
+        make_release("firefox", "133.0.1", branch="releases/mozilla-release"),
+        make_release("firefox-android", "134.0b1", branch="releases/mozilla-beta"),
+        make_release("firefox-android", "133.0", branch="releases/mozilla-release"),
+    ]
+    release_index = shipit_api.admin.product_details.ReleaseIndex(releases)
+    get_latest_version = functools.partial(shipit_api.admin.product_details.get_latest_version, release_index)
+
+    assert get_latest_version(Product.FIREFOX) == "134.0b2"
+    assert get_latest_version(Product.FIREFOX, "releases/mozilla-release") == "133.0.1"
+    assert get_latest_version(Product.FIREFOX, "releases/mozilla-esr128") == "128.5.0esr"
+    assert get_latest_version(Product.FIREFOX, "releases/mozilla-esr115") == ""
+    assert get_latest_version(Product.FIREFOX_ANDROID, predicate="is_beta") == "134.0b1"
+    assert get_latest_version(Product.FIREFOX_ANDROID, predicate="is_release") == "133.0"
+    assert get_latest_version(Product.THUNDERBIRD) == ""
+
+
+def test_get_release_history():
+    releases = [
+        make_release("firefox", "133.0"),
+        make_release("firefox", "133.0.1"),
+        make_release("firefox", "128.0"),
+        make_release("firefox", "134.0b1"),
+        make_release("firefox", "134.0", status="aborted"),
+        make_release("thunderbird", "133.0"),
+    ]
+    for day, release in enumerate(releases, start=1):
+        release.completed = datetime.datetime(2025, 1, day)
+    old_product_details = {"1.0/firefox_history_major_releases.json": {"120.0": "2023-11-21", "130.0": "2024-09-03"}}
+    release_index = shipit_api.admin.product_details.ReleaseIndex(releases)
+
+    history = shipit_api.admin.product_details.get_release_history(130, Product.FIREFOX, ProductCategory.MAJOR, release_index, old_product_details)
+
+    assert list(history.items()) == [("120.0", "2023-11-21"), ("133.0", "2025-01-01")]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_context():
+    releases = [make_release("firefox", "133.0"), make_release("firefox", "134.0b1"), make_release("firefox-android", "133.0")]
+    old_product_details = {"1.0/languages.json": {"fr": {"English": "French", "native": "Français"}}}
+    context = shipit_api.admin.product_details.RebuildContext(
+        session=mock.Mock(),
+        breakpoint_version=130,
+        release_index=shipit_api.admin.product_details.ReleaseIndex(releases),
+        all_releases=releases,
+        old_product_details=old_product_details,
+        releases_l10n={},
+        combined_l10n={},
+        firefox_nightly_version="135.0a1",
+        thunderbird_nightly_version="135.0a1",
+        firefox_nightly_first_releases={},
+        affected_files={"all.json", "firefox.json", "mobile_details.json", "mobile_versions.json"},
+    )
+    get_product_releases = mock.Mock(wraps=shipit_api.admin.product_details.get_product_releases)
+    get_mobile_versions = mock.Mock(wraps=shipit_api.admin.product_details.get_mobile_versions)
+
+    with (
+        mock.patch.object(shipit_api.admin.product_details, "get_product_releases", get_product_releases),
+        mock.patch.object(shipit_api.admin.product_details, "get_mobile_versions", get_mobile_versions),
+    ):
+        firefox = await context.file("firefox.json")
+        all_releases = await context.file("all.json")
+        mobile_details = await context.file("mobile_details.json")
+        mobile_versions = await context.file("mobile_versions.json")
+        languages = await context.file("languages.json")
+
+    assert list(firefox["releases"]) == ["firefox-133.0", "firefox-134.0b1"]
+    assert firefox["releases"].items() <= all_releases["releases"].items()
+    # the releases of a product are listed once, whichever files they end up in
+    assert get_product_releases.call_count == len({Product.DEVEDITION, Product.FIREFOX, Product.FENIX, Product.FENNEC, Product.THUNDERBIRD})
+    # mobile_details.json is built from mobile_versions.json, which is generated once
+    assert get_mobile_versions.call_count == 1
+    assert mobile_details["version"] == mobile_versions["version"]
+    assert await context.file("firefox.json") is firefox
+    # languages.json isn't affected, it is reused from the previous build
+    assert languages == old_product_details["1.0/languages.json"]
+    assert (context.generated, context.reused) == (4, 1)
+
+
+@pytest.mark.asyncio
+async def test_rebuild_context_generate_jobs(tmp_path, monkeypatch):
+    releases = [make_release("firefox", "133.0"), make_release("firefox", "134.0b1"), make_release("firefox-android", "133.0")]
+    releases_l10n = {
+        release: {locale: {"revision": "default", "platforms": ["linux64"]} for locale in locales}
+        for release, locales in zip(releases, (["de", "fr"], ["de"], ["fr"]))
+    }
+    firefox_versions = {
+        "FIREFOX_NIGHTLY": "135.0a1",
+        "FIREFOX_DEVEDITION": "134.0b1",
+        "LATEST_FIREFOX_RELEASED_DEVEL_VERSION": "134.0b1",
+        "LATEST_FIREFOX_VERSION": "133.0",
+        "FIREFOX_ESR": "128.5.0esr",
+        "FIREFOX_ESR_NEXT": "",
+        "FIREFOX_ESR115": "",
+    }
+
+    def make_context():
+        return shipit_api.admin.product_details.RebuildContext(
+            session=mock.Mock(),
+            breakpoint_version=130,
+            release_index=shipit_api.admin.product_details.ReleaseIndex(releases),
+            all_releases=releases,
+            old_product_details={"1.0/firefox_versions.json": firefox_versions, "1.0/languages.json": {"fr": {"English": "French", "native": "Français"}}},
+            releases_l10n=releases_l10n,
+            combined_l10n=releases_l10n,
+            firefox_nightly_version="135.0a1",
+            thunderbird_nightly_version="135.0a1",
+            firefox_nightly_first_releases={},
+            affected_files=set(shipit_api.admin.product_details.PRODUCT_DETAILS_GENERATORS) - {"firefox_versions.json"},
+        )
+
+    sequential = make_context()
+    parallel = make_context()
+    expected = await sequential.generate(1)
+    product_details = await parallel.generate(2)
+
+    # the files generated by the other processes come back in the same order
+    assert list(product_details) == list(expected)
+    assert json.dumps(product_details) == json.dumps(expected)
+    # the processes may generate some of the same dependencies
+    assert parallel.generated >= sequential.generated
+    assert parallel.reused == sequential.reused
+    assert "l10n/Firefox-133.0-build1.json" in product_details
+
+    # the processes load the old product details themselves when they can
+    monkeypatch.setattr(shipit_api.common.config, "PRODUCT_DETAILS_CACHE_DIR", tmp_path)
+    loaded = make_context()
+    shipit_api.admin.product_details.save_old_product_details_snapshot("0" * 40, "public/", loaded.old_product_details)
+    loaded.old_product_details_source = (tmp_path / "product-details.git", "0" * 40, "public/")
+    assert loaded.__getstate__()["old_product_details"] is None
+    assert json.dumps(await loaded.generate(2)) == json.dumps(expected)
+
+    # each process profiles the files it generates
+    monkeypatch.setattr(shipit_api.common.config, "PRODUCT_DETAILS_PROFILE", tmp_path / "profile")
+    assert json.dumps(await make_context().generate(2)) == json.dumps(expected)
+    profiles = [str(path) for path in tmp_path.glob("profile.*")]
+    assert profiles
+    assert any(function == "generate_file_in_process" for _, _, function in pstats.Stats(*profiles).stats)
+
+
+@pytest.mark.asyncio
+async def test_generate_product_details_pipeline(tmp_path, monkeypatch):
+    nightly_l10n_fetched = threading.Event()
+    releases_queried = threading.Event()
+    get_releases_from_db = shipit_api.admin.product_details.get_releases_from_db
+    load_old_product_details = shipit_api.admin.product_details.load_old_product_details
+
+    # each of these only returns if the other stages run meanwhile
+    def get_releases_from_db_wrapper(*args):
+        assert nightly_l10n_fetched.wait(10)
+        releases = get_releases_from_db(*args)
+        releases_queried.set()
+        return releases
+
+    def load_old_product_details_wrapper(*args):
+        assert releases_queried.wait(10)
+        return load_old_product_details(*args)
+
+    async def fetch_l10n_data_wrapper(session, release, *args, **kwargs):
+        result = await fetch_l10n_data(session, release, *args, **kwargs)
+        if release.build_number is None:
+            nightly_l10n_fetched.set()
+        return result
+
+    monkeypatch.setattr(shipit_api.admin.product_details, "get_releases_from_db", get_releases_from_db_wrapper)
+    monkeypatch.setattr(shipit_api.admin.product_details, "load_old_product_details", load_old_product_details_wrapper)
+    monkeypatch.setattr(shipit_api.admin.product_details, "fetch_l10n_data", fetch_l10n_data_wrapper)
+    results = await run_benchmark(tmp_path, releases=300, nightly_releases=100)
+
+    assert results["runs"]["cold"]["counts"]["files_generated"] > 0
+    # the l10n changesets fetched by the first rebuild are stored for the next ones
+    assert results["runs"]["cold"]["counts"]["l10n_stored"] > 0
+    assert results["runs"]["noop"]["counts"]["l10n_stored"] == 0
+    assert {"old_product_details", "database", "l10n_fetch", "generate"} <= set(results["runs"]["cold"]["stages"])
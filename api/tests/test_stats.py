@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import logging
+
+import pytest
+
+from shipit_api.admin.stats import RebuildStats, get_peak_rss
+
+
+def test_rebuild_stats(tmp_path, caplog):
+    stats = RebuildStats()
+    with stats.stage("generate"):
+        sum(range(100000))
+    with stats.stage("commit"):
+        pass
+    with pytest.raises(ValueError):
+        with stats.stage("generate"):
+            raise ValueError()
+    stats.count("files", 3)
+    stats.count("files", 2)
+    stats.gauge("cache_age", 10)
+    stats.gauge("cache_age", 20)
+
+    summary = stats.summary()
+    assert list(summary["stages"]) == ["generate", "commit"]
+    assert summary["stages"]["generate"]["wall"] > 0
+    assert summary["stages"]["generate"]["cpu"] >= 0
+    assert summary["counts"] == {"files": 5}
+    assert summary["gauges"] == {"cache_age": 20}
+    assert summary["wall"] >= summary["stages"]["generate"]["wall"]
+
+    with caplog.at_level(logging.INFO, logger="shipit_api.admin.stats"):
+        stats.log_summary("Rebuild")
+    (record,) = caplog.records
+    assert record.getMessage().startswith("Rebuild: ")
+    assert "files 5, cache_age 20" in record.getMessage()
+    assert record.rebuild_stats["counts"] == {"files": 5}
+
+    report = tmp_path / "reports" / "rebuild.json"
+    stats.write_report(report)
+    assert json.loads(report.read_text())["counts"] == {"files": 5}
+
+
+def test_get_peak_rss():
+    peak_rss = get_peak_rss()
+    assert peak_rss is None or peak_rss > 1024 * 1024